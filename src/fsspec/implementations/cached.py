@@ -0,0 +1,293 @@
+import asyncio
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+from collections import OrderedDict
+
+from fsspec.asyn import AsyncFileSystem
+from fsspec.utils import tokenize
+
+# ``info`` entries telling versions of a remote file apart, size last as it
+# can't on its own; the dataset cache of the xarray backend uses them too
+_VERSION_KEYS = ("ETag", "etag", "mtime", "LastModified", "last_modified", "size")
+
+
+class AsyncSimpleCacheFileSystem(AsyncFileSystem):
+    """Caches whole remote files on local disk on first access
+
+    A read-through layer over another async filesystem that keeps the raw
+    bytes returned by ``_cat_file``, so that reads survive process restarts.
+    Local file I/O runs in the loop's default executor, files are written
+    atomically and the least recently used files are evicted once the cache
+    grows beyond ``max_size`` bytes. Writes and deletes go to the target
+    filesystem and invalidate the local copy.
+
+    Cached files are keyed on the target's protocol, its storage options and
+    the path, so that filesystems with different buckets, endpoints or
+    credentials do not share entries. Files changed remotely, such as the
+    last chunk of an array rewritten by an append, are only read again once
+    ``invalidate`` drops them, which ``AsyncStore.refresh`` does for the
+    chunks of arrays that grew, or with ``check_files=True``, which compares
+    the ETag, modification time and size of the remote file to those it had
+    when cached on every read, at the cost of an ``info`` request.
+
+    Parameters
+    ----------
+    fs : AsyncFileSystem
+        The filesystem to cache, created with ``asynchronous=True``.
+    cache_storage : str
+        Local directory holding the cached files.
+    max_size : int, optional
+        Maximum total size of the cached files, in bytes. ``None`` for no limit.
+    use_mmap : bool
+        Serve cached reads from a memory map instead of reading the file.
+    exclude : tuple of str
+        Base names of files that are always read from the target. Defaults to
+        the zarr metadata keys, which change when a store is appended to.
+    check_files : bool
+        Check cached files against the remote file on every read.
+    """
+
+    protocol = "asyncsimplecache"
+
+    def __init__(
+        self,
+        fs,
+        cache_storage,
+        max_size=None,
+        use_mmap=False,
+        exclude=(".zmetadata", ".zgroup", ".zarray", ".zattrs"),
+        check_files=False,
+        **kwargs,
+    ):
+        assert isinstance(fs, AsyncFileSystem)
+        super().__init__(asynchronous=True, **kwargs)
+        self.fs = fs
+        self.storage = cache_storage
+        self.max_size = max_size
+        self.use_mmap = use_mmap
+        self.exclude = tuple(exclude)
+        self.check_files = check_files
+        self._fs_key = tokenize(fs.protocol, fs.storage_options)
+        self.hits = self.misses = self.evictions = 0
+        self._current_size = 0
+        self._files = None
+        os.makedirs(cache_storage, exist_ok=True)
+
+    def __repr__(self):
+        return (
+            f"AsyncSimpleCacheFileSystem(fs={self.fs!r}, storage={self.storage!r}, "
+            f"hits={self.hits}, misses={self.misses}, evictions={self.evictions})"
+        )
+
+    def _cache_path(self, path):
+        key = f"{self._fs_key}/{self.fs._strip_protocol(path)}"
+        name = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.storage, name)
+
+    async def _version(self, path):
+        # what tells this version of the remote file from others, ``None``
+        # when not checking files
+        if not self.check_files:
+            return None
+        info = await self.fs._info(path)
+        return json.dumps([info.get(k) for k in _VERSION_KEYS], default=str)
+
+    async def _index(self):
+        # files already on disk, oldest access first, found on first use
+        if self._files is None:
+            loop = asyncio.get_running_loop()
+            files = await loop.run_in_executor(None, _scan, self.storage)
+            if self._files is None:
+                self._files = OrderedDict(files)
+                self._current_size = sum(self._files.values())
+        return self._files
+
+    async def _cat_file(self, path, start=None, end=None, **kwargs):
+        if path.rstrip("/").rsplit("/", 1)[-1] in self.exclude:
+            return await self.fs._cat_file(path, start=start, end=end, **kwargs)
+        files = await self._index()
+        fn = self._cache_path(path)
+        loop = asyncio.get_running_loop()
+        version = await self._version(path)
+        if fn in files:
+            try:
+                data = await loop.run_in_executor(
+                    None, _read_checked, fn, start, end, self.use_mmap, version
+                )
+            except FileNotFoundError:
+                self._forget(fn)
+            else:
+                if data is not None:
+                    files.move_to_end(fn)
+                    self.hits += 1
+                    return data
+                # changed remotely
+                await self._invalidate(path)
+
+        self.misses += 1
+        if start is not None or end is not None:
+            # ranged reads are served from the target, caching the whole file
+            # would defeat them
+            return await self.fs._cat_file(path, start=start, end=end, **kwargs)
+        data = await self.fs._cat_file(path, **kwargs)
+        await loop.run_in_executor(None, _write_atomic, self.storage, fn, data, version)
+        if fn in files:
+            self._current_size -= files.pop(fn)
+        files[fn] = len(data)
+        self._current_size += len(data)
+        await self._evict()
+        return data
+
+    async def _evict(self):
+        if self.max_size is None:
+            return
+        files = await self._index()
+        loop = asyncio.get_running_loop()
+        while self._current_size > self.max_size and files:
+            fn, size = files.popitem(last=False)
+            self._current_size -= size
+            self.evictions += 1
+            await loop.run_in_executor(None, _remove, fn)
+
+    def _forget(self, fn):
+        if self._files is not None and fn in self._files:
+            self._current_size -= self._files.pop(fn)
+
+    async def _invalidate(self, path):
+        fn = self._cache_path(path)
+        self._forget(fn)
+        await asyncio.get_running_loop().run_in_executor(None, _remove, fn)
+
+    async def invalidate(self, paths):
+        """Drop the cached copies of ``paths``, to be read again from the
+        target"""
+        if isinstance(paths, str):
+            paths = [paths]
+        await asyncio.gather(*[self._invalidate(p) for p in paths])
+
+    async def clear_cache(self):
+        """Remove every cached file"""
+        files = await self._index()
+        loop = asyncio.get_running_loop()
+        while files:
+            fn, _ = files.popitem()
+            await loop.run_in_executor(None, _remove, fn)
+        self._current_size = 0
+
+    async def _pipe_file(self, path, value, **kwargs):
+        await self._invalidate(path)
+        await self.fs._pipe_file(path, value, **kwargs)
+
+    async def _rm_file(self, path, **kwargs):
+        await self._invalidate(path)
+        await self.fs._rm_file(path, **kwargs)
+
+    async def _rm(self, path, recursive=False, **kwargs):
+        paths = await self.fs._expand_path(path, recursive=recursive)
+        await asyncio.gather(*[self._invalidate(p) for p in paths])
+        await self.fs._rm(paths, **kwargs)
+
+    async def _info(self, path, **kwargs):
+        return await self.fs._info(path, **kwargs)
+
+    async def _ls(self, path, **kwargs):
+        return await self.fs._ls(path, **kwargs)
+
+    async def _find(self, path, maxdepth=None, withdirs=False, **kwargs):
+        return await self.fs._find(path, maxdepth=maxdepth, withdirs=withdirs, **kwargs)
+
+    async def _exists(self, path):
+        return await self.fs._exists(path)
+
+    async def _isfile(self, path):
+        return await self.fs._isfile(path)
+
+    async def _mkdir(self, path, create_parents=True, **kwargs):
+        return await self.fs._mkdir(path, create_parents=create_parents, **kwargs)
+
+    async def _makedirs(self, path, exist_ok=False):
+        return await self.fs._makedirs(path, exist_ok=exist_ok)
+
+    def _strip_protocol(self, path):
+        return self.fs._strip_protocol(path)
+
+    def _parent(self, path):
+        return self.fs._parent(path)
+
+
+def _scan(storage):
+    entries = []
+    with os.scandir(storage) as it:
+        for entry in it:
+            if entry.is_file() and not entry.name.startswith("."):
+                st = entry.stat()
+                entries.append((st.st_atime, entry.path, st.st_size))
+    return [(path, size) for _, path, size in sorted(entries)]
+
+
+def _read(fn, start, end, use_mmap):
+    with open(fn, "rb") as f:
+        if use_mmap:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return b""
+            # the map stays open for as long as the returned view is alive
+            return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))[
+                start:end
+            ]
+        if start is None and end is None:
+            return f.read()
+        size = os.fstat(f.fileno()).st_size
+        start, end, _ = slice(start, end).indices(size)
+        f.seek(start)
+        return f.read(max(end - start, 0))
+
+
+def _version_path(fn):
+    # hidden, so that ``_scan`` does not take it for a cached file
+    head, name = os.path.split(fn)
+    return os.path.join(head, f".{name}.version")
+
+
+def _read_checked(fn, start, end, use_mmap, version):
+    # the cached bytes, or ``None`` if they are not of ``version``
+    if version is not None:
+        try:
+            with open(_version_path(fn)) as f:
+                if f.read() != version:
+                    return None
+        except FileNotFoundError:
+            return None
+    return _read(fn, start, end, use_mmap)
+
+
+def _write_atomic(storage, fn, data, version=None):
+    if version is not None:
+        _write_file(storage, _version_path(fn), version.encode())
+    _write_file(storage, fn, data)
+
+
+def _write_file(storage, fn, data):
+    fd, tmp = tempfile.mkstemp(dir=storage, prefix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, fn)
+    except BaseException:
+        _unlink(tmp)
+        raise
+
+
+def _remove(fn):
+    _unlink(fn)
+    _unlink(_version_path(fn))
+
+
+def _unlink(fn):
+    try:
+        os.remove(fn)
+    except FileNotFoundError:
+        pass
@@ -1,11 +1,112 @@
+import asyncio
+import collections
+import contextlib
+import random
+import weakref
+
 from fsspec.asyn import AsyncFileSystem
 from fsspec.mapping import FSMap, maybe_convert
 
+from ... import tracing
+
+_fs_limits = weakref.WeakKeyDictionary()
+# reads currently in flight, per filesystem and path
+_fs_flights = weakref.WeakKeyDictionary()
+
+
+def set_fs_concurrency(fs, limit):
+    """Cap the number of concurrent requests issued to ``fs``
+
+    The limit is shared by every mapper on the filesystem; ``None`` removes it.
+    """
+    if limit is None:
+        _fs_limits.pop(fs, None)
+    else:
+        _fs_limits[fs] = asyncio.Semaphore(limit)
+
+
+def _request_slot(fs):
+    sem = _fs_limits.get(fs)
+    return contextlib.nullcontext() if sem is None else sem
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class _LatencyWindow:
+    """Latencies of the last ``size`` requests, and their ``quantile``"""
+
+    __slots__ = ("samples", "quantile", "min_samples", "_threshold", "_stale")
+
+    def __init__(self, quantile, size=256, min_samples=32):
+        self.samples = collections.deque(maxlen=size)
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self._threshold = None
+        self._stale = 0
+
+    def observe(self, latency):
+        self.samples.append(latency)
+        self._stale += 1
+
+    def threshold(self):
+        """The latency quantile, ``None`` until ``min_samples`` are in"""
+        if len(self.samples) < self.min_samples:
+            return None
+        if self._threshold is None or self._stale >= self.min_samples // 4:
+            ordered = sorted(self.samples)
+            self._threshold = ordered[int(self.quantile * (len(ordered) - 1))]
+            self._stale = 0
+        return self._threshold
+
 
 class AsyncFSMap(FSMap):
-    def __init__(self, root, fs, check=False, create=False, missing_exceptions=None):
+    """Async key-value mapping over an ``AsyncFileSystem``
+
+    With ``coalesce=True`` concurrent reads of the same path, from any mapper
+    on the same filesystem, share a single request. The number of reads that
+    joined a request already in flight is counted in ``deduplicated``.
+
+    With ``hedge_quantile`` set, a read still running after that quantile of
+    the latency of recent reads is sent again, and the first response is
+    kept; ``hedged`` counts the duplicates sent and ``hedge_wins`` those that
+    answered first. Reads failing with one of ``transient_exceptions`` are
+    retried up to ``retries`` times after an exponential, jittered delay
+    starting at ``retry_backoff`` seconds; ``retried`` counts the retries.
+
+    Requests, bytes, latencies and time waiting for a request slot are
+    reported to the current ``tracing.trace``.
+    """
+
+    def __init__(
+        self,
+        root,
+        fs,
+        check=False,
+        create=False,
+        missing_exceptions=None,
+        coalesce=True,
+        hedge_quantile=None,
+        retries=0,
+        retry_backoff=0.1,
+        transient_exceptions=(ConnectionError, TimeoutError, asyncio.TimeoutError),
+    ):
         assert isinstance(fs, AsyncFileSystem)
         super().__init__(root, fs, check, create, missing_exceptions)
+        self.coalesce = coalesce
+        self.deduplicated = 0
+        self.latency = (
+            None if hedge_quantile is None else _LatencyWindow(hedge_quantile)
+        )
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.transient_exceptions = transient_exceptions
+        self.hedged = self.hedge_wins = self.retried = 0
 
     async def clear(self):
         try:
@@ -18,9 +119,16 @@ class AsyncFSMap(FSMap):
         keys2 = [self._key_to_str(k) for k in keys]
         oe = on_error if on_error == "raise" else "return"
         try:
-            out = await self.fs._cat(keys2, on_error=oe)
-            if isinstance(out, bytes):
-                out = {keys2[0]: out}
+            with tracing.span("fsspec.getitems", keys=len(keys2)):
+                if (
+                    self.coalesce
+                    or self.fs in _fs_limits
+                    or self.latency is not None
+                    or self.retries
+                ):
+                    out = await self._cat_many(keys2, on_error=oe)
+                else:
+                    out = await self._cat_batch(keys2, on_error=oe)
         except self.missing_exceptions as e:
             raise KeyError from e
         out = {
@@ -33,6 +141,147 @@ class AsyncFSMap(FSMap):
             if on_error == "return" or not isinstance(out[k2], BaseException)
         }
 
+    async def _cat_many(self, paths, on_error="raise"):
+        """As ``fs._cat`` for a list of paths, but reading each path through
+        ``_fetch``"""
+        out = await asyncio.gather(
+            *[self._fetch(p) for p in paths], return_exceptions=True
+        )
+        if on_error == "raise":
+            ex = next((o for o in out if isinstance(o, Exception)), None)
+            if ex is not None:
+                raise ex
+        return dict(zip(paths, out))
+
+    async def _cat_batch(self, paths, on_error="raise"):
+        # one fs._cat call for all of ``paths``
+        start = tracing.clock()
+        out = await self.fs._cat(paths, on_error=on_error)
+        if isinstance(out, bytes):
+            out = {paths[0]: out}
+        trace = tracing.current()
+        if trace is not None:
+            latency = tracing.clock() - start
+            for data in out.values():
+                if isinstance(data, bytes):
+                    trace.record_fetch(len(data), latency)
+        return out
+
+    async def _cat_file(self, path):
+        if self.latency is None:
+            return await self._retrying(self._request, path)
+        return await self._retrying(self._hedged, path)
+
+    async def _request(self, path, start=None, end=None):
+        data, _ = await self._cat_in_slot(path, start, end)
+        return data
+
+    async def _cat_in_slot(self, path, start=None, end=None):
+        # fs._cat_file once a request slot is free, and its latency
+        queued = tracing.clock()
+        async with _request_slot(self.fs):
+            begin = tracing.clock()
+            data = await self.fs._cat_file(path, start=start, end=end)
+            latency = tracing.clock() - begin
+        trace = tracing.current()
+        if trace is not None:
+            trace.queue_wait += begin - queued
+            trace.record_fetch(len(data), latency)
+        return data, latency
+
+    async def _retrying(self, request, *args):
+        attempt = 0
+        while True:
+            try:
+                return await request(*args)
+            except self.missing_exceptions:
+                raise
+            except self.transient_exceptions:
+                if attempt >= self.retries:
+                    raise
+            # full jitter, so that requests failing together don't retry together
+            await asyncio.sleep(random.uniform(0, self.retry_backoff * 2**attempt))
+            attempt += 1
+            self.retried += 1
+            trace = tracing.current()
+            if trace is not None:
+                trace.retried += 1
+
+    async def _timed_request(self, path):
+        data, latency = await self._cat_in_slot(path)
+        self.latency.observe(latency)
+        return data
+
+    async def _hedged(self, path):
+        delay = self.latency.threshold()
+        first = asyncio.ensure_future(self._timed_request(path))
+        if delay is None:
+            return await first
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self.hedged += 1
+                trace = tracing.current()
+                if trace is not None:
+                    trace.hedged += 1
+                tasks.add(asyncio.ensure_future(self._timed_request(path)))
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _fetch(self, path):
+        if not self.coalesce:
+            return await self._cat_file(path)
+
+        flights = _fs_flights.setdefault(self.fs, {})
+        flight = flights.get(path)
+        if flight is None:
+            flight = flights[path] = _Flight(
+                asyncio.ensure_future(self._cat_file(path))
+            )
+            flight.task.add_done_callback(
+                lambda _: flights.get(path) is flight and flights.pop(path)
+            )
+        else:
+            self.deduplicated += 1
+            trace = tracing.current()
+            if trace is not None:
+                trace.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            # a cancelled waiter must not cancel the read for the others
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                # nobody is left waiting for the result; later reads of the
+                # path start a request of their own rather than join this one
+                if flights.get(path) is flight:
+                    del flights[path]
+                flight.task.cancel()
+
+    async def cat_range(self, key, start, end):
+        """Retrieve bytes ``start`` to ``end`` of the value of ``key``"""
+        path = self._key_to_str(key)
+        try:
+            return await self._retrying(self._request, path, start, end)
+        except self.missing_exceptions:
+            raise KeyError(key)
+
     async def setitems(self, values_dict):
         values = {self._key_to_str(k): maybe_convert(v) for k, v in values_dict.items()}
         await self.fs._pipe(values)
@@ -45,7 +294,8 @@ class AsyncFSMap(FSMap):
         """Retrieve data"""
         k = self._key_to_str(key)
         try:
-            result = await self.fs._cat(k)
+            with tracing.span("fsspec.getitem", key=k):
+                result = await self._fetch(k)
         except self.missing_exceptions:
             if default is not None:
                 return default
@@ -0,0 +1,217 @@
+"""Per-request tracing of I/O and decoding.
+
+A trace collects what the selections run under it cost: chunks requested,
+found in the chunk cache or known to be missing, requests made and bytes
+fetched, a histogram of request latencies, time spent decoding and time
+spent waiting for a concurrency slot::
+
+    with tracing.trace() as t:
+        await ds._sel(time="2000-01-01")
+    print(t.summary())
+
+The trace is held in a context variable, so it follows the selection into
+the tasks it starts and concurrent selections under different traces do not
+mix. With ``tracer`` set, the steps of the selection are also reported as
+spans through ``tracer.start_as_current_span(name, attributes=...)``, which
+an OpenTelemetry tracer provides. Outside of a trace every probe costs one
+context variable lookup.
+"""
+
+import contextlib
+import contextvars
+import time
+
+_current = contextvars.ContextVar("trace", default=None)
+_no_span = contextlib.nullcontext()
+
+clock = time.perf_counter
+
+
+def current():
+    """The trace of the running context, ``None`` outside of one"""
+    return _current.get()
+
+
+@contextlib.contextmanager
+def trace(name="request", tracer=None):
+    """Collect a ``Trace`` of everything run in the block, and report it as
+    a span ``name`` of ``tracer`` if given"""
+    t = Trace(name, tracer)
+    token = _current.set(t)
+    try:
+        with span(name):
+            yield t
+    finally:
+        t.elapsed = clock() - t.start
+        _current.reset(token)
+
+
+def span(name, **attributes):
+    """A span ``name`` of the current trace's tracer, a no-op context
+    manager when there is none"""
+    t = _current.get()
+    if t is None or t.tracer is None:
+        return _no_span
+    return t.tracer.start_as_current_span(name, attributes=attributes)
+
+
+class LatencyHistogram:
+    """Counts of latencies in power of two buckets from ``base`` seconds"""
+
+    __slots__ = ("base", "counts", "total", "max")
+
+    def __init__(self, base=1e-3, nbuckets=18):
+        self.base = base
+        # the last bucket takes everything from base * 2 ** (nbuckets - 2) up
+        self.counts = [0] * nbuckets
+        self.total = 0.0
+        self.max = 0.0
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def __repr__(self):
+        return f"LatencyHistogram({self.buckets()})"
+
+    def observe(self, latency):
+        bucket, bound = 0, self.base
+        while latency > bound and bucket < len(self.counts) - 1:
+            bucket += 1
+            bound *= 2
+        self.counts[bucket] += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+
+    def buckets(self):
+        """``{upper bound: count}`` of the non-empty buckets, the last bound
+        being infinite"""
+        bounds = [self.base * 2**i for i in range(len(self.counts) - 1)]
+        bounds.append(float("inf"))
+        return {b: n for b, n in zip(bounds, self.counts) if n}
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the ``q`` quantile, capped at
+        the largest latency seen"""
+        n = len(self)
+        if not n:
+            return None
+        rank, seen, bound = q * (n - 1), 0, self.base
+        for count in self.counts:
+            seen += count
+            if seen > rank:
+                break
+            bound *= 2
+        return min(bound, self.max)
+
+
+class Trace:
+    """What the selections run under ``trace`` cost, updated as they run"""
+
+    __slots__ = (
+        "name",
+        "tracer",
+        "start",
+        "elapsed",
+        "chunks_requested",
+        "chunks_skipped",
+        "cache_hits",
+        "requests",
+        "bytes_fetched",
+        "coalesced",
+        "hedged",
+        "retried",
+        "fetch_latency",
+        "decodes",
+        "decode_time",
+        "queue_wait",
+    )
+
+    def __init__(self, name="request", tracer=None):
+        self.name = name
+        self.tracer = tracer
+        self.start = clock()
+        self.elapsed = None
+        self.chunks_requested = 0
+        # chunks known to be missing, filled without a request
+        self.chunks_skipped = 0
+        self.cache_hits = 0
+        self.requests = 0
+        self.bytes_fetched = 0
+        # reads that joined a request already in flight
+        self.coalesced = 0
+        self.hedged = 0
+        self.retried = 0
+        self.fetch_latency = LatencyHistogram()
+        self.decodes = 0
+        self.decode_time = 0.0
+        # time spent waiting for a request or fetch slot
+        self.queue_wait = 0.0
+
+    def __repr__(self):
+        return f"Trace({self.name!r}, {self.summary()})"
+
+    def record_fetch(self, nbytes, latency):
+        self.requests += 1
+        self.bytes_fetched += nbytes
+        self.fetch_latency.observe(latency)
+
+    def record_decode(self, seconds):
+        self.decodes += 1
+        self.decode_time += seconds
+
+    def summary(self):
+        return TraceSummary(self)
+
+
+class TraceSummary:
+    """A snapshot of a ``Trace``"""
+
+    __slots__ = (
+        "name",
+        "elapsed",
+        "chunks_requested",
+        "chunks_skipped",
+        "cache_hits",
+        "requests",
+        "bytes_fetched",
+        "coalesced",
+        "hedged",
+        "retried",
+        "latency_p50",
+        "latency_p99",
+        "latency_max",
+        "latency_histogram",
+        "decodes",
+        "decode_time",
+        "queue_wait",
+    )
+
+    def __init__(self, t):
+        self.name = t.name
+        self.elapsed = clock() - t.start if t.elapsed is None else t.elapsed
+        self.chunks_requested = t.chunks_requested
+        self.chunks_skipped = t.chunks_skipped
+        self.cache_hits = t.cache_hits
+        self.requests = t.requests
+        self.bytes_fetched = t.bytes_fetched
+        self.coalesced = t.coalesced
+        self.hedged = t.hedged
+        self.retried = t.retried
+        self.latency_p50 = t.fetch_latency.quantile(0.5)
+        self.latency_p99 = t.fetch_latency.quantile(0.99)
+        self.latency_max = t.fetch_latency.max
+        self.latency_histogram = t.fetch_latency.buckets()
+        self.decodes = t.decodes
+        self.decode_time = t.decode_time
+        self.queue_wait = t.queue_wait
+
+    def __repr__(self):
+        fields = ", ".join(
+            f"{name}={getattr(self, name)!r}"
+            for name in self.__slots__
+            if name not in ("name", "latency_histogram")
+        )
+        return f"TraceSummary({fields})"
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
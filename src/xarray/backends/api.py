@@ -0,0 +1,361 @@
+"""Writing datasets to zarr stores through an ``AsyncFSMap``.
+
+``to_zarr`` runs xarray's own ``to_zarr`` logic, encoding, validation,
+appending and region checks, against the metadata of the store staged in
+memory, then writes the data of each variable chunk by chunk through the
+async write path of ``Array``, and uploads the metadata last. Readers see
+either the old or the new dataset: chunks appended past the old shape are
+invisible until the array metadata grows, and the consolidated metadata,
+written once everything else is in place, is the commit point.
+"""
+
+import asyncio
+import contextlib
+
+import numpy as np
+from xarray import Variable, coding
+from xarray.backends.api import (
+    _validate_dataset_names,
+    _validate_datatypes_for_zarr_append,
+    _validate_region,
+    dump_to_store,
+)
+from xarray.backends.common import BackendArray
+from xarray.backends.zarr import (
+    DIMENSION_KEY,
+    ZarrStore,
+    _encode_variable_name,
+    _put_attrs,
+    extract_zarr_variable_encoding,
+)
+from xarray.core import indexing
+from zarr.storage import normalize_store_arg
+from zarr.util import json_dumps, json_loads
+
+from ...zarr.core import ZA, Array
+from ...zarr.storage import CHUNK_INDEX_KEY, ChunkIndex, crawl_metadata
+from ...zarr.util import cancelling_gather, read_ahead
+from ..core.indexing import _has_async_array
+
+
+class _FillValueArray(BackendArray):
+    """Stands in for the data of an existing array, which only has its
+    metadata staged: reads give the fill value, or zeros, without a request"""
+
+    def __init__(self, zarr_array):
+        self.shape = zarr_array.shape
+        self.dtype = zarr_array.dtype
+        fill_value = zarr_array.fill_value
+        if fill_value is None:
+            self._values = np.zeros((), dtype=self.dtype)
+        else:
+            self._values = np.array(fill_value, dtype=self.dtype)
+
+    def __getitem__(self, key):
+        return indexing.explicit_indexing_adapter(
+            key, self.shape, indexing.IndexingSupport.BASIC, self._getitem
+        )
+
+    def _getitem(self, key):
+        return np.broadcast_to(self._values, self.shape)[key]
+
+
+class _StagedZarrStore(ZarrStore):
+    """``ZarrStore`` over metadata staged in memory, handing the data of
+    each variable to the writer instead of storing it"""
+
+    def open_store_variable(self, name, zarr_array):
+        # ``store`` decodes the existing variables for their encoding only;
+        # their values, read through the async Array, are not available here
+        var = super().open_store_variable(name, zarr_array)
+        data = indexing.LazilyIndexedArray(_FillValueArray(zarr_array))
+        return Variable(var.dims, data, var.attrs, var.encoding)
+
+    def set_variables(self, variables, check_encoding_set, writer, unlimited_dims=None):
+        # as ZarrStore.set_variables, resizing the staged array synchronously
+        for vn, v in variables.items():
+            name = _encode_variable_name(vn)
+            check = vn in check_encoding_set
+            attrs = v.attrs.copy()
+            dims = v.dims
+            dtype = v.dtype
+            shape = v.shape
+
+            fill_value = attrs.pop("_FillValue", None)
+            if v.encoding == {"_FillValue": None} and fill_value is None:
+                v.encoding = {}
+
+            if name in self.zarr_group:
+                zarr_array = self.zarr_group[name]
+            else:
+                encoding = extract_zarr_variable_encoding(
+                    v, raise_on_invalid=check, name=vn, safe_chunks=self._safe_chunks
+                )
+                encoded_attrs = {DIMENSION_KEY: dims}
+                for k2, v2 in attrs.items():
+                    encoded_attrs[k2] = self.encode_attribute(v2)
+
+                if coding.strings.check_vlen_dtype(dtype) == str:
+                    dtype = str
+                zarr_array = self.zarr_group.create(
+                    name, shape=shape, dtype=dtype, fill_value=fill_value, **encoding
+                )
+                zarr_array = _put_attrs(zarr_array, encoded_attrs)
+
+            write_region = self._write_region if self._write_region is not None else {}
+            write_region = {dim: write_region.get(dim, slice(None)) for dim in dims}
+
+            if self._append_dim is not None and self._append_dim in dims:
+                append_axis = dims.index(self._append_dim)
+                assert write_region[self._append_dim] == slice(None)
+                write_region[self._append_dim] = slice(
+                    zarr_array.shape[append_axis], None
+                )
+
+                new_shape = list(zarr_array.shape)
+                new_shape[append_axis] += v.shape[append_axis]
+                # only the staged metadata, there are no chunks to drop
+                ZA.resize(zarr_array, new_shape)
+
+            region = tuple(write_region[dim] for dim in dims)
+            writer.add(v.data, zarr_array, region)
+
+
+class _DeferredWriter:
+    """Collects what ``ArrayWriter`` would write, to write it later"""
+
+    def __init__(self):
+        self.writes = []
+
+    def add(self, source, target, region=None):
+        if region is None:
+            region = (slice(None),) * target.ndim
+        self.writes.append((source, target, region))
+
+
+def _is_metadata_key(key):
+    return key.endswith((".zarray", ".zgroup", ".zattrs"))
+
+
+def _group_prefix(group):
+    return f"{group.strip('/')}/" if group else ""
+
+
+async def _read_metadata(store, metadata_key):
+    # the metadata documents of ``store``, and whether they were consolidated
+    try:
+        meta = json_loads(await store[metadata_key])
+    except KeyError:
+        return await crawl_metadata(store), False
+    return meta["metadata"], True
+
+
+async def _remove_group(store, group):
+    prefix = _group_prefix(group)
+    if not prefix:
+        await store.clear()
+        return
+    with contextlib.suppress(FileNotFoundError):
+        await store.fs._rm(store._key_to_str(prefix.rstrip("/")), recursive=True)
+
+
+async def _load_block(source, key):
+    # a block of ``source``, a numpy or dask array, computed off the loop
+    values = indexing.as_indexable(source)[indexing.BasicIndexer(key)]
+    if isinstance(values, np.ndarray):
+        return values
+    return await asyncio.get_running_loop().run_in_executor(None, np.asarray, values)
+
+
+def _blocks(array, region):
+    # ``region`` of ``array`` cut at its chunk boundaries along the first axis
+    start, stop, _ = region[0].indices(array.shape[0])
+    size = array.chunks[0]
+    edges = [start, *range((start // size + 1) * size, stop, size), stop]
+    return [slice(a, b) for a, b in zip(edges[:-1], edges[1:]) if b > a]
+
+
+async def _write(array, source, region, ahead):
+    # write ``source`` to ``region`` of ``array``, whole chunks along the
+    # first axis at a time, loading the next blocks while one is uploaded
+    if array.ndim == 0 or isinstance(source, np.ndarray):
+        await array.set_basic_selection(region, np.asarray(source))
+        return
+    start = region[0].indices(array.shape[0])[0]
+    rest = (slice(None),) * (array.ndim - 1)
+
+    def fetch(block):
+        key = (slice(block.start - start, block.stop - start),) + rest
+        return _load_block(source, key)
+
+    stream = read_ahead(_blocks(array, region), fetch, ahead=ahead)
+    async with contextlib.aclosing(stream):
+        async for block, values in stream:
+            await array.set_basic_selection((block,) + tuple(region[1:]), values)
+
+
+async def to_zarr(
+    dataset,
+    store,
+    chunk_store=None,
+    mode=None,
+    group=None,
+    encoding=None,
+    consolidated=None,
+    append_dim=None,
+    region=None,
+    safe_chunks=True,
+    metadata_key=".zmetadata",
+    fetch_options=None,
+    executor=None,
+    ahead=1,
+):
+    """Write ``dataset`` to the zarr store in ``store``, an ``AsyncFSMap``,
+    as ``Dataset.to_zarr`` does, taking its arguments and those below.
+
+    Variables are written one after the other. Variables backed by async
+    arrays are loaded first. Chunk bitmaps in the consolidated metadata are
+    rebuilt for the arrays written. Stores without consolidated metadata are
+    crawled to find their arrays, see ``storage.crawl_metadata``.
+
+    Parameters
+    ----------
+    metadata_key : str, optional
+        Key of the consolidated metadata, read to find existing arrays and
+        written last unless ``consolidated=False``.
+    fetch_options : dict, optional
+        ``Array.set_fetch_options`` arguments for the writes: ``batch_size``
+        chunks are uploaded per ``setitems`` call, with up to
+        ``max_concurrency`` calls in flight.
+    executor : DecodeExecutor or Executor, optional
+        Where chunks are encoded, see ``Array.set_decode_executor``.
+    ahead : int, optional
+        Blocks of dask backed variables computed while one is uploaded.
+    """
+    for v in dataset.variables.values():
+        if v.size == 0:
+            v.load()
+    if encoding is None:
+        encoding = {}
+
+    if mode is None:
+        if append_dim is not None:
+            mode = "a"
+        elif region is not None:
+            mode = "r+"
+        else:
+            mode = "w-"
+    if mode != "a" and append_dim is not None:
+        raise ValueError("cannot set append_dim unless mode='a' or mode=None")
+    if mode not in ["a", "r+"] and region is not None:
+        raise ValueError("cannot set region unless mode='a', mode='r+' or mode=None")
+    if mode not in ["w", "w-", "a", "r+"]:
+        raise ValueError(
+            "The only supported options for mode are 'w', "
+            f"'w-', 'a' and 'r+', but mode={mode!r}"
+        )
+
+    _validate_dataset_names(dataset)
+    if region is not None:
+        _validate_region(dataset, region)
+        if append_dim is not None and append_dim in region:
+            raise ValueError(
+                f"cannot list the same dimension in both ``append_dim`` and "
+                f"``region`` with to_zarr(), got {append_dim} in both"
+            )
+
+    names = [n for n, v in dataset.variables.items() if _has_async_array(v._data)]
+    if names:
+        loaded = await cancelling_gather(
+            *[dataset.variables[n]._isel({}) for n in names]
+        )
+        dataset = dataset._replace(
+            variables={**dataset.variables, **dict(zip(names, loaded))}
+        )
+
+    metadata, was_consolidated = await _read_metadata(store, metadata_key)
+    if mode == "w":
+        prefix = _group_prefix(group)
+        metadata = {k: v for k, v in metadata.items() if not k.startswith(prefix)}
+    # entries kept as they are, such as chunk bitmaps
+    extra = {k: v for k, v in metadata.items() if not _is_metadata_key(k)}
+    before = {k: json_dumps(v) for k, v in metadata.items() if _is_metadata_key(k)}
+    staging = dict(before)
+
+    zstore = _StagedZarrStore.open_group(
+        staging,
+        mode=mode,
+        group=group,
+        consolidated=False,
+        consolidate_on_close=False,
+        append_dim=append_dim,
+        write_region=region,
+        safe_chunks=safe_chunks,
+    )
+    if mode in ["a", "r+"]:
+        _validate_datatypes_for_zarr_append(zstore, dataset)
+        if append_dim is not None:
+            existing_dims = zstore.get_dimensions()
+            if append_dim not in existing_dims:
+                raise ValueError(
+                    f"append_dim={append_dim!r} does not match any existing "
+                    f"dataset dimensions {existing_dims}"
+                )
+        existing_var_names = set(zstore.zarr_group.array_keys())
+        for var_name in existing_var_names:
+            if var_name in encoding.keys():
+                raise ValueError(
+                    f"variable {var_name!r} already exists, but encoding was provided"
+                )
+        if mode == "r+":
+            new_names = [k for k in dataset.variables if k not in existing_var_names]
+            if new_names:
+                raise ValueError(
+                    f"dataset contains non-pre-existing variables {new_names}, "
+                    "which is not allowed in ``to_zarr()`` with mode='r+'. To "
+                    "allow writing new variables, set mode='a'."
+                )
+
+    writer = _DeferredWriter()
+    dump_to_store(dataset, zstore, writer, encoding=encoding)
+
+    if mode == "w":
+        await _remove_group(store, group)
+    chunk_mapping = store if chunk_store is None else chunk_store
+    chunk_zstore = normalize_store_arg(chunk_mapping)
+    for source, target, target_region in writer.writes:
+        # staged arrays may be zarr's own, created by ``zarr.creation``
+        array = Array(target.store, path=target.path, chunk_store=chunk_zstore)
+        array.set_fetch_options(**(fetch_options or {}))
+        array.set_decode_executor(executor)
+        await _write(array, source, target_region, ahead)
+
+    changed = {k: v for k, v in staging.items() if before.get(k) != v}
+    if changed:
+        await store.setitems(changed)
+
+    consolidated_metadata = {k: json_loads(v) for k, v in staging.items()}
+    consolidated_metadata.update(extra)
+    indexed = [
+        target.path
+        for _, target, _ in writer.writes
+        if _group_prefix(target.path) + CHUNK_INDEX_KEY in extra
+    ]
+    if indexed:
+        index = await ChunkIndex.from_listing(
+            chunk_mapping, consolidated_metadata, indexed
+        )
+        consolidated_metadata.update(index.to_metadata())
+    if mode == "r+":
+        # region writes only refresh consolidated metadata that exists
+        consolidate = was_consolidated and consolidated is not False
+        consolidate = consolidate and consolidated_metadata != metadata
+    else:
+        consolidate = consolidated or consolidated is None
+    if consolidate:
+        await store.__setitem__(
+            metadata_key,
+            json_dumps(
+                {"zarr_consolidated_format": 1, "metadata": consolidated_metadata}
+            ),
+        )
@@ -0,0 +1,137 @@
+import asyncio
+import time
+
+from xarray.backends.lru_cache import LRUCache
+
+from ...fsspec.implementations.cached import _VERSION_KEYS
+
+
+class _Entry:
+    __slots__ = ("dataset", "token", "expires")
+
+    def __init__(self, dataset, token, expires):
+        self.dataset = dataset
+        self.token = token
+        self.expires = expires
+
+
+class DatasetCache:
+    """Process-wide cache of opened datasets.
+
+    Datasets are keyed by store URL and open arguments. An entry is served
+    as-is for ``ttl`` seconds; after that it is revalidated by comparing the
+    ETag/mtime of the store's consolidated metadata with the one seen at open
+    time, and only reopened when it changed. At most ``maxsize`` datasets are
+    kept, evicting the least recently used. Concurrent opens of the same key
+    share one open.
+
+    Each caller gets a shallow copy of the cached dataset: the data of its
+    variables is shared, but refreshing or modifying one copy in place
+    leaves the others as they were.
+    """
+
+    def __init__(self, maxsize=128, ttl=60.0, metadata_key=".zmetadata"):
+        self._cache = LRUCache(maxsize)
+        self._opening = {}
+        self.ttl = ttl
+        self.metadata_key = metadata_key
+        self.hits = self.misses = self.revalidations = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __repr__(self):
+        return (
+            f"DatasetCache(maxsize={self._cache.maxsize}, ttl={self.ttl}, "
+            f"hits={self.hits}, misses={self.misses}, "
+            f"revalidations={self.revalidations})"
+        )
+
+    def clear(self):
+        self._cache.clear()
+
+    async def open(self, store, open_kwargs, opener):
+        """Return the cached dataset for ``store`` and ``open_kwargs``, calling
+        the coroutine function ``opener`` when there is none or it is stale"""
+        key = (_store_key(store), _freeze(open_kwargs))
+        entry = self._cache.get(key)
+        if entry is not None:
+            if time.monotonic() < entry.expires:
+                self.hits += 1
+                return _shallow_copy(entry.dataset)
+            token = await self._version(store)
+            if token is not None and token == entry.token:
+                self.revalidations += 1
+                entry.expires = time.monotonic() + self.ttl
+                return _shallow_copy(entry.dataset)
+
+        task = self._opening.get(key)
+        if task is None:
+            task = self._opening[key] = asyncio.ensure_future(
+                self._open(key, store, opener)
+            )
+            task.add_done_callback(lambda _: self._opening.pop(key, None))
+        else:
+            self.hits += 1
+        # the open goes on, and gets cached, when one of its waiters is cancelled
+        return _shallow_copy(await asyncio.shield(task))
+
+    async def _open(self, key, store, opener):
+        self.misses += 1
+        # taken before opening so that a concurrent update shows up as a
+        # change on the next revalidation
+        token = await self._version(store)
+        ds = await opener()
+        self._cache[key] = _Entry(ds, token, time.monotonic() + self.ttl)
+        return ds
+
+    async def _version(self, store):
+        fs = getattr(store, "fs", None)
+        if fs is None:
+            return None
+        try:
+            info = await fs._info(store._key_to_str(self.metadata_key))
+        except (FileNotFoundError, NotImplementedError):
+            return None
+        token = tuple(info.get(k) for k in _VERSION_KEYS)
+        if not any(v is not None for v in token[:-1]):
+            # size alone can't tell two versions apart
+            return None
+        return token
+
+
+def _store_key(store):
+    fs = getattr(store, "fs", None)
+    if fs is None:
+        return store if isinstance(store, str) else id(store)
+    # fsspec shares the instances of a filesystem class created with the
+    # same arguments, those of other classes hold state of their own
+    fs_key = fs._fs_token if fs.cachable else id(fs)
+    return fs.protocol, fs_key, store.root
+
+
+def _shallow_copy(ds):
+    # new dicts of variables, indexes and dimensions for ``refresh`` to
+    # patch, along with the store it refreshes from
+    copy = ds.copy(deep=False)
+    for name in getattr(type(ds), "__slots__", ()):
+        if hasattr(ds, name):
+            setattr(copy, name, getattr(ds, name))
+    return copy
+
+
+def _freeze(value):
+    # a hashable stand-in for open arguments; objects such as executors and
+    # caches are compared by identity
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    try:
+        hash(value)
+    except TypeError:
+        return id(value)
+    return value
+
+
+DATASET_CACHE = DatasetCache()
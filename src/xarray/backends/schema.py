@@ -0,0 +1,222 @@
+import asyncio
+import copy
+import hashlib
+import json
+
+from xarray import conventions
+from xarray.backends.lru_cache import LRUCache
+
+from ..conventions import decode_cf_variable
+from ..core.variable import Variable
+
+
+def metadata_fingerprint(metadata, group=None):
+    """Hash of the array metadata and attributes in consolidated ``metadata``.
+
+    Group attributes are left out, so that stores which only differ in those
+    (e.g. a date or history attribute) share a fingerprint.
+    """
+    prefix = f"{group.strip('/')}/" if group else ""
+    keys = [k for k in metadata if k.endswith(".zarray") and k.startswith(prefix)]
+    entries = {}
+    for key in keys:
+        base = key[: -len(".zarray")]
+        entries[key] = metadata[key]
+        entries[base + ".zattrs"] = metadata.get(base + ".zattrs")
+    blob = json.dumps(entries, sort_keys=True, default=str).encode()
+    return hashlib.sha1(blob).hexdigest()
+
+
+class _VariableSpec:
+    __slots__ = ("raw", "decoded", "lazy", "data", "stack_char_dim")
+
+    def __init__(self, raw, decoded, lazy, data, stack_char_dim):
+        self.raw = raw
+        self.decoded = decoded
+        self.lazy = lazy
+        self.data = data
+        self.stack_char_dim = stack_char_dim
+
+
+class SchemaTemplate:
+    """What opening one store taught us about every store with the same
+    metadata fingerprint.
+
+    Holds the store's zarr arrays, with their parsed
+    metadata and codec instances, the dimensions, attributes and encoding of
+    every variable before and after CF decoding, and the coordinate names
+    found in variable attributes. The decoded data of lazily loaded
+    variables is kept as a chain of lazy wrappers whose innermost array is
+    swapped for the new store's, preloaded variables are decoded again from
+    their values.
+    """
+
+    def __init__(self, store, variables, decoded, coord_names, decode_kwargs):
+        self.arrays = dict(store._arrays)
+        self.coord_names = frozenset(coord_names)
+        self.decode_kwargs = decode_kwargs
+        self.specs = {}
+        for name, var in variables.items():
+            if name not in decoded:
+                continue
+            new = decoded[name]
+            lazy, data = _is_store_array(var._data), None
+            if lazy:
+                try:
+                    data = _swap_store_array(new._data, None)
+                except AttributeError:
+                    # a wrapper we can't see through, decode every time
+                    lazy = False
+            self.specs[name] = _VariableSpec(
+                _unpack(var),
+                _unpack(new),
+                lazy,
+                data,
+                decode_kwargs.get("concat_characters", True)
+                and var.dtype == "S1"
+                and new.ndim < var.ndim,
+            )
+
+    def rebind(self, store):
+        """Copies of the template arrays reading from ``store``"""
+        group = store.zarr_group
+        return {
+            name: array._rebind(group._store, group._chunk_store)
+            for name, array in self.arrays.items()
+        }
+
+    def raw_spec(self, name):
+        spec = self.specs.get(name)
+        return None if spec is None else _copy_spec(spec.raw)
+
+    def decode(self, variables, attributes, decode_coords=True):
+        """``conventions.decode_cf_variables`` for variables opened with this
+        template"""
+        new_vars = {}
+        for name, var in variables.items():
+            spec = self.specs.get(name)
+            if spec is None:
+                continue
+            if spec.lazy:
+                data = _swap_store_array(spec.data, var._data)
+            else:
+                data = decode_cf_variable(
+                    name,
+                    var,
+                    stack_char_dim=spec.stack_char_dim,
+                    **self.decode_kwargs,
+                )._data
+            dims, attrs, encoding = _copy_spec(spec.decoded)
+            new_vars[name] = Variable(dims, data, attrs, encoding)
+        coord_names = set(self.coord_names)
+        attributes, global_coords = _pop_global_coordinates(attributes, decode_coords)
+        coord_names.update(global_coords)
+        return new_vars, attributes, coord_names
+
+
+def decode_cf_variables(variables, attributes, decode_coords=True, **decode_kwargs):
+    """``conventions.decode_cf_variables`` that also returns the coordinate
+    names found in variable attributes, which is what a template can reuse"""
+    attributes, global_coords = _pop_global_coordinates(attributes, decode_coords)
+    new_vars, attributes, coord_names = conventions.decode_cf_variables(
+        variables, attributes, decode_coords=decode_coords, **decode_kwargs
+    )
+    return new_vars, attributes, coord_names | set(global_coords), coord_names
+
+
+class SchemaTemplateCache:
+    """Schema templates keyed by metadata fingerprint and decode options.
+
+    Concurrent opens of stores sharing a fingerprint wait for the first one
+    to record its template rather than all decoding from scratch.
+    """
+
+    def __init__(self, maxsize=64):
+        self._cache = LRUCache(maxsize)
+        self._pending = {}
+        self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __repr__(self):
+        return (
+            f"SchemaTemplateCache(maxsize={self._cache.maxsize}, "
+            f"hits={self.hits}, misses={self.misses})"
+        )
+
+    def clear(self):
+        self._cache.clear()
+
+    @staticmethod
+    def key(store, group, decode_kwargs):
+        metadata = store.zarr_group.store.metadata
+        return (
+            metadata_fingerprint(metadata, group),
+            tuple(sorted((k, _hashable(v)) for k, v in decode_kwargs.items())),
+        )
+
+    async def acquire(self, key):
+        """Return ``(template, record)``: the template for ``key`` if there
+        is one, and whether the caller should record it with ``release``"""
+        template = self._cache.get(key)
+        if template is None and key in self._pending:
+            template = await asyncio.shield(self._pending[key])
+            if template is None:
+                # the first open failed, open without a template
+                return None, False
+        if template is not None:
+            self.hits += 1
+            return template, False
+        self.misses += 1
+        self._pending[key] = asyncio.get_running_loop().create_future()
+        return None, True
+
+    def release(self, key, template):
+        """Store ``template`` (``None`` when the open failed) and wake up the
+        opens waiting for it"""
+        if template is not None:
+            self._cache[key] = template
+        future = self._pending.pop(key)
+        if not future.done():
+            future.set_result(template)
+
+
+def _is_store_array(data):
+    # the backend array at the bottom of a lazily loaded variable
+    return hasattr(data, "datastore") and hasattr(data, "variable_name")
+
+
+def _swap_store_array(data, array):
+    # copy the chain of lazy wrappers around a backend array, with ``array``
+    # at the bottom instead
+    if data is None or _is_store_array(data):
+        return array
+    wrapper = copy.copy(data)
+    wrapper.array = _swap_store_array(data.array, array)
+    return wrapper
+
+
+def _unpack(var):
+    return var.dims, dict(var.attrs), dict(var.encoding)
+
+
+def _copy_spec(spec):
+    dims, attrs, encoding = spec
+    return dims, dict(attrs), dict(encoding)
+
+
+def _pop_global_coordinates(attributes, decode_coords):
+    if decode_coords and "coordinates" in attributes:
+        attributes = dict(attributes)
+        return attributes, attributes.pop("coordinates").split()
+    return attributes, []
+
+
+def _hashable(value):
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return tuple(sorted(map(str, value)))
+    return value
+
+
+SCHEMA_TEMPLATES = SchemaTemplateCache()
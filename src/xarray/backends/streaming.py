@@ -0,0 +1,343 @@
+"""Encoders streaming a selection of an async Dataset as byte frames.
+
+Each encoder is an async generator: the chunks behind the next frame are
+fetched when the consumer asks for it, with ``ahead`` blocks read in
+advance, so that an export runs in memory bounded by a few blocks however
+large the selection, and a slow consumer slows the fetches down rather
+than letting data pile up. Selections take integers and slices, which are
+applied lazily.
+
+The tabular encoders, NDJSON and Arrow IPC, emit one row per point of the
+data variables broadcast against each other, as ``Dataset.to_dataframe``
+does, reading blocks of rows along ``dim``. The netCDF-3 encoder writes a
+complete 64-bit offset file, one variable after the other.
+"""
+
+import contextlib
+import json
+import struct
+
+import numpy as np
+from xarray import conventions
+from xarray.backends.netcdf3 import encode_nc3_attrs, encode_nc3_variable
+from xarray.core import indexing
+
+from ...zarr.util import cancelling_gather, read_ahead
+from ..core.indexing import _has_async_array
+from ..core.variable import Variable
+
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover
+    pa = None
+
+# end of stream marker of the Arrow IPC streaming format
+_ARROW_EOS = b"\xff\xff\xff\xff\x00\x00\x00\x00"
+
+# encoding keys describing values on disk, as opposed to storage layout
+_CF_ENCODING_KEYS = (
+    "units",
+    "calendar",
+    "dtype",
+    "_FillValue",
+    "missing_value",
+    "scale_factor",
+    "add_offset",
+)
+
+
+def select(ds, indexers=None):
+    """The variables of ``ds`` indexed with ``indexers``, integers or slices
+    by dimension name, lazily: nothing is fetched"""
+    indexers = dict(indexers or {})
+    for dim, key in indexers.items():
+        if dim not in ds.dims:
+            raise ValueError(f"dimension {dim!r} does not exist")
+        if not isinstance(key, (int, np.integer, slice)):
+            raise TypeError("streamed selections take integers and slices")
+    variables = {}
+    for name, var in ds._variables.items():
+        key = {d: k for d, k in indexers.items() if d in var.dims}
+        if key and _has_async_array(var._data):
+            var = Variable(
+                var.dims,
+                indexing.LazilyIndexedArray(var._data),
+                var.attrs,
+                var.encoding,
+            )
+        variables[name] = var.isel(key) if key else var
+    return variables
+
+
+async def _load(var, key=None):
+    # ``var``, or its block ``key``, in memory
+    if _has_async_array(var._data):
+        return await var._isel(key or {})
+    return var.isel(key) if key else var
+
+
+def _blocks(var, dim):
+    # the store chunks of ``var`` along ``dim``, which may be an index
+    # variable or a variable of xarray's
+    if dim is None:
+        return [None]
+    return Variable._chunk_slices(var, var.get_axis_num(dim))
+
+
+def _table_columns(ds, indexers, dim):
+    # the selected variables, the names of those making the columns, the
+    # dimensions of the rows and the one to read blocks of rows along
+    variables = select(ds, indexers)
+    dims = []
+    for name in ds.data_vars:
+        dims.extend(d for d in variables[name].dims if d not in dims)
+    names = [
+        name
+        for name, var in variables.items()
+        if name in ds.data_vars or (var.dims and set(var.dims) <= set(dims))
+    ]
+    if dim is None and dims:
+        dim = dims[0]
+    elif dim is not None and dim not in dims:
+        raise ValueError(f"{dim!r} is not a dimension of the data variables")
+    return variables, names, dims, dim
+
+
+async def _table_blocks(ds, indexers, dim, ahead):
+    # the columns of one block of rows at a time, 1-D arrays by name
+    variables, names, dims, dim = _table_columns(ds, indexers, dim)
+    sizes = {}
+    for name in names:
+        sizes.update(variables[name].sizes)
+    blocked = [name for name in names if dim in variables[name].dims]
+    unblocked = [name for name in names if name not in blocked]
+    static = dict(
+        zip(
+            unblocked,
+            await cancelling_gather(*[_load(variables[n]) for n in unblocked]),
+        )
+    )
+
+    async def fetch(block):
+        if block is None:
+            return {}
+        values = await cancelling_gather(
+            *[_load(variables[n], {dim: block}) for n in blocked]
+        )
+        return dict(zip(blocked, values))
+
+    # rows are read along the chunks of the first data variable
+    chunked = [n for n in blocked if n in ds.data_vars] or blocked
+    blocks = _blocks(variables[chunked[0]], dim) if blocked else [None]
+    stream = read_ahead(blocks, fetch, ahead=ahead)
+    async with contextlib.aclosing(stream):
+        async for block, values in stream:
+            block_sizes = dict(sizes)
+            if block is not None:
+                block_sizes[dim] = block.stop - block.start
+            columns = {}
+            for name in names:
+                var = values.get(name, static.get(name))
+                var = var.set_dims({d: block_sizes[d] for d in dims})
+                columns[name] = np.asarray(var.transpose(*dims).values).reshape(-1)
+            yield columns
+
+
+def _json_column(values):
+    # a column as JSON serializable values, missing ones as None
+    if values.dtype.kind == "f":
+        return [None if v != v else v for v in values.tolist()]
+    if values.dtype.kind == "M":
+        strings = np.datetime_as_string(values)
+        return [None if s == "NaT" else s for s in strings.tolist()]
+    if values.dtype.kind == "m":
+        return [None if np.isnat(v) else str(v) for v in values]
+    if values.dtype.kind == "S":
+        return [v.decode() for v in values.tolist()]
+    return values.tolist()
+
+
+async def iter_ndjson(ds, indexers=None, dim=None, ahead=2, rows_per_frame=1024):
+    """Stream a selection of ``ds`` as newline delimited JSON, one object
+    per row, in frames of up to ``rows_per_frame`` rows"""
+    blocks = _table_blocks(ds, indexers, dim, ahead)
+    async with contextlib.aclosing(blocks):
+        async for columns in blocks:
+            names = list(columns)
+            values = [_json_column(c) for c in columns.values()]
+            lines = []
+            for row in zip(*values):
+                lines.append(json.dumps(dict(zip(names, row))))
+                if len(lines) == rows_per_frame:
+                    yield ("\n".join(lines) + "\n").encode()
+                    lines = []
+            if lines:
+                yield ("\n".join(lines) + "\n").encode()
+
+
+async def iter_arrow_ipc(ds, indexers=None, dim=None, ahead=2):
+    """Stream a selection of ``ds`` in the Arrow IPC streaming format: the
+    schema, one record batch per block of rows, then the end marker"""
+    if pa is None:
+        raise ModuleNotFoundError("streaming Arrow IPC requires pyarrow")
+    variables, names, _, _ = _table_columns(ds, indexers, dim)
+    # from the dtypes, so that a selection without rows still has one
+    schema = pa.schema(
+        [pa.field(str(name), _arrow_type(variables[name].dtype)) for name in names]
+    )
+    yield schema.serialize().to_pybytes()
+    blocks = _table_blocks(ds, indexers, dim, ahead)
+    async with contextlib.aclosing(blocks):
+        async for columns in blocks:
+            batch = pa.RecordBatch.from_arrays(
+                [
+                    pa.array(c, type=field.type)
+                    for c, field in zip(columns.values(), schema)
+                ],
+                schema=schema,
+            )
+            yield batch.serialize().to_pybytes()
+    yield _ARROW_EOS
+
+
+def _arrow_type(dtype):
+    if dtype.kind == "O":
+        # object variables of xarray's hold strings
+        return pa.string()
+    return pa.from_numpy_dtype(dtype)
+
+
+# netCDF-3 header tags and types
+_NC_DIMENSION = 10
+_NC_VARIABLE = 11
+_NC_ATTRIBUTE = 12
+_NC_TYPES = {"i1": 1, "S1": 2, "i2": 3, "i4": 4, "f4": 5, "f8": 6}
+
+
+def _nc3_type(dtype):
+    try:
+        return _NC_TYPES[dtype.str[1:]]
+    except KeyError:
+        raise TypeError(f"cannot stream {dtype} data to netCDF-3") from None
+
+
+def _pad(data):
+    return data + b"\0" * (-len(data) % 4)
+
+
+def _nc3_name(name):
+    data = str(name).encode()
+    return struct.pack(">i", len(data)) + _pad(data)
+
+
+def _nc3_attrs(attrs):
+    if not attrs:
+        return b"\0" * 8
+    out = [struct.pack(">ii", _NC_ATTRIBUTE, len(attrs))]
+    for name, value in attrs.items():
+        if isinstance(value, bytes):
+            nc_type, data, n = _NC_TYPES["S1"], value, len(value)
+        else:
+            value = np.asarray(value)
+            nc_type = _nc3_type(value.dtype)
+            data = value.astype(value.dtype.newbyteorder(">")).tobytes()
+            n = value.size
+        out.append(_nc3_name(name) + struct.pack(">ii", nc_type, n) + _pad(data))
+    return b"".join(out)
+
+
+def _nc3_encode(name, var):
+    # ``var`` CF encoded and coerced to a netCDF-3 type
+    if var.dtype.kind in "OUS":
+        raise TypeError(f"cannot stream the string variable {name!r} to netCDF-3")
+    encoding = {k: v for k, v in var.encoding.items() if k in _CF_ENCODING_KEYS}
+    if var.dtype.kind in "mM":
+        # fixed units, so that every block is encoded alike
+        encoding.setdefault(
+            "units", "seconds since 1970-01-01" if var.dtype.kind == "M" else "seconds"
+        )
+        encoding.setdefault("dtype", "f8")
+    var = Variable(var.dims, var.data, var.attrs, encoding)
+    return encode_nc3_variable(conventions.encode_cf_variable(var, name=name))
+
+
+def _nc3_header(dims, variables, attrs):
+    # ``variables`` are encoded samples, with the shapes of the variables
+    dim_ids = {dim: i for i, dim in enumerate(dims)}
+    parts = [b"CDF\x02", struct.pack(">i", 0)]
+    if dims:
+        parts.append(struct.pack(">ii", _NC_DIMENSION, len(dims)))
+        parts.extend(_nc3_name(d) + struct.pack(">i", n) for d, n in dims.items())
+    else:
+        parts.append(b"\0" * 8)
+    parts.append(_nc3_attrs(attrs))
+    entries = []
+    sizes = []
+    for name, (var, shape) in variables.items():
+        vsize = int(np.prod(shape)) * var.dtype.itemsize
+        vsize += -vsize % 4
+        sizes.append(vsize)
+        entries.append(
+            _nc3_name(name)
+            + struct.pack(
+                f">i{len(var.dims)}i", len(var.dims), *map(dim_ids.get, var.dims)
+            )
+            + _nc3_attrs(var.attrs)
+            + struct.pack(">ii", _nc3_type(var.dtype), min(vsize, 2**32 - 1))
+        )
+    if not variables:
+        parts.append(b"\0" * 8)
+        return b"".join(parts)
+    parts.append(struct.pack(">ii", _NC_VARIABLE, len(variables)))
+    # every entry ends with its 8 byte offset, the data follows the header
+    begin = sum(map(len, parts)) + sum(len(e) + 8 for e in entries)
+    for entry, vsize in zip(entries, sizes):
+        parts.append(entry + struct.pack(">q", begin))
+        begin += vsize
+    return b"".join(parts)
+
+
+async def iter_netcdf3(ds, indexers=None, ahead=2):
+    """Stream a selection of ``ds`` as a netCDF-3 file (64-bit offset
+    format), readable by any netCDF library.
+
+    Variables are written one after the other, in blocks along their first
+    dimension. Datetimes without units in their encoding are written as
+    seconds since 1970. Strings and 64-bit integers too large for 32 bits
+    cannot be written.
+    """
+    variables = select(ds, indexers)
+    dims = {}
+    for var in variables.values():
+        dims.update(var.sizes)
+    samples = {}
+    for name, var in variables.items():
+        empty = Variable(
+            var.dims, np.zeros((0,) * var.ndim, var.dtype), var.attrs, var.encoding
+        )
+        samples[name] = (_nc3_encode(name, empty), var.shape)
+    yield _nc3_header(dims, samples, encode_nc3_attrs(ds.attrs))
+
+    for name, var in variables.items():
+        sample, _ = samples[name]
+        dtype = sample.dtype.newbyteorder(">")
+        dim = var.dims[0] if var.ndim else None
+
+        async def fetch(block, var=var, dim=dim):
+            return await _load(var, None if block is None else {dim: block})
+
+        written = 0
+        stream = read_ahead(_blocks(var, dim), fetch, ahead=ahead)
+        async with contextlib.aclosing(stream):
+            async for _, block in stream:
+                data = _nc3_encode(name, block).data
+                if data.dtype != sample.dtype:
+                    raise ValueError(
+                        f"variable {name!r} encodes to {data.dtype} in one "
+                        f"block and {sample.dtype} in another"
+                    )
+                data = np.ascontiguousarray(data, dtype=dtype).tobytes()
+                written += len(data)
+                yield data
+        if written % 4:
+            yield b"\0" * (-written % 4)
@@ -1,5 +1,7 @@
 import asyncio
 import contextlib
+import itertools
+import math
 import os
 import sys
 
@@ -15,17 +17,52 @@ from xarray.backends.zarr import (
     _get_zarr_dims_and_attrs,
 )
 from xarray.core import indexing
+from xarray.core.indexes import PandasIndex
 from xarray.core.utils import FrozenDict
+from xarray.core.variable import calculate_dimensions
 
+from .file_manager import DATASET_CACHE, DatasetCache
+from .schema import SCHEMA_TEMPLATES, SchemaTemplate, decode_cf_variables
+from .zindex import read_coordinate_index
 from ..conventions import decode_cf_variable
 from ..core.variable import Variable
 from ..dataset import Dataset
-from ...zarr.convenience import open_consolidated
+from ... import tracing
+from ...zarr.convenience import consolidate_metadata, open_consolidated
+from ...zarr.core import get_many
+from ...zarr.storage import load_chunk_index
 
 sys.modules["xarray.conventions"].decode_cf_variable = decode_cf_variable
 
 
 class AsyncArrayWrapper(ZarrArrayWrapper):
+    def __init__(self, variable_name, datastore, array=None, meta=None):
+        self._array = array
+        if array is not None:
+            datastore._register_array(variable_name, array)
+        if meta is None:
+            super().__init__(variable_name, datastore)
+        else:
+            # shape and dtype from the consolidated metadata, the Array is
+            # only built on first access
+            self.datastore = datastore
+            self.variable_name = variable_name
+            self._meta = meta
+            self.shape = meta.shape
+            self.dtype = meta.dtype
+
+    def get_array(self):
+        # keep a single Array per variable so that per-array state such as
+        # fetch options and concurrency limits survives between selections
+        if self._array is None:
+            self._array = self.datastore._open_array(self.variable_name)
+        shape = getattr(self, "shape", None)
+        if shape is not None and self._array.shape != shape:
+            # grown by refreshing another dataset over the store: keep to the
+            # region this variable was opened with
+            self._array = self._array._with_shape(shape)
+        return self._array
+
     async def __array__(self, dtype=None):
         key = indexing.BasicIndexer((slice(None),) * self.ndim)
         return np.asarray(await self[key], dtype=dtype)
@@ -42,8 +79,44 @@ class AsyncArrayWrapper(ZarrArrayWrapper):
             assert isinstance(key, indexing.OuterIndexer)
             return await array.oindex[key.tuple]
 
+    def plan(self, key):
+        """The ``SelectionPlan`` of ``self[key]``, fetching nothing"""
+        array = self.get_array()
+        if isinstance(key, indexing.BasicIndexer):
+            return array.plan_selection(key.tuple)
+        elif isinstance(key, indexing.VectorizedIndexer):
+            return array.plan_selection(
+                indexing._arrayize_vectorized_indexer(key, self.shape).tuple,
+                mode="vindex",
+            )
+        else:
+            assert isinstance(key, indexing.OuterIndexer)
+            return array.plan_selection(key.tuple, mode="oindex")
+
 
 class AsyncStore(ZarrStore):
+    fetch_options = {}
+    decode_executor = None
+    chunk_cache = None
+    buffer_pool = None
+    chunk_index = None
+    schema_template = None
+    variables = None
+    lazy = False
+    coordinate_index = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # arrays handed out to variables, by name
+        self._arrays = {}
+        # variables whose Array has not been built yet, by name
+        self._lazy = {}
+        # names of the arrays in the store when last (re)loaded
+        self._known = set()
+        # what each ``refresh`` that found changes returned, in order; the
+        # datasets over this store may each have seen a different number
+        self._changes = []
+
     @classmethod
     async def open_group(
         cls,
@@ -59,6 +132,15 @@ class AsyncStore(ZarrStore):
         write_region=None,
         safe_chunks=True,
         stacklevel=2,
+        fetch_options=None,
+        decode_executor=None,
+        chunk_cache=None,
+        buffer_pool=None,
+        variables=None,
+        lazy=False,
+        coordinate_index=False,
+        chunk_index=False,
+        write_consolidated=False,
     ):
         if isinstance(store, os.PathLike):
             raise NotImplementedError("cannot do local storage zarr")
@@ -75,17 +157,20 @@ class AsyncStore(ZarrStore):
             if consolidated is None:
                 consolidated = False
 
-        if consolidated is None:
-            try:
+        with tracing.span("zarr.open_group", group=group or ""):
+            if consolidated is None:
+                try:
+                    zarr_group = await open_consolidated(store, **open_kwargs)
+                except KeyError:
+                    consolidated = False
+            elif consolidated:
+                # TODO: an option to pass the metadata_key keyword
                 zarr_group = await open_consolidated(store, **open_kwargs)
-            except KeyError:
-                raise NotImplementedError("not ready for non-consolidated stores")
-        elif consolidated:
-            # TODO: an option to pass the metadata_key keyword
-            zarr_group = await open_consolidated(store, **open_kwargs)
-        else:
-            raise NotImplementedError("not ready for non-consolidated stores")
-        return cls(
+            if consolidated is False:
+                zarr_group = await cls._open_crawled(
+                    store, open_kwargs, write_consolidated
+                )
+        zarr_store = cls(
             zarr_group,
             mode,
             consolidate_on_close,
@@ -93,6 +178,39 @@ class AsyncStore(ZarrStore):
             write_region,
             safe_chunks,
         )
+        if fetch_options:
+            zarr_store.fetch_options = dict(fetch_options)
+        zarr_store.decode_executor = decode_executor
+        zarr_store.chunk_cache = chunk_cache
+        zarr_store.buffer_pool = buffer_pool
+        if variables is not None:
+            zarr_store.variables = (
+                (variables,) if isinstance(variables, str) else tuple(variables)
+            )
+        zarr_store.lazy = lazy
+        if coordinate_index:
+            zarr_store.coordinate_index = await read_coordinate_index(
+                zarr_group.store.store, group
+            )
+        if chunk_index:
+            zarr_store.chunk_index = await load_chunk_index(zarr_group)
+        return zarr_store
+
+    @staticmethod
+    async def _open_crawled(store, open_kwargs, write_consolidated):
+        # a store that was never consolidated, from a crawl of its metadata
+        # documents; written back, the crawl covers the whole hierarchy so
+        # that the next open of any group is a single request
+        zarr_group = await open_consolidated(
+            store,
+            crawl=True,
+            crawl_path="" if write_consolidated else None,
+            **open_kwargs,
+        )
+        if write_consolidated:
+            await consolidate_metadata(zarr_group.store)
+            zarr_group.store.crawl = False
+        return zarr_group
 
     async def load(self):
         variables = FrozenDict(
@@ -103,20 +221,117 @@ class AsyncStore(ZarrStore):
         return variables, attributes
 
     async def get_variables(self):
-        return FrozenDict(
-            await asyncio.gather(
-                *[
-                    self.open_store_variable_with_key(k, v, k)
-                    for k, v in self.zarr_group.arrays()
-                ]
+        template = self.schema_template
+        arrays = {} if template is None else template.rebind(self)
+        variables = {}
+        for name in self._variable_names():
+            variables[name] = await self.open_store_variable(
+                name,
+                arrays.get(name),
+                preload=False,
+                spec=None if template is None else template.raw_spec(name),
             )
-        )
+        await self._preload(variables)
+        return FrozenDict(variables)
+
+    def _variable_names(self):
+        # the arrays to open: all of them, or the requested ones and their
+        # coordinates
+        names = list(self.zarr_group.array_keys())
+        self._known = set(names)
+        if self.variables is None:
+            return names
+        missing = set(self.variables) - self._known
+        if missing:
+            raise ValueError(f"variables {sorted(missing)} not found in the store")
+        wanted = set(self.variables)
+        for name in self.variables:
+            attrs = self._array_attrs(name)
+            wanted.update(attrs.get(DIMENSION_KEY, ()))
+            wanted.update(attrs.get("coordinates", "").split())
+        wanted.update(self.zarr_group.attrs.get("coordinates", "").split())
+        return [name for name in names if name in wanted]
+
+    def _array_metadata(self, name):
+        array_metadata = getattr(self.zarr_group.store, "array_metadata", None)
+        if array_metadata is None:
+            return None
+        return array_metadata(self.zarr_group._item_path(name))
 
-    async def open_store_variable_with_key(self, name, zarr_array, label):
-        return label, await self.open_store_variable(name, zarr_array)
+    def _array_attrs(self, name):
+        meta = self._array_metadata(name)
+        if meta is None:
+            return self.zarr_group[name].attrs.asdict()
+        return meta.attrs
 
-    async def open_store_variable(self, name, zarr_array):
-        data = AsyncArrayWrapper(name, self)
+    def _register_array(self, name, array):
+        array.set_fetch_options(**self.fetch_options)
+        array.set_decode_executor(self.decode_executor)
+        array.set_chunk_cache(self.chunk_cache)
+        array.set_buffer_pool(self.buffer_pool)
+        array.set_chunk_index(self.chunk_index)
+        self._arrays[name] = array
+        self._lazy.pop(name, None)
+
+    def _open_array(self, name):
+        array = self.zarr_group[name]
+        self._register_array(name, array)
+        return array
+
+    async def _preload(self, variables):
+        # load the small variables, or only the coordinates when lazy, with
+        # one batched request
+        names = [name for name, var in variables.items() if var.preloadable]
+        if self.lazy:
+            coords = set(self.zarr_group.attrs.get("coordinates", "").split())
+            for var in variables.values():
+                coords.update(var.dims)
+                coords.update(var.attrs.get("coordinates", "").split())
+            names = [name for name in names if name in coords]
+        if self.coordinate_index:
+            # coordinates stored as an exact regular grid need no request
+            fetch = []
+            for name in names:
+                var = variables[name]
+                index = self.coordinate_index.get(name)
+                values = None
+                if index is not None and var.shape == (index.size,):
+                    values = index.raw_values()
+                if values is not None and values.dtype == var.dtype:
+                    var._data = values
+                else:
+                    fetch.append(name)
+            names = fetch
+        values = await get_many([variables[name]._data.get_array() for name in names])
+        for name, value in zip(names, values):
+            variables[name]._data = np.asarray(value)
+
+    async def open_store_variable(self, name, zarr_array=None, preload=True, spec=None):
+        meta = None
+        if zarr_array is None:
+            meta = self._array_metadata(name) if self.lazy else None
+            if meta is None or DIMENSION_KEY not in meta.attrs:
+                meta = None
+                zarr_array = self._arrays.get(name)
+                if zarr_array is None:
+                    zarr_array = self._open_array(name)
+        if meta is not None:
+            data = self._lazy[name] = AsyncArrayWrapper(name, self, meta=meta)
+        else:
+            data = AsyncArrayWrapper(name, self, zarr_array)
+        if spec is not None:
+            # dimensions, attributes and encoding from a schema template
+            dimensions, attributes, encoding = spec
+        else:
+            dimensions, attributes, encoding = self._variable_spec(
+                zarr_array if meta is None else meta
+            )
+        variable = Variable(dimensions, data, attributes, encoding)
+        if preload:
+            await variable.maybe_preload()
+        return variable
+
+    def _variable_spec(self, zarr_array):
         try_nczarr = self._mode == "r"
         dimensions, attributes = _get_zarr_dims_and_attrs(
             zarr_array, DIMENSION_KEY, try_nczarr
@@ -132,10 +347,128 @@ class AsyncStore(ZarrStore):
         # picked up by decode_cf
         if getattr(zarr_array, "fill_value") is not None:
             attributes["_FillValue"] = zarr_array.fill_value
+        return dimensions, attributes, encoding
 
-        variable = Variable(dimensions, data, attributes, encoding)
-        await variable.maybe_preload()
-        return variable
+    async def refresh(self):
+        """Re-read the consolidated metadata.
+
+        Returns a mapping of the name of every array whose shape or attributes
+        changed to its previous shape, ``None`` for arrays that are new.
+        """
+        await self.zarr_group.store.reload()
+        self.zarr_group.attrs.refresh()
+        if self.chunk_index is not None:
+            # chunks may have been written anywhere
+            self.chunk_index = await load_chunk_index(self.zarr_group)
+            for array in self._arrays.values():
+                array.set_chunk_index(self.chunk_index)
+        changed = {}
+        for name in self.zarr_group.array_keys():
+            if name not in self._known:
+                self._known.add(name)
+                if self.variables is None:
+                    changed[name] = None
+                continue
+            if name in self._lazy:
+                meta = self._lazy[name]._meta
+                new = self._array_metadata(name)
+                if new.shape != meta.shape or new.attrs != meta.attrs:
+                    array = self._open_array(name)
+                    await _drop_stale_chunks(array, meta.shape)
+                    changed[name] = meta.shape
+                continue
+            array = self._arrays.get(name)
+            if array is None:
+                # left out by ``variables``
+                continue
+            shape = array.shape
+            attrs = array.attrs.asdict()
+            array._load_metadata()
+            array.attrs.refresh()
+            if array.shape != shape or array.attrs.asdict() != attrs:
+                array._invalidate_cached_chunks()
+                await _drop_stale_chunks(array, shape)
+                changed[name] = shape
+        if changed:
+            self._changes.append(changed)
+        return changed
+
+    async def refresh_dataset(self, ds, drop_variables=None, **decode_kwargs):
+        """Patch ``ds``, opened from this store, in place with the arrays that
+        grew, changed or appeared since it was opened.
+
+        Dimension coordinates that only grew along their dimension are
+        extended by fetching just the appended values, and their indexes are
+        rebuilt from the values already loaded plus the new ones.
+        """
+        await self.refresh()
+        # all changes since ``ds`` was opened or last refreshed, some maybe
+        # picked up already by refreshing another dataset over this store
+        changed = {}
+        for changes in self._changes[ds._store_version :]:
+            for name, shape in changes.items():
+                changed.setdefault(name, shape)
+        ds._store_version = len(self._changes)
+        drop_variables = drop_variables or ()
+        for name, shape in changed.items():
+            if name in drop_variables:
+                continue
+            array = self._arrays.get(name)
+            if (
+                shape is not None
+                and name in ds.xindexes
+                and len(shape) == 1
+                and array.shape[0] > shape[0]
+            ):
+                var = await self.open_store_variable(name, array, preload=False)
+                appended = decode_cf_variable(
+                    name,
+                    Variable(
+                        var.dims, await array[shape[0] :], var.attrs, var.encoding
+                    ),
+                    **decode_kwargs,
+                )
+                old = ds._variables[name]
+                var = Variable(
+                    old.dims,
+                    np.concatenate([old.values, appended.values]),
+                    old.attrs,
+                    old.encoding,
+                )
+                index = PandasIndex.from_variables({name: var}, options={})
+                ds._indexes[name] = index
+                ds._variables.update(index.create_variables({name: var}))
+            else:
+                # on a lazy store the variable stays described by its
+                # metadata, its Array built and its data read on first access
+                var = await self.open_store_variable(
+                    name, None if self.lazy else array, preload=not self.lazy
+                )
+                ds._variables[name] = decode_cf_variable(name, var, **decode_kwargs)
+        ds._dims = calculate_dimensions(ds._variables)
+        ds._attrs = dict(self.get_attrs())
+        return ds
+
+
+async def _drop_stale_chunks(array, old_shape):
+    # an append rewrites the chunks that were partial along the old edges of
+    # an array that grew: drop local copies of them held by the filesystem,
+    # see ``AsyncSimpleCacheFileSystem.invalidate``
+    mapping = array._chunk_mapping
+    invalidate = getattr(getattr(mapping, "fs", None), "invalidate", None)
+    if invalidate is None or len(old_shape) != array.ndim:
+        return
+    old_grid = [math.ceil(s / c) for s, c in zip(old_shape, array.chunks)]
+    coords = set()
+    for axis, (old, new, size) in enumerate(zip(old_shape, array.shape, array.chunks)):
+        if new > old and old % size:
+            ranges = [range(n) for n in old_grid]
+            ranges[axis] = [old_grid[axis] - 1]
+            coords.update(itertools.product(*ranges))
+    if coords:
+        await invalidate(
+            [mapping._key_to_str(array._chunk_key(c)) for c in sorted(coords)]
+        )
 
 
 class AsyncStoreBackendEntrypoint(StoreBackendEntrypoint):
@@ -150,29 +483,92 @@ class AsyncStoreBackendEntrypoint(StoreBackendEntrypoint):
         drop_variables=None,
         use_cftime=None,
         decode_timedelta=None,
+        schema_templates=None,
+        group=None,
     ):
-        vars, attrs = await store.load()
-        encoding = store.get_encoding()
-
-        vars, attrs, coord_names = conventions.decode_cf_variables(
-            vars,
-            attrs,
+        decode_kwargs = dict(
             mask_and_scale=mask_and_scale,
             decode_times=decode_times,
             concat_characters=concat_characters,
-            decode_coords=decode_coords,
-            drop_variables=drop_variables,
             use_cftime=use_cftime,
             decode_timedelta=decode_timedelta,
         )
+        if schema_templates is None:
+            vars, attrs = await store.load()
+            vars, attrs, coord_names = conventions.decode_cf_variables(
+                vars,
+                attrs,
+                decode_coords=decode_coords,
+                drop_variables=drop_variables,
+                **decode_kwargs,
+            )
+        else:
+            vars, attrs, coord_names = await self._decode_with_template(
+                store,
+                schema_templates,
+                group,
+                decode_kwargs,
+                decode_coords=decode_coords,
+                drop_variables=drop_variables,
+            )
+        encoding = store.get_encoding()
 
         ds = Dataset(vars, attrs=attrs)
         ds = ds.set_coords(coord_names.intersection(vars))
         ds.set_close(store.close)
         ds.encoding = encoding
+        ds._datastore = store
+        ds._coordinate_index = store.coordinate_index
+        ds._store_version = len(store._changes)
+        ds._decode_kwargs = dict(
+            mask_and_scale=mask_and_scale,
+            decode_times=decode_times,
+            concat_characters=concat_characters,
+            drop_variables=drop_variables,
+            use_cftime=use_cftime,
+            decode_timedelta=decode_timedelta,
+        )
 
         return ds
 
+    async def _decode_with_template(
+        self, store, templates, group, decode_kwargs, decode_coords, drop_variables
+    ):
+        key = templates.key(
+            store,
+            group,
+            dict(
+                decode_kwargs,
+                decode_coords=decode_coords,
+                drop=drop_variables,
+                variables=store.variables,
+            ),
+        )
+        template, record = await templates.acquire(key)
+        if template is not None:
+            store.schema_template = template
+            vars, attrs = await store.load()
+            return template.decode(vars, attrs, decode_coords=decode_coords)
+
+        template = None
+        try:
+            vars, attrs = await store.load()
+            new_vars, attrs, coord_names, var_coord_names = decode_cf_variables(
+                vars,
+                attrs,
+                decode_coords=decode_coords,
+                drop_variables=drop_variables,
+                **decode_kwargs,
+            )
+            if record:
+                template = SchemaTemplate(
+                    store, vars, new_vars, var_coord_names, decode_kwargs
+                )
+        finally:
+            if record:
+                templates.release(key, template)
+        return new_vars, attrs, coord_names
+
 
 class AsyncZarrBackendEntrypint(ZarrBackendEntrypoint):
     async def open_dataset(
@@ -192,8 +588,91 @@ class AsyncZarrBackendEntrypint(ZarrBackendEntrypoint):
         chunk_store=None,
         storage_options=None,
         stacklevel=3,
+        fetch_options=None,
+        decode_executor=None,
+        chunk_cache=None,
+        buffer_pool=None,
+        cache=False,
+        schema_templates=None,
+        variables=None,
+        lazy=False,
+        coordinate_index=False,
+        chunk_index=False,
+        write_consolidated=False,
     ):
+        """Open a zarr store as an async Dataset.
+
+        With ``cache=True`` (or a ``DatasetCache``) the opened dataset is
+        kept in the process-wide ``DATASET_CACHE`` (or the given cache) and
+        returned, as a shallow copy, to later calls with the same store and
+        arguments until the store's metadata changes.
+
+        With ``schema_templates=True`` (or a ``SchemaTemplateCache``) stores
+        whose array metadata matches one opened before reuse its parsed zarr
+        arrays and CF decoding, see ``SchemaTemplate``.
+
+        ``variables`` opens only the named variables and their coordinates.
+        With ``lazy=True`` the zarr arrays of data variables are built on
+        first access and only coordinates are loaded at open time. Small
+        variables are loaded with one batched request either way.
+
+        ``coordinate_index=True`` reads the store's ``.zindex`` sidecar, see
+        ``zindex.write_coordinate_index``, if there is one. ``_sel`` with
+        ``method="nearest"`` then resolves labels from it, and coordinates
+        that are an exact regular grid on disk are not fetched.
+
+        ``buffer_pool``, a ``BufferPool``, supplies the output arrays of
+        selections and the scratch space for decoding chunks only partly
+        selected. Outputs go back to the pool with ``buffer_pool.release``.
+
+        ``chunk_index=True`` finds out which chunks exist, from bitmaps in
+        the consolidated metadata, see ``storage.write_chunk_index``, or else
+        by listing the store once, and fills missing chunks without a
+        request. The index is rebuilt when the dataset is refreshed.
+
+        Stores without consolidated metadata, or any store with
+        ``consolidated=False``, are opened from a crawl of their metadata
+        documents, see ``storage.crawl_metadata``. ``write_consolidated=True``
+        writes the crawled metadata back as ``.zmetadata``, so that the next
+        open is a single request.
+        """
         filename_or_obj = _normalize_path(filename_or_obj)
+        if schema_templates is True:
+            schema_templates = SCHEMA_TEMPLATES
+        if cache is True:
+            cache = DATASET_CACHE
+        if isinstance(cache, DatasetCache):
+            open_kwargs = dict(
+                mask_and_scale=mask_and_scale,
+                decode_times=decode_times,
+                concat_characters=concat_characters,
+                decode_coords=decode_coords,
+                drop_variables=drop_variables,
+                use_cftime=use_cftime,
+                decode_timedelta=decode_timedelta,
+                group=group,
+                mode=mode,
+                synchronizer=synchronizer,
+                consolidated=consolidated,
+                chunk_store=chunk_store,
+                storage_options=storage_options,
+                fetch_options=fetch_options,
+                decode_executor=decode_executor,
+                chunk_cache=chunk_cache,
+                buffer_pool=buffer_pool,
+                schema_templates=schema_templates,
+                variables=variables,
+                lazy=lazy,
+                coordinate_index=coordinate_index,
+                chunk_index=chunk_index,
+                write_consolidated=write_consolidated,
+            )
+            return await cache.open(
+                filename_or_obj,
+                open_kwargs,
+                lambda: self.open_dataset(filename_or_obj, **open_kwargs),
+            )
+
         store = await AsyncStore.open_group(
             filename_or_obj,
             group=group,
@@ -204,6 +683,15 @@ class AsyncZarrBackendEntrypint(ZarrBackendEntrypoint):
             chunk_store=chunk_store,
             storage_options=storage_options,
             stacklevel=stacklevel + 1,
+            fetch_options=fetch_options,
+            decode_executor=decode_executor,
+            chunk_cache=chunk_cache,
+            buffer_pool=buffer_pool,
+            variables=variables,
+            lazy=lazy,
+            coordinate_index=coordinate_index,
+            chunk_index=chunk_index,
+            write_consolidated=write_consolidated,
         )
 
         store_entrypoint = AsyncStoreBackendEntrypoint()
@@ -217,6 +705,8 @@ class AsyncZarrBackendEntrypint(ZarrBackendEntrypoint):
                 drop_variables=drop_variables,
                 use_cftime=use_cftime,
                 decode_timedelta=decode_timedelta,
+                schema_templates=schema_templates,
+                group=group,
             )
         return ds
 
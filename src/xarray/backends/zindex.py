@@ -0,0 +1,254 @@
+"""Sidecar index of the dimension coordinates of a zarr store.
+
+The sidecar is a small JSON object, ``.zindex`` next to ``.zmetadata``,
+describing every 1-D dimension coordinate: its size, whether it is sorted,
+and for sorted coordinates either the start and step of a regular grid or
+the edges of the bins around each value. It lets ``Dataset._sel`` with
+``method="nearest"`` map labels to positions arithmetically or by bisection
+instead of going through pandas indexes, and lets coordinates that are an
+exact regular grid on disk be rebuilt without fetching them.
+
+Write one for an existing store with::
+
+    python -m src.xarray.backends.zindex s3://bucket/store.zarr
+"""
+
+import asyncio
+import json
+
+import numpy as np
+
+INDEX_KEY = ".zindex"
+INDEX_FORMAT = 1
+
+
+class CoordinateIndex:
+    """What the sidecar knows about one dimension coordinate.
+
+    Values are compared as float64, datetimes and timedeltas as int64
+    nanoseconds.
+    """
+
+    __slots__ = ("size", "dtype", "monotonic", "start", "step", "edges", "raw")
+
+    def __init__(
+        self, size, dtype, monotonic=None, start=None, step=None, edges=None, raw=None
+    ):
+        self.size = size
+        self.dtype = np.dtype(dtype)
+        self.monotonic = monotonic
+        self.start = start
+        self.step = step
+        self.edges = None if edges is None else np.asarray(edges)
+        # start and step that rebuild the encoded values on disk exactly
+        self.raw = raw
+
+    @classmethod
+    def from_values(cls, values, raw_values=None):
+        values = np.asarray(values)
+        keys = _as_keys(values)
+        index = cls(len(values), values.dtype)
+        if len(keys) > 1 and not np.isnan(keys).any():
+            diff = np.diff(keys)
+            if (diff > 0).all():
+                index.monotonic = "increasing"
+            elif (diff < 0).all():
+                index.monotonic = "decreasing"
+        if index.monotonic is not None:
+            step = (keys[-1] - keys[0]) / (len(keys) - 1)
+            if np.allclose(diff, step, rtol=1e-9, atol=0):
+                index.start, index.step = keys[0].item(), step.item()
+            else:
+                index.edges = (keys[:-1] + keys[1:]) / 2
+        if raw_values is not None and len(raw_values) > 1:
+            raw_values = np.asarray(raw_values)
+            start, step = raw_values[0], raw_values[1] - raw_values[0]
+            if np.array_equal(start + step * np.arange(len(raw_values)), raw_values):
+                index.raw = {
+                    "start": start.item(),
+                    "step": step.item(),
+                    "dtype": raw_values.dtype.str,
+                }
+        return index
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(
+            d["size"],
+            d["dtype"],
+            d.get("monotonic"),
+            d.get("start"),
+            d.get("step"),
+            d.get("edges"),
+            d.get("raw"),
+        )
+
+    def to_dict(self):
+        return {
+            "size": self.size,
+            "dtype": self.dtype.str,
+            "monotonic": self.monotonic,
+            "start": self.start,
+            "step": self.step,
+            "edges": None if self.edges is None else self.edges.tolist(),
+            "raw": self.raw,
+        }
+
+    def raw_values(self):
+        """The encoded values on disk, if they are an exact regular grid"""
+        if self.raw is None:
+            return None
+        dtype = np.dtype(self.raw["dtype"])
+        return (self.raw["start"] + self.raw["step"] * np.arange(self.size)).astype(
+            dtype
+        )
+
+    def nearest(self, labels):
+        """Positions of the values nearest to ``labels``, breaking ties as
+        pandas does, or ``None`` if the coordinate is not sorted"""
+        if self.monotonic is None:
+            return None
+        labels = np.asarray(labels)
+        if self.dtype.kind in "mM":
+            labels = labels.astype(self.dtype)
+        # numeric labels are compared as they are: cast to an integer
+        # coordinate's dtype, 0.7 would be truncated to 0 instead of nearest 1
+        keys = _as_keys(labels)
+        if self.start is not None:
+            pos = (keys - self.start) / self.step
+            if self.monotonic == "increasing":
+                # a label halfway between two values goes to the larger one
+                pos = np.floor(pos + 0.5)
+            else:
+                pos = np.ceil(pos - 0.5)
+        elif self.monotonic == "increasing":
+            pos = np.searchsorted(self.edges, keys, side="right")
+        else:
+            pos = np.searchsorted(-self.edges, -keys, side="left")
+        return np.clip(pos, 0, self.size - 1).astype(np.intp)
+
+
+class CoordinateIndexes(dict):
+    """The parsed sidecar: a ``CoordinateIndex`` per coordinate name"""
+
+    @classmethod
+    def from_json(cls, blob):
+        meta = json.loads(blob)
+        if meta.get("zarr_index_format") != INDEX_FORMAT:
+            raise ValueError(
+                "unsupported coordinate index format: %s"
+                % meta.get("zarr_index_format")
+            )
+        return cls(
+            (name, CoordinateIndex.from_dict(d))
+            for name, d in meta["coordinates"].items()
+        )
+
+    def to_json(self):
+        return json.dumps(
+            {
+                "zarr_index_format": INDEX_FORMAT,
+                "coordinates": {name: idx.to_dict() for name, idx in self.items()},
+            },
+            indent=2,
+        ).encode()
+
+    def isel_indexers(self, ds, indexers):
+        """Translate nearest-neighbour ``sel`` indexers into ``isel`` ones, or
+        return ``None`` if any of them needs the regular indexing path"""
+        result = {}
+        for name, labels in indexers.items():
+            index = self.get(name)
+            if (
+                index is None
+                or name not in ds.dims
+                or ds.sizes[name] != index.size
+                or isinstance(labels, slice)
+                or np.ndim(labels) > 1
+                or hasattr(labels, "dims")
+            ):
+                return None
+            pos = index.nearest(labels)
+            if pos is None:
+                return None
+            result[name] = pos.item() if np.ndim(labels) == 0 else pos
+        return result
+
+
+def _as_keys(values):
+    if values.dtype.kind in "mM":
+        return values.astype("m8[ns]" if values.dtype.kind == "m" else "M8[ns]").view(
+            "i8"
+        )
+    return values.astype("f8")
+
+
+def _group_prefix(group):
+    return f"{group.strip('/')}/" if group else ""
+
+
+async def read_coordinate_index(store, group=None):
+    """Read the sidecar of the zarr ``store``, ``None`` if there is none"""
+    try:
+        blob = await store[_group_prefix(group) + INDEX_KEY]
+    except KeyError:
+        return None
+    return CoordinateIndexes.from_json(blob)
+
+
+async def build_coordinate_index(ds):
+    """Build the sidecar of a dataset opened by ``AsyncZarrBackendEntrypint``"""
+    store = ds._datastore
+    indexes = CoordinateIndexes()
+    for name in ds.dims:
+        if name not in ds.xindexes or ds[name].ndim != 1:
+            continue
+        array = store._arrays.get(name)
+        if array is None:
+            array = store._open_array(name)
+        indexes[name] = CoordinateIndex.from_values(
+            ds[name].values, np.asarray(await array[...])
+        )
+    return indexes
+
+
+async def write_coordinate_index(mapping, group=None, **open_kwargs):
+    """Build the sidecar for the zarr store in ``mapping`` and write it
+    there. Returns the ``CoordinateIndexes`` written."""
+    from .zarr import AsyncZarrBackendEntrypint
+
+    open_kwargs.setdefault("lazy", True)
+    ds = await AsyncZarrBackendEntrypint().open_dataset(
+        mapping, group=group, **open_kwargs
+    )
+    indexes = await build_coordinate_index(ds)
+    await mapping.__setitem__(_group_prefix(group) + INDEX_KEY, indexes.to_json())
+    return indexes
+
+
+def main(argv=None):
+    import argparse
+
+    import fsspec
+
+    from ...fsspec.mapping.mapper import AsyncFSMap
+
+    parser = argparse.ArgumentParser(
+        description="Write the coordinate index sidecar of a consolidated zarr store"
+    )
+    parser.add_argument("url")
+    parser.add_argument("--group", default=None)
+    args = parser.parse_args(argv)
+
+    async def run():
+        fs, path = fsspec.core.url_to_fs(args.url, asynchronous=True)
+        indexes = await write_coordinate_index(AsyncFSMap(path, fs), group=args.group)
+        for name, index in indexes.items():
+            kind = "regular" if index.start is not None else index.monotonic
+            print(f"{name}: {index.size} values, {kind}")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import copy
+from asyncio import iscoroutinefunction
+
+import numpy as np
+from xarray.core import indexing
+
+
+def is_async_array(data):
+    return iscoroutinefunction(getattr(type(data), "__getitem__", None))
+
+
+def _has_async_array(data):
+    while data is not None:
+        if is_async_array(data):
+            return True
+        data = getattr(data, "array", None)
+    return False
+
+
+def plan(data, key):
+    """The ``SelectionPlan`` of ``getitem(data, key)``, following the key
+    down the wrappers in the same way, or ``None`` for data that is not
+    backed by an async array"""
+    if is_async_array(data):
+        return data.plan(key)
+    if not _has_async_array(data):
+        return None
+    if isinstance(data, indexing.LazilyIndexedArray):
+        if isinstance(key, indexing.VectorizedIndexer):
+            return plan(data.array, data.key)
+        return plan(data.array, data._updated_key(key))
+    return plan(data.array, key)
+
+
+async def getitem(data, key):
+    """``as_indexable(data)[key]`` for data that may be backed by an async
+    array, possibly under the lazy wrappers added by CF decoding.
+
+    The key is pushed down to the async array so that only the selected
+    values are fetched, and the wrappers are then applied to them.
+    """
+    if is_async_array(data):
+        return await data[key]
+    if not _has_async_array(data):
+        return indexing.as_indexable(data)[key]
+    if isinstance(data, indexing.LazilyIndexedArray):
+        if isinstance(key, indexing.VectorizedIndexer):
+            values = await getitem(data.array, data.key)
+            return indexing.NumpyIndexingAdapter(np.asarray(values))[key]
+        return await getitem(data.array, data._updated_key(key))
+    # elementwise wrappers such as masking, scaling or byte stacking, which
+    # pass the key through to the array they wrap
+    values = await getitem(data.array, key)
+    wrapper = copy.copy(data)
+    wrapper.array = indexing.NumpyIndexingAdapter(np.asarray(values))
+    return np.asarray(wrapper[indexing.BasicIndexer((slice(None),) * wrapper.ndim)])
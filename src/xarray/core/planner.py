@@ -0,0 +1,137 @@
+"""Cost of a selection of an async Dataset, worked out before running it.
+
+``Dataset._plan`` resolves the indexers of ``_sel`` or ``_isel`` as they
+would, pushes the resulting keys down to the zarr arrays and counts the
+chunks, requests and bytes each variable would fetch, without fetching any
+data. A ``Budget`` passed to ``_sel`` or ``_isel`` is checked against that
+plan, and an over-budget selection raises ``BudgetExceededError`` before a
+single chunk is requested.
+"""
+
+
+class QueryPlan:
+    """``SelectionPlan`` of each variable a selection fetches, by name"""
+
+    def __init__(self, dims, plans):
+        # indexed dimension names
+        self.dims = tuple(dims)
+        self.plans = dict(plans)
+
+    def __repr__(self):
+        return (
+            f"QueryPlan(variables={len(self.plans)}, chunks={self.chunks}, "
+            f"requests={self.requests}, nbytes={self.nbytes}, memory={self.memory})"
+        )
+
+    @property
+    def chunks(self):
+        return sum(p.chunks for p in self.plans.values())
+
+    @property
+    def requests(self):
+        return sum(p.requests for p in self.plans.values())
+
+    @property
+    def nbytes(self):
+        """Bytes to fetch, from stored chunk sizes where known and decoded
+        chunk sizes elsewhere"""
+        return sum(p.nbytes for p in self.plans.values())
+
+    @property
+    def exact(self):
+        """Whether ``nbytes`` only counts stored chunk sizes"""
+        return all(p.stored_nbytes is not None for p in self.plans.values())
+
+    @property
+    def memory(self):
+        """Size of the decoded result, in bytes"""
+        return sum(p.memory for p in self.plans.values())
+
+    def explain(self):
+        """The plan as a table, one row per variable"""
+        rows = [("variable", "shape", "chunks", "skipped", "cached", "bytes", "memory")]
+        for name, p in self.plans.items():
+            nbytes = _format_bytes(p.nbytes)
+            if p.stored_nbytes is None:
+                nbytes = f"<={nbytes}"
+            rows.append(
+                (
+                    str(name),
+                    "x".join(map(str, p.shape)) or "()",
+                    str(p.chunks),
+                    str(p.skipped),
+                    str(p.cached),
+                    nbytes,
+                    _format_bytes(p.memory),
+                )
+            )
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        lines = [
+            "  ".join(
+                c.ljust(w) if i == 0 else c.rjust(w)
+                for i, (c, w) in enumerate(zip(row, widths))
+            )
+            for row in rows
+        ]
+        lines.append(
+            f"total: {self.chunks} chunks in {self.requests} requests, "
+            f"{'' if self.exact else '<='}{_format_bytes(self.nbytes)} fetched, "
+            f"{_format_bytes(self.memory)} in memory"
+        )
+        return "\n".join(lines)
+
+
+class BudgetExceededError(ValueError):
+    """A selection would fetch more than its ``Budget`` allows"""
+
+    def __init__(self, message, plan):
+        super().__init__(message)
+        self.plan = plan
+
+
+class Budget:
+    """Limits on what a single selection may fetch: chunks, requests, bytes
+    (see ``QueryPlan.nbytes``) and result memory. ``None`` is no limit."""
+
+    __slots__ = ("chunks", "requests", "nbytes", "memory")
+
+    def __init__(self, chunks=None, requests=None, nbytes=None, memory=None):
+        self.chunks = chunks
+        self.requests = requests
+        self.nbytes = nbytes
+        self.memory = memory
+
+    def __repr__(self):
+        limits = ", ".join(
+            f"{name}={getattr(self, name)}"
+            for name in self.__slots__
+            if getattr(self, name) is not None
+        )
+        return f"Budget({limits})"
+
+    @classmethod
+    def from_value(cls, value):
+        """A ``Budget`` from a ``Budget`` or a mapping of its limits"""
+        if value is None or isinstance(value, cls):
+            return value
+        return cls(**value)
+
+    def check(self, plan):
+        """Raise ``BudgetExceededError`` if ``plan`` goes over a limit"""
+        for name in self.__slots__:
+            limit = getattr(self, name)
+            if limit is not None and getattr(plan, name) > limit:
+                raise BudgetExceededError(
+                    f"selection over budget: {name} {getattr(plan, name)} > "
+                    f"{limit}\n{plan.explain()}",
+                    plan,
+                )
+        return plan
+
+
+def _format_bytes(n):
+    for unit in ("B", "kB", "MB", "GB"):
+        if n < 1000 or unit == "GB":
+            break
+        n /= 1000
+    return f"{n:.0f}{unit}" if unit == "B" else f"{n:.1f}{unit}"
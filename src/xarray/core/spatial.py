@@ -0,0 +1,95 @@
+import asyncio
+
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # pragma: no cover
+    cKDTree = None
+
+_LATITUDE_UNITS = ("degrees_north", "degree_north", "degree_N", "degrees_N")
+_LONGITUDE_UNITS = ("degrees_east", "degree_east", "degree_E", "degrees_E")
+
+
+def _to_xyz(lat, lon):
+    # points on the unit sphere, where the nearest point by chord length is
+    # the nearest by great circle distance
+    lat = np.deg2rad(np.asarray(lat, dtype="f8"))
+    lon = np.deg2rad(np.asarray(lon, dtype="f8"))
+    cos_lat = np.cos(lat)
+    return np.stack(
+        [cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1
+    )
+
+
+class SphericalKDTree:
+    """Nearest grid point lookup on a curvilinear grid.
+
+    A KD-tree of the grid points placed on the unit sphere, built from 2-D
+    latitude and longitude arrays in degrees sharing the dimensions
+    ``dims``.
+    """
+
+    def __init__(self, lat, lon, dims):
+        if cKDTree is None:
+            raise ModuleNotFoundError(
+                "nearest neighbour selection on 2-D coordinates requires scipy"
+            )
+        lat = np.asarray(lat)
+        self.dims = tuple(dims)
+        self.shape = lat.shape
+        self.tree = cKDTree(_to_xyz(lat, lon).reshape(-1, 3))
+
+    def query(self, lat, lon):
+        """Return the grid indices along ``dims`` of the points nearest to
+        each ``lat``, ``lon`` pair, with the shape of the queries"""
+        _, flat = self.tree.query(_to_xyz(*np.broadcast_arrays(lat, lon)))
+        return np.unravel_index(flat, self.shape)
+
+
+def is_latitude(name, var):
+    return (
+        var.attrs.get("standard_name") == "latitude"
+        or var.attrs.get("units") in _LATITUDE_UNITS
+        or str(name).lower().startswith("lat")
+    )
+
+
+def is_longitude(name, var):
+    return (
+        var.attrs.get("standard_name") == "longitude"
+        or var.attrs.get("units") in _LONGITUDE_UNITS
+        or str(name).lower().startswith("lon")
+    )
+
+
+def curvilinear_pair(ds, names):
+    """Return the names of the 2-D latitude and longitude coordinates of
+    ``ds`` among ``names``, or ``None`` if they are not both there"""
+    lat = lon = None
+    for name in names:
+        var = ds._variables.get(name)
+        if var is None or var.ndim != 2 or name in ds._indexes:
+            continue
+        if is_latitude(name, var):
+            lat = name
+        elif is_longitude(name, var):
+            lon = name
+    if lat is None or lon is None or ds._variables[lat].dims != ds._variables[lon].dims:
+        return None
+    return lat, lon
+
+
+async def build_tree(lat, lon):
+    """Build a ``SphericalKDTree`` from the possibly lazy variables ``lat``
+    and ``lon``, in the loop's default executor"""
+    values = []
+    for var in (lat, lon):
+        if not hasattr(var, "__agetitem__"):
+            values.append(var.values)
+        else:
+            values.append(
+                np.asarray((await var.__agetitem__((slice(None),) * var.ndim)).data)
+            )
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, SphericalKDTree, *values, lat.dims)
@@ -1,13 +1,24 @@
+import contextlib
+import itertools
 from asyncio import iscoroutinefunction
-from typing import Any
+from typing import Any, Iterable
 
 import numpy as np
 from xarray.core import variable
 
+from ...zarr.util import read_ahead
+from .indexing import getitem, plan
+
 
 class Variable(variable.Variable):
+    @property
+    def preloadable(self):
+        return self.size < 1e5 and iscoroutinefunction(
+            getattr(self._data, "__array__", None)
+        )
+
     async def maybe_preload(self):
-        if self.size < 1e5 and iscoroutinefunction(getattr(self._data, "__array__")):
+        if self.preloadable:
             self._data = await self._data.__array__()
 
     @property
@@ -36,6 +47,17 @@ class Variable(variable.Variable):
         key = tuple(indexers.get(dim, slice(None)) for dim in self.dims)
         return await self.__agetitem__(key)
 
+    def _plan(self, indexers):
+        """The ``SelectionPlan`` of ``_isel(indexers)``, or ``None`` if that
+        fetches nothing. ``memory`` is the size of the decoded result."""
+        indexers = variable.drop_dims_from_indexers(indexers, self.dims, "ignore")
+        key = tuple(indexers.get(dim, slice(None)) for dim in self.dims)
+        _, indexer, _ = self._broadcast_indexes(key)
+        result = plan(self._data, indexer)
+        if result is not None:
+            result.memory = int(np.prod(result.shape)) * self.dtype.itemsize
+        return result
+
     async def __agetitem__(self, key):
         """Return a new Variable object whose contents are consistent with
         getting the provided key from the underlying data.
@@ -50,7 +72,140 @@ class Variable(variable.Variable):
         array `x.values` directly.
         """
         dims, indexer, new_order = self._broadcast_indexes(key)
-        data = await self._data[indexer]
+        data = await getitem(self._data, indexer)
         if new_order:
             data = np.moveaxis(data, range(len(new_order)), new_order)
         return self._finalize_indexing_result(dims, data)
+
+    async def iter_blocks(self, dim, ahead=1, ordered=True):
+        """Asynchronously iterate over the blocks of this variable one chunk
+        long along ``dim``, yielding ``(slice, Variable)`` with the position
+        of each block along ``dim``.
+
+        Blocks follow the chunks of the store, from ``encoding``, and are
+        decoded like the variable. ``ahead`` blocks are fetched in advance,
+        so that at most ``ahead + 1`` are held at a time. With
+        ``ordered=False`` blocks are yielded as they arrive. Use
+        ``contextlib.aclosing`` to stop the fetches in flight when leaving
+        the loop early.
+        """
+
+        def fetch(block):
+            return self._isel({dim: block})
+
+        blocks = read_ahead(
+            self._chunk_slices(self.get_axis_num(dim)),
+            fetch,
+            ahead=ahead,
+            ordered=ordered,
+        )
+        async with contextlib.aclosing(blocks):
+            async for block, var in blocks:
+                yield block, var
+
+    def _chunk_slices(self, axis):
+        # the slices of the store chunks along ``axis``, from ``encoding``
+        size = self.shape[axis]
+        chunks = self.encoding.get("preferred_chunks", {}).get(self.dims[axis])
+        if chunks is None and "chunks" in self.encoding:
+            chunks = self.encoding["chunks"][axis]
+        chunks = chunks or size or 1
+        return [slice(lo, min(lo + chunks, size)) for lo in range(0, size, chunks)]
+
+    async def _reduce(self, op, dim=None, ahead=4):
+        """Reduce over ``dim`` (all dimensions by default) with ``op``, one of
+        ``"sum"``, ``"mean"``, ``"min"``, ``"max"`` or ``"count"``, skipping
+        NaN, including values masked by CF decoding.
+
+        Chunks are fetched ``ahead`` at a time, folded into the result as
+        they arrive and dropped, so that memory use scales with the chunk
+        and result sizes rather than with the variable.
+        """
+        if dim is None:
+            dims = self.dims
+        elif isinstance(dim, str) or not isinstance(dim, Iterable):
+            dims = (dim,)
+        else:
+            dims = tuple(dim)
+        axes = tuple(self.get_axis_num(d) for d in dims)
+        kept = [i for i in range(self.ndim) if i not in axes]
+        reduction = _StreamingReduction(
+            op, tuple(self.shape[i] for i in kept), self.dtype
+        )
+
+        async def fetch(key):
+            return np.asarray((await self.__agetitem__(key)).data)
+
+        blocks = read_ahead(
+            itertools.product(*(self._chunk_slices(i) for i in range(self.ndim))),
+            fetch,
+            ahead=ahead,
+            ordered=False,
+        )
+        async with contextlib.aclosing(blocks):
+            async for key, data in blocks:
+                reduction.fold(tuple(key[i] for i in kept), data, axes)
+        return Variable([self.dims[i] for i in kept], reduction.result())
+
+    async def _sum(self, dim=None, ahead=4):
+        return await self._reduce("sum", dim, ahead)
+
+    async def _mean(self, dim=None, ahead=4):
+        return await self._reduce("mean", dim, ahead)
+
+    async def _min(self, dim=None, ahead=4):
+        return await self._reduce("min", dim, ahead)
+
+    async def _max(self, dim=None, ahead=4):
+        return await self._reduce("max", dim, ahead)
+
+    async def _count(self, dim=None, ahead=4):
+        return await self._reduce("count", dim, ahead)
+
+
+class _StreamingReduction:
+    """Running state of a NaN skipping reduction folded chunk by chunk"""
+
+    def __init__(self, op, shape, dtype):
+        if op not in ("sum", "mean", "min", "max", "count"):
+            raise ValueError(f"unknown reduction {op!r}")
+        if op != "count" and dtype.kind not in "biuf":
+            raise TypeError(f"cannot compute a streaming {op} of {dtype} data")
+        self.op = op
+        self.dtype = dtype
+        self.count = np.zeros(shape, dtype="i8")
+        if op in ("sum", "mean"):
+            self.value = np.zeros(shape, dtype="f8" if dtype.kind == "f" else "i8")
+        elif op in ("min", "max"):
+            self.value = np.zeros(shape, dtype=dtype)
+
+    def fold(self, key, data, axes):
+        if data.dtype.kind in "fc":
+            valid = ~np.isnan(data)
+        elif data.dtype.kind in "mM":
+            valid = ~np.isnat(data)
+        else:
+            valid = np.ones(data.shape, dtype=bool)
+        seen = self.count[key] > 0
+        self.count[key] += valid.sum(axis=axes)
+        if self.op in ("sum", "mean"):
+            self.value[key] += np.where(valid, data, 0).sum(
+                axis=axes, dtype=self.value.dtype
+            )
+        elif self.op in ("min", "max"):
+            ufunc = np.fmin if self.op == "min" else np.fmax
+            folded = ufunc.reduce(data, axis=axes)
+            self.value[key] = np.where(seen, ufunc(self.value[key], folded), folded)
+
+    def result(self):
+        # floats keep their precision, as with numpy
+        dtype = self.dtype if self.dtype.kind == "f" else None
+        if self.op == "count":
+            return self.count
+        if self.op == "sum":
+            return self.value.astype(dtype or self.value.dtype)
+        if self.op == "mean":
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = np.where(self.count > 0, self.value / self.count, np.nan)
+            return mean.astype(dtype or mean.dtype)
+        return self.value
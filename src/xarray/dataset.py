@@ -1,23 +1,47 @@
 import asyncio
+import functools
+import itertools
 from typing import Any, Hashable, Iterable, Mapping
 
+import numpy as np
 from xarray import Dataset as XDs
+from xarray import IndexVariable, Variable
 from xarray.core.indexes import isel_indexes
 from xarray.core.indexing import is_fancy_indexer, map_index_queries
 from xarray.core.utils import drop_dims_from_indexers, either_dict_or_kwargs
 
+from .. import tracing
+from ..zarr.util import cancelling_gather
+from .core.planner import Budget, QueryPlan
+from .core.spatial import build_tree, curvilinear_pair
+
 
 class Dataset(XDs):
+    # set on datasets opened by AsyncStore, see ``refresh`` and ``_sel``
+    __slots__ = (
+        "_datastore",
+        "_decode_kwargs",
+        "_store_version",
+        "_coordinate_index",
+        "_spatial_indexes",
+    )
+
     async def _isel(
         self,
         indexers: Mapping[Any, Any] | None = None,
         drop: bool = False,
         missing_dims="raise",
+        budget=None,
         **indexers_kwargs: Any,
     ):
         indexers = either_dict_or_kwargs(indexers, indexers_kwargs, "isel")
+        budget = Budget.from_value(budget)
+        if budget is not None:
+            budget.check(self._query_plan(indexers, missing_dims))
         if any(is_fancy_indexer(idx) for idx in indexers.values()):
-            return self._isel_fancy(indexers, drop=drop, missing_dims=missing_dims)
+            return await self._isel_fancy(
+                indexers, drop=drop, missing_dims=missing_dims
+            )
 
         # Much faster algorithm for when all indexers are ints, slices, one-dimensional
         # lists, or zero or one-dimensional np.ndarray's
@@ -45,9 +69,10 @@ class Dataset(XDs):
             variables[name] = var
             dims.update(zip(var.dims, var.shape))
 
-        await asyncio.gather(
-            *[place_var(name, var) for name, var in self._variables.items()]
-        )
+        with tracing.span("xarray.isel", dims=[str(d) for d in indexers]):
+            await cancelling_gather(
+                *[place_var(name, var) for name, var in self._variables.items()]
+            )
         # preserve variable order
         # if name in index_variables:
         #     var = index_variables[name]
@@ -71,15 +96,149 @@ class Dataset(XDs):
             close=self._close,
         )
 
+    async def _isel_fancy(
+        self,
+        indexers: Mapping[Any, Any],
+        *,
+        drop: bool,
+        missing_dims="raise",
+    ):
+        valid_indexers = dict(self._validate_indexers(indexers, missing_dims))
+
+        variables = {}
+        indexes, index_variables = isel_indexes(self.xindexes, valid_indexers)
+
+        async def place_var(name, var):
+            if name in index_variables:
+                new_var = index_variables[name]
+            else:
+                var_indexers = {
+                    k: v for k, v in valid_indexers.items() if k in var.dims
+                }
+                if var_indexers:
+                    # pointwise reads of async variables are grouped by chunk
+                    if hasattr(var, "_isel"):
+                        new_var = await var._isel(var_indexers)
+                    else:
+                        new_var = var.isel(indexers=var_indexers)
+                    # drop scalar coordinates
+                    if name in self.coords and drop and new_var.ndim == 0:
+                        return
+                else:
+                    new_var = var.copy(deep=False)
+                if name not in indexes and isinstance(new_var, IndexVariable):
+                    new_var = new_var.to_base_variable()
+            variables[name] = new_var
+
+        with tracing.span(
+            "xarray.isel", dims=[str(d) for d in valid_indexers], fancy=True
+        ):
+            await cancelling_gather(
+                *[place_var(name, var) for name, var in self._variables.items()]
+            )
+        # preserve variable order
+        variables = {
+            name: variables[name] for name in self._variables if name in variables
+        }
+
+        coord_names = self._coord_names & variables.keys()
+        selected = self._replace_with_new_dims(variables, coord_names, indexes)
+
+        # Extract coordinates from indexers
+        coord_vars, new_indexes = selected._get_indexers_coords_and_indexes(indexers)
+        variables.update(coord_vars)
+        indexes.update(new_indexes)
+        coord_names = self._coord_names & variables.keys() | coord_vars.keys()
+        return self._replace_with_new_dims(variables, coord_names, indexes=indexes)
+
     async def _sel(
         self,
         indexers: Mapping[Any, Any] = None,
         method: str = None,
         tolerance: int | float | Iterable[int | float] | None = None,
         drop: bool = False,
+        budget=None,
         **indexers_kwargs: Any,
     ):
         indexers = either_dict_or_kwargs(indexers, indexers_kwargs, "sel")
+        dim_indexers, query_results = await self._sel_indexers(
+            indexers, method, tolerance, drop
+        )
+        result = await self._isel(indexers=dim_indexers, drop=drop, budget=budget)
+        if query_results is None:
+            return result
+        return result._overwrite_indexes(*query_results.as_tuple()[1:])
+
+    async def _plan(
+        self,
+        indexers: Mapping[Any, Any] = None,
+        method: str = None,
+        tolerance: int | float | Iterable[int | float] | None = None,
+        **indexers_kwargs: Any,
+    ):
+        """The ``QueryPlan`` of ``_sel`` with these arguments: the chunks,
+        requests and bytes it would fetch, by variable. Labels are resolved
+        as ``_sel`` does, no data is fetched."""
+        indexers = either_dict_or_kwargs(indexers, indexers_kwargs, "plan")
+        dim_indexers, _ = await self._sel_indexers(indexers, method, tolerance)
+        return self._query_plan(dim_indexers)
+
+    async def _plan_isel(
+        self,
+        indexers: Mapping[Any, Any] | None = None,
+        missing_dims="raise",
+        **indexers_kwargs: Any,
+    ):
+        """The ``QueryPlan`` of ``_isel`` with these arguments"""
+        indexers = either_dict_or_kwargs(indexers, indexers_kwargs, "plan_isel")
+        return self._query_plan(indexers, missing_dims)
+
+    async def _explain(
+        self,
+        indexers: Mapping[Any, Any] = None,
+        method: str = None,
+        tolerance: int | float | Iterable[int | float] | None = None,
+        **indexers_kwargs: Any,
+    ):
+        """``_plan(...).explain()``: what ``_sel`` would fetch, as a table"""
+        plan = await self._plan(indexers, method, tolerance, **indexers_kwargs)
+        return plan.explain()
+
+    def _query_plan(self, indexers, missing_dims="raise"):
+        # the plans of the variables ``_isel(indexers)`` reads from the store
+        if any(is_fancy_indexer(idx) for idx in indexers.values()):
+            indexers = dict(self._validate_indexers(indexers, missing_dims))
+        else:
+            indexers = drop_dims_from_indexers(indexers, self.dims, missing_dims)
+        plans = {}
+        for name, var in self._variables.items():
+            var_indexers = {k: v for k, v in indexers.items() if k in var.dims}
+            if name in self._indexes or not var_indexers or not hasattr(var, "_plan"):
+                continue
+            plan = var._plan(var_indexers)
+            if plan is not None:
+                plans[name] = plan
+        return QueryPlan(indexers, plans)
+
+    async def _sel_indexers(self, indexers, method=None, tolerance=None, drop=False):
+        # the positional indexers of ``_sel``, and the index query results
+        # to apply to the selection, ``None`` when the sidecar index
+        # resolved the labels
+        coordinate_index = getattr(self, "_coordinate_index", None)
+        if coordinate_index and method == "nearest" and tolerance is None:
+            # resolve the labels from the store's sidecar index
+            positions = coordinate_index.isel_indexers(self, indexers)
+            if positions is not None:
+                return positions, None
+
+        points = None
+        if method == "nearest" and tolerance is None:
+            pair = curvilinear_pair(self, indexers)
+            if pair is not None:
+                indexers = dict(indexers)
+                lat, lon = (indexers.pop(name) for name in pair)
+                points = await self._nearest_grid_points(pair, lat, lon)
+
         query_results = map_index_queries(
             self, indexers=indexers, method=method, tolerance=tolerance
         )
@@ -94,5 +253,266 @@ class Dataset(XDs):
                         query_results.drop_coords.append(k)
             query_results.variables = no_scalar_variables
 
-        result = await self._isel(indexers=query_results.dim_indexers, drop=drop)
-        return result._overwrite_indexes(*query_results.as_tuple()[1:])
+        dim_indexers = query_results.dim_indexers
+        if points is not None:
+            dim_indexers = {**dim_indexers, **points}
+        return dim_indexers, query_results
+
+    async def _nearest_grid_points(self, pair, lat, lon):
+        """Map ``lat``, ``lon`` labels on the 2-D coordinates ``pair`` to
+        integer indexers along their dimensions, using a KD-tree built once
+        per dataset"""
+        indexes = getattr(self, "_spatial_indexes", None)
+        if indexes is None:
+            indexes = self._spatial_indexes = {}
+        if pair not in indexes:
+            # concurrent selections share one build
+            indexes[pair] = asyncio.ensure_future(
+                build_tree(*(self._variables[name] for name in pair))
+            )
+
+            def forget_failed(task):
+                # so that the next selection tries again
+                if task.cancelled() or task.exception() is not None:
+                    indexes.pop(pair, None)
+
+            indexes[pair].add_done_callback(forget_failed)
+        tree = await asyncio.shield(indexes[pair])
+
+        dims = [getattr(v, "dims", None) for v in (lat, lon)]
+        dim = next((d[0] for d in dims if d), "points")
+        lat, lon = np.asarray(lat), np.asarray(lon)
+        if lat.ndim > 1 or lon.ndim > 1:
+            raise ValueError("2-D coordinate selection takes scalars or 1-D arrays")
+        positions = tree.query(lat, lon)
+        if lat.ndim == 0 and lon.ndim == 0:
+            return {d: int(p) for d, p in zip(tree.dims, positions)}
+        return {d: Variable((dim,), p) for d, p in zip(tree.dims, positions)}
+
+    async def _interp(
+        self,
+        coords: Mapping[Any, Any] = None,
+        method: str = "linear",
+        **coords_kwargs: Any,
+    ):
+        """Interpolate numeric variables at ``coords`` along 1-D dimension
+        coordinates, with ``method`` ``"linear"`` or ``"nearest"``. Points
+        outside the coordinates get NaN.
+
+        As ``Dataset.interp``: scalars and 1-D arrays interpolate each
+        dimension independently, labelled arrays sharing a dimension
+        interpolate pointwise. Only the values bracketing each point are
+        fetched, with one pointwise selection grouped by chunk.
+        """
+        coords = either_dict_or_kwargs(coords, coords_kwargs, "interp")
+        if method not in ("linear", "nearest"):
+            raise ValueError(f"method must be 'linear' or 'nearest', got {method!r}")
+        dims = list(coords)
+        targets = {}
+        brackets = {}
+        for dim in dims:
+            if dim not in self.xindexes or self._variables[dim].ndim != 1:
+                raise ValueError(f"{dim!r} is not a 1-D dimension coordinate")
+            targets[dim] = _as_target(dim, coords[dim])
+            brackets[dim] = _bracket(
+                self._variables[dim].values, targets[dim].values, method
+            )
+
+        names = [
+            name
+            for name, var in self._variables.items()
+            if name not in dims
+            and set(var.dims) & set(dims)
+            and var.dtype.kind in "biuf"
+        ]
+        # variables grouped by the interpolated dimensions they have, each
+        # group weighted over those only
+        groups = {}
+        for name in names:
+            var_dims = tuple(d for d in dims if d in self._variables[name].dims)
+            groups.setdefault(var_dims, []).append(name)
+        results = await cancelling_gather(
+            *[
+                self._interp_group(group, var_dims, targets, brackets)
+                for var_dims, group in groups.items()
+            ]
+        )
+        variables = {}
+        for result in results:
+            variables.update(result)
+
+        data_vars = {}
+        new_coords = {}
+        for name, var in self._variables.items():
+            if name in dims:
+                continue
+            if name not in variables:
+                if set(var.dims) & set(dims):
+                    # non-numeric along an interpolated dimension
+                    continue
+                variables[name] = var
+            if name in self._coord_names:
+                new_coords[name] = variables[name]
+            else:
+                data_vars[name] = variables[name]
+        for dim in dims:
+            new_coords[dim] = targets[dim]
+            for name, coord in getattr(coords[dim], "coords", {}).items():
+                if name not in dims:
+                    new_coords.setdefault(name, coord.variable)
+        return type(self)(data_vars, new_coords, attrs=self._attrs)
+
+    async def _interp_group(self, names, dims, targets, brackets):
+        # one pointwise selection of every corner of the cell around each
+        # point along ``dims``, stacked along "_corner"
+        corners = list(itertools.product(*(range(len(brackets[d][0])) for d in dims)))
+        indexers = {}
+        weights = []
+        invalid = None
+        for j, dim in enumerate(dims):
+            positions, dim_weights, outside = brackets[dim]
+            tdims = ("_corner",) + targets[dim].dims
+            indexers[dim] = Variable(
+                tdims, np.stack([positions[c[j]] for c in corners])
+            )
+            weights.append(
+                Variable(tdims, np.stack([dim_weights[c[j]] for c in corners]))
+            )
+            outside = Variable(targets[dim].dims, outside)
+            invalid = outside if invalid is None else invalid | outside
+        weight = functools.reduce(lambda w, v: w * v, weights)
+        fetched = await self[names]._isel(indexers)
+
+        variables = {}
+        for name in names:
+            var = fetched._variables[name]
+            value = (var * weight).sum("_corner", skipna=False).where(~invalid)
+            order = []
+            for d in self._variables[name].dims:
+                for new in targets[d].dims if d in targets else (d,):
+                    if new not in order and new in value.dims:
+                        order.append(new)
+            variables[name] = value.transpose(*order)
+            variables[name].attrs = dict(self._variables[name].attrs)
+        return variables
+
+    async def _reduce(self, op, dim=None, ahead=4):
+        """Reduce the data variables over ``dim`` (all dimensions by default)
+        with ``op``, streaming their chunks, see ``Variable._reduce``.
+
+        Data variables without any of the dimensions are kept as they are,
+        non-numeric ones are dropped except for ``count``, and coordinates
+        along the reduced dimensions are dropped.
+        """
+        if dim is None:
+            dims = set(self.dims)
+        elif isinstance(dim, str) or not isinstance(dim, Iterable):
+            dims = {dim}
+        else:
+            dims = set(dim)
+        missing = dims - set(self.dims)
+        if missing:
+            raise ValueError(
+                f"Dataset does not contain the dimensions: {sorted(missing, key=str)}"
+            )
+
+        variables = {}
+
+        async def reduce_var(name, var):
+            var_dims = [d for d in var.dims if d in dims]
+            if not var_dims:
+                variables[name] = var
+            elif name in self._coord_names:
+                return
+            elif op == "count" or var.dtype.kind in "biuf":
+                if hasattr(var, "_reduce"):
+                    variables[name] = await var._reduce(op, var_dims, ahead)
+                else:
+                    variables[name] = getattr(var, op)(dim=var_dims)
+
+        await cancelling_gather(
+            *[reduce_var(name, var) for name, var in self._variables.items()]
+        )
+        # preserve variable order
+        variables = {
+            name: variables[name] for name in self._variables if name in variables
+        }
+        coord_names = self._coord_names & variables.keys()
+        indexes = {k: v for k, v in self._indexes.items() if k in variables}
+        return self._replace_with_new_dims(variables, coord_names, indexes)
+
+    async def _sum(self, dim=None, ahead=4):
+        return await self._reduce("sum", dim, ahead)
+
+    async def _mean(self, dim=None, ahead=4):
+        return await self._reduce("mean", dim, ahead)
+
+    async def _min(self, dim=None, ahead=4):
+        return await self._reduce("min", dim, ahead)
+
+    async def _max(self, dim=None, ahead=4):
+        return await self._reduce("max", dim, ahead)
+
+    async def _count(self, dim=None, ahead=4):
+        return await self._reduce("count", dim, ahead)
+
+    async def _to_zarr(self, store, **kwargs):
+        """Write this dataset to the zarr store in ``store``, an
+        ``AsyncFSMap``, see ``backends.api.to_zarr``"""
+        from .backends.api import to_zarr
+
+        await to_zarr(self, store, **kwargs)
+
+    async def refresh(self):
+        """Bring a dataset opened from an append-only store up to date.
+
+        Re-reads the store's consolidated metadata and patches this dataset in
+        place: dimension coordinates that grew are extended with only their
+        new values and reindexed, other changed or new arrays are reopened.
+        """
+        store = getattr(self, "_datastore", None)
+        if store is None:
+            raise ValueError("refresh() needs a dataset opened by AsyncStore")
+        return await store.refresh_dataset(self, **self._decode_kwargs)
+
+
+def _as_target(dim, values):
+    # the points to interpolate at as a Variable, along ``dim`` unless they
+    # carry dimensions of their own
+    if isinstance(values, Variable):
+        return values
+    if hasattr(values, "variable"):
+        return values.variable
+    values = np.asarray(values)
+    if values.ndim > 1:
+        raise ValueError(f"unlabelled points along {dim!r} must be 0-D or 1-D")
+    return Variable((dim,) if values.ndim else (), values)
+
+
+def _bracket(coord, points, method):
+    """Positions along ``coord`` and weights of the values around each of
+    ``points``, two of each for linear and one for nearest interpolation,
+    and which points fall outside ``coord``"""
+    if coord.dtype.kind in "mM":
+        coord = coord.astype("M8[ns]" if coord.dtype.kind == "M" else "m8[ns]")
+        points = np.asarray(points).astype(coord.dtype)
+        coord, points = coord.view("i8").astype("f8"), points.view("i8").astype("f8")
+    coord = np.asarray(coord, dtype="f8")
+    points = np.asarray(points, dtype="f8")
+    diff = np.diff(coord)
+    if (diff < 0).all():
+        coord, points = -coord, -points
+    elif not (diff > 0).all():
+        raise ValueError("interpolation needs a strictly monotonic coordinate")
+    n = len(coord)
+    outside = ~((points >= coord[0]) & (points <= coord[-1]))
+    lower = np.clip(np.searchsorted(coord, points, side="right") - 1, 0, max(n - 2, 0))
+    upper = np.minimum(lower + 1, n - 1)
+    span = coord[upper] - coord[lower]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        frac = np.where(span > 0, (points - coord[lower]) / span, 0.0)
+    frac = np.where(outside, 0.0, frac)
+    if method == "nearest":
+        # halfway points go to the lower value, as scipy's interp1d does
+        return [np.where(frac > 0.5, upper, lower)], [np.ones_like(frac)], outside
+    return [lower, upper], [1 - frac, frac], outside
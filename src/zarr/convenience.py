@@ -2,17 +2,30 @@ import sys
 
 from zarr.convenience import StoreLike, open
 from zarr.storage import normalize_store_arg
+from zarr.util import json_dumps
 
-from .core import Array
-from .storage import ConsolidatedMetadataStore
+from .core import Array, put_metadata
+from .storage import ConsolidatedMetadataStore, crawl_metadata
 
 sys.modules["zarr.core"].Array = Array
 sys.modules["zarr.hierarchy"].Array = Array
 
 
 async def open_consolidated(
-    store: StoreLike, metadata_key=".zmetadata", mode="r+", **kwargs
+    store: StoreLike,
+    metadata_key=".zmetadata",
+    mode="r+",
+    crawl=False,
+    crawl_path=None,
+    **kwargs,
 ):
+    """Open the group or array of ``store`` at ``path`` from its consolidated
+    metadata, as zarr's ``open_consolidated`` does.
+
+    With ``crawl=True`` the metadata is gathered from the documents of the
+    hierarchy under ``crawl_path``, by default ``path``, instead, see
+    ``storage.crawl_metadata``.
+    """
     zarr_version = kwargs.get("zarr_version")
     store = normalize_store_arg(
         store,
@@ -26,6 +39,8 @@ async def open_consolidated(
         )
 
     path = kwargs.pop("path", None)
+    if crawl_path is None:
+        crawl_path = path or ""
     if store._store_version == 2:
         ConsolidatedStoreClass = ConsolidatedMetadataStore
     else:
@@ -37,7 +52,9 @@ async def open_consolidated(
         #     metadata_key = "meta/root/consolidated/" + metadata_key
 
     # setup metadata store
-    meta_store = ConsolidatedStoreClass(store, metadata_key=metadata_key)
+    meta_store = ConsolidatedStoreClass(
+        store, metadata_key=metadata_key, crawl=crawl, crawl_path=crawl_path
+    )
     await meta_store.init_coro
 
     # pass through
@@ -45,3 +62,26 @@ async def open_consolidated(
     return open(
         store=meta_store, chunk_store=chunk_store, mode=mode, path=path, **kwargs
     )
+
+
+async def consolidate_metadata(store, metadata_key=".zmetadata"):
+    """Write the consolidated metadata of ``store`` under ``metadata_key``, as
+    zarr's ``consolidate_metadata`` does.
+
+    A ``ConsolidatedMetadataStore`` is consolidated from the metadata it
+    holds, which ``Array.resize`` keeps up to date, so that entries that only
+    live there, such as chunk bitmaps, are kept. Any other store, an
+    ``AsyncFSMap``, is crawled, see ``storage.crawl_metadata``. Returns the
+    consolidated metadata.
+    """
+    if isinstance(store, ConsolidatedMetadataStore):
+        metadata = store.metadata
+        store = store.store
+    else:
+        metadata = await crawl_metadata(getattr(store, "_mutable_mapping", store))
+    await put_metadata(
+        store,
+        metadata_key,
+        json_dumps({"zarr_consolidated_format": 1, "metadata": metadata}),
+    )
+    return metadata
@@ -1,36 +1,328 @@
 import asyncio
+import contextlib
+import inspect
+import itertools
 import sys
 
 import numpy as np
 from numcodecs.compat import ensure_ndarray_like
+from zarr.attrs import Attributes
 from zarr.core import Array as ZA
-from zarr.errors import err_too_many_indices
+from zarr.errors import ReadOnlyError, err_too_many_indices
 from zarr.indexing import (
     BasicIndexer,
-    CoordinateIndexer,
     MaskIndexer,
     OrthogonalIndexer,
+    PartialChunkIterator,
     check_fields,
+    check_no_multi_fields,
     ensure_tuple,
+    is_contiguous_selection,
+    is_integer,
     is_pure_fancy_indexing,
+    is_scalar,
     pop_fields,
 )
-from zarr.util import check_array_shape
+from zarr.storage import array_meta_key
+from zarr.util import (
+    InfoReporter,
+    all_equal,
+    check_array_shape,
+    is_total_slice,
+    json_loads,
+    normalize_resize_args,
+)
 
-from .indexing import OIndex, VIndex
+from .. import tracing
+from .executor import DecodeExecutor
+from .indexing import OIndex, PointIndexer, VIndex
+from .storage import ConsolidatedMetadataStore
+from .util import AsyncPartialReadBuffer, cancelling_gather, read_ahead
 
 sys.modules["zarr.core"].OIndex = OIndex
 sys.modules["zarr.core"].VIndex = VIndex
 
 
+class FetchStats:
+    """How the chunks of a selection were fetched from the chunk store"""
+
+    __slots__ = (
+        "batch_size",
+        "batches",
+        "chunks",
+        "skipped",
+        "in_flight",
+        "peak_in_flight",
+    )
+
+    def __init__(self, batch_size=1):
+        self.batch_size = batch_size
+        self.batches = 0
+        self.chunks = 0
+        # chunks known to be missing, filled without a request
+        self.skipped = 0
+        # chunk requests, not batches
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def __repr__(self):
+        return (
+            f"FetchStats(batch_size={self.batch_size}, batches={self.batches}, "
+            f"chunks={self.chunks}, skipped={self.skipped}, "
+            f"peak_in_flight={self.peak_in_flight})"
+        )
+
+
+class SelectionPlan:
+    """What reading a selection of an array takes, worked out from the chunk
+    grid without fetching anything.
+
+    ``stored_nbytes`` is the sum of the stored sizes of the chunks to
+    fetch, known when the array has a chunk index built by listing, and
+    ``None`` otherwise; ``nbytes`` falls back to their decoded size.
+    """
+
+    __slots__ = (
+        "array",
+        "shape",
+        "chunks",
+        "skipped",
+        "cached",
+        "requests",
+        "stored_nbytes",
+        "decoded_nbytes",
+        "memory",
+    )
+
+    def __init__(self, array, shape, memory):
+        self.array = array
+        self.shape = shape
+        # output size, in bytes
+        self.memory = memory
+        self.chunks = 0
+        # chunks known to be missing, filled without a request
+        self.skipped = 0
+        # chunks found in the chunk cache
+        self.cached = 0
+        self.requests = 0
+        self.stored_nbytes = None
+        self.decoded_nbytes = 0
+
+    def __repr__(self):
+        return (
+            f"SelectionPlan(array={self.array!r}, shape={self.shape}, "
+            f"chunks={self.chunks}, skipped={self.skipped}, cached={self.cached}, "
+            f"requests={self.requests}, nbytes={self.nbytes}, memory={self.memory})"
+        )
+
+    @property
+    def nbytes(self):
+        """Bytes to fetch: stored sizes if known, decoded sizes otherwise"""
+        if self.stored_nbytes is None:
+            return self.decoded_nbytes
+        return self.stored_nbytes
+
+
 class Array(ZA):
+    # chunk keys per ``getitems`` call; ``None`` fetches one chunk per request
+    _fetch_batch_size = None
+    # maximum concurrent requests (or batches) issued by this array
+    _fetch_concurrency = None
+    _fetch_semaphore = None
+    # seconds a selection may take to fetch its chunks
+    _fetch_deadline = None
+    # where chunks are decoded, ``None`` decodes inline on the event loop
+    _decode_executor = None
+    # shared cache of decoded chunks, see ``LRUChunkCache``
+    _chunk_cache = None
+    # shared pool of output and scratch buffers, see ``BufferPool``
+    _buffer_pool = None
+    # which chunks exist, over the chunk grid, see ``ChunkIndex``
+    _chunk_bitmap = None
+    # stored size of each chunk, over the chunk grid, when known
+    _chunk_sizes = None
+    last_fetch_stats = None
+
+    def set_fetch_options(
+        self, batch_size=None, max_concurrency=None, partial_reads=False, deadline=None
+    ):
+        """Configure how chunks are fetched during a selection.
+
+        Parameters
+        ----------
+        batch_size : int, optional
+            Group chunk keys into ``getitems`` calls of this size. Requires the
+            chunk store to provide ``getitems``; otherwise chunks are fetched
+            one request at a time.
+        max_concurrency : int, optional
+            Maximum number of requests (or batches) in flight at once for
+            this array. Use ``set_fs_concurrency`` to cap a whole filesystem.
+        partial_reads : bool
+            Read only the parts of a chunk a selection needs, by byte range
+            for uncompressed chunks and by compressed block for blosc ones,
+            when it needs less than half of it. Requires the chunk store to
+            provide ``cat_range``. Chunks read partially are not cached.
+        deadline : float, optional
+            Seconds a selection may spend fetching and decoding its chunks.
+            Past it the outstanding fetches are cancelled and ``TimeoutError``
+            is raised. Hedging and retries of slow or failed requests are
+            options of ``AsyncFSMap``.
+        """
+        self._fetch_batch_size = batch_size
+        self._fetch_concurrency = max_concurrency
+        self._fetch_semaphore = None
+        self._partial_decompress = partial_reads
+        self._fetch_deadline = deadline
+
+    def set_decode_executor(self, executor=None):
+        """Decode chunks with ``executor``.
+
+        Accepts a ``DecodeExecutor``, a ``concurrent.futures.Executor`` (wrapped
+        in a ``DecodeExecutor`` with default thresholds) or ``None`` to decode
+        inline on the event loop. A ``DecodeExecutor`` may be shared between
+        arrays.
+        """
+        if executor is not None and not isinstance(executor, DecodeExecutor):
+            executor = DecodeExecutor(executor)
+        self._decode_executor = executor
+
+    def set_chunk_cache(self, cache=None):
+        """Keep decoded chunks of this array in ``cache``, an ``LRUChunkCache``
+        that may be shared between arrays, or stop caching with ``None``"""
+        self._chunk_cache = cache
+
+    def set_buffer_pool(self, pool=None):
+        """Allocate selection outputs and decode scratch space from ``pool``,
+        a ``BufferPool`` that may be shared between arrays, or with
+        ``np.empty`` when ``None``.
+
+        Scratch space is returned to the pool by the array. Outputs are only
+        reused once given back with ``pool.release``.
+        """
+        self._buffer_pool = pool
+
+    def set_chunk_index(self, index=None):
+        """Skip requests for the chunks that ``index``, a ``ChunkIndex``,
+        marks as missing, or fetch every chunk with ``None``"""
+        self._chunk_bitmap = None if index is None else index.get(self._path)
+        self._chunk_sizes = None if index is None else index.chunk_sizes(self._path)
+
+    def _chunk_missing(self, chunk_coords):
+        bitmap = self._chunk_bitmap
+        # a bitmap for another chunk grid is out of date, ignore it
+        return (
+            bitmap is not None
+            and bitmap.shape == self._cdata_shape
+            and not bitmap[chunk_coords]
+        )
+
+    def _empty(self, shape, dtype):
+        if self._buffer_pool is None or type(self._meta_array) is not np.ndarray:
+            return np.empty_like(
+                self._meta_array, shape=shape, dtype=dtype, order=self._order
+            )
+        return self._buffer_pool.empty(shape, dtype, self._order)
+
+    def _release(self, array):
+        if self._buffer_pool is not None:
+            self._buffer_pool.release(array)
+
+    def _cache_key(self, ckey):
+        mapping = self._chunk_mapping
+        fs = getattr(mapping, "fs", None)
+        if fs is None:
+            return id(mapping), ckey
+        # fsspec shares the instances of a filesystem class created with the
+        # same arguments, those of other classes hold data of their own
+        fs_key = fs._fs_token if fs.cachable else id(fs)
+        return (fs.protocol, fs_key, mapping.root), ckey
+
+    def _invalidate_cached_chunks(self):
+        if self._chunk_cache is not None:
+            root, _ = self._cache_key("")
+            self._chunk_cache.invalidate_prefix(root, self._key_prefix)
+
+    def _is_cached(self, ckey):
+        # without touching the cache's recency order or hit counts
+        return self._chunk_cache is not None and self._cache_key(ckey) in (
+            self._chunk_cache
+        )
+
+    def _cached_chunk(self, ckey):
+        if self._chunk_cache is None:
+            return None
+        return self._chunk_cache.get(self._cache_key(ckey))
+
+    def _rebind(self, store, chunk_store=None):
+        """Return a copy of this array reading from ``store``, reusing its
+        parsed metadata and codec instances instead of loading them again"""
+        # not copy.copy, unpickling an Array reloads its metadata
+        array = object.__new__(type(self))
+        array.__dict__.update(self.__dict__)
+        array._store = store
+        array._chunk_store = chunk_store
+        array._attrs = Attributes(
+            store,
+            key=self._attrs.key,
+            read_only=self._read_only,
+            synchronizer=self._synchronizer,
+            cache=self._attrs.cache,
+        )
+        array._info_reporter = InfoReporter(array)
+        array._oindex = OIndex(array)
+        array._vindex = VIndex(array)
+        array._fetch_semaphore = None
+        array.last_fetch_stats = None
+        return array
+
+    def _with_shape(self, shape):
+        """Return a copy of this array over its region ``shape`` only, for
+        readers opened before it was resized"""
+        array = self._rebind(self._store, self._chunk_store)
+        array._shape = tuple(shape)
+        return array
+
+    @property
+    def _chunk_nbytes(self):
+        return int(np.prod(self._chunks)) * self._dtype.itemsize
+
+    @property
+    def _chunk_mapping(self):
+        # zarr wraps plain mappings in a KVStore, reach through it for the
+        # batch methods of the async mapper
+        return getattr(self.chunk_store, "_mutable_mapping", self.chunk_store)
+
+    @contextlib.asynccontextmanager
+    async def _fetch_slot(self, stats, keys=1):
+        if self._fetch_concurrency:
+            if self._fetch_semaphore is None:
+                self._fetch_semaphore = asyncio.Semaphore(self._fetch_concurrency)
+            limiter = self._fetch_semaphore
+        else:
+            limiter = contextlib.nullcontext()
+        queued = tracing.clock()
+        async with limiter:
+            trace = tracing.current()
+            if trace is not None:
+                trace.queue_wait += tracing.clock() - queued
+            stats.batches += 1
+            stats.in_flight += keys
+            stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+            try:
+                yield
+            finally:
+                stats.in_flight -= keys
+
     async def __array__(self, *args):
         a = await self[...]
         if args:
             a = a.astype(args[0])
         return a
 
-    async def islice(self, start=None, end=None):
+    async def islice(self, start=None, end=None, ahead=1):
+        """Asynchronously iterate over the rows ``start`` to ``end`` of the
+        array, fetching ``ahead`` chunks along the first dimension in
+        advance"""
         if len(self.shape) == 0:
             # Same error as numpy
             raise TypeError("iteration over a 0-d array")
@@ -48,22 +340,56 @@ class Array(ZA):
         # Avoid repeatedly decompressing chunks by iterating over the chunks
         # in the first dimension.
         chunk_size = self.chunks[0]
-        chunk = None
-        for j in range(start, end):
-            if j % chunk_size == 0:
-                chunk = await self[j : j + chunk_size]
-            # init chunk if we start offset of chunk borders
-            elif chunk is None:
-                chunk_start = j - j % chunk_size
-                chunk_end = chunk_start + chunk_size
-                chunk = await self[chunk_start:chunk_end]
-            yield await chunk[j % chunk_size]
-
-    async def __iter__(self):
-        return await self.islice()
-
-    async def __aiter__(self):
-        return await self.islice()
+        chunk_starts = range(start - start % chunk_size, end, chunk_size)
+        blocks = read_ahead(
+            chunk_starts, lambda lo: self[lo : lo + chunk_size], ahead=ahead
+        )
+        async with contextlib.aclosing(blocks):
+            async for chunk_start, chunk in blocks:
+                for j in range(
+                    max(start, chunk_start), min(end, chunk_start + chunk_size)
+                ):
+                    yield chunk[j - chunk_start]
+
+    async def iter_blocks(self, axis=0, ahead=1, ordered=True):
+        """Asynchronously iterate over the blocks of the array one chunk
+        long along ``axis``, yielding ``(slice, block)`` with the position
+        of each block along ``axis``.
+
+        ``ahead`` blocks are fetched in advance, so that at most
+        ``ahead + 1`` are held at a time. With ``ordered=False`` blocks are
+        yielded as they arrive. Use ``contextlib.aclosing`` to stop the
+        fetches in flight when leaving the loop early.
+        """
+        if len(self.shape) == 0:
+            raise TypeError("iteration over a 0-d array")
+        if not -self.ndim <= axis < self.ndim:
+            raise ValueError(f"axis {axis} is out of bounds for a {self.ndim}-d array")
+        axis %= self.ndim
+        size, chunk_size = self.shape[axis], self.chunks[axis]
+        before = (slice(None),) * axis
+
+        def fetch(block):
+            return self.get_basic_selection(before + (block,))
+
+        blocks = read_ahead(
+            [
+                slice(lo, min(lo + chunk_size, size))
+                for lo in range(0, size, chunk_size)
+            ],
+            fetch,
+            ahead=ahead,
+            ordered=ordered,
+        )
+        async with contextlib.aclosing(blocks):
+            async for block, data in blocks:
+                yield block, data
+
+    def __iter__(self):
+        raise TypeError("use async for to iterate over an async Array")
+
+    def __aiter__(self):
+        return self.islice()
 
     async def __getitem__(self, selection):
         fields, pure_selection = pop_fields(selection)
@@ -73,6 +399,13 @@ class Array(ZA):
             result = await self.get_basic_selection(pure_selection, fields=fields)
         return result
 
+    async def __setitem__(self, selection, value):
+        fields, pure_selection = pop_fields(selection)
+        if is_pure_fancy_indexing(pure_selection, self.ndim):
+            await self.vindex.__setitem__(selection, value)
+        else:
+            await self.set_basic_selection(pure_selection, value, fields=fields)
+
     async def get_basic_selection(self, selection=Ellipsis, out=None, fields=None):
         if not self._cache_metadata:
             self._load_metadata()
@@ -126,31 +459,117 @@ class Array(ZA):
         out_dtype = check_fields(fields, self._dtype)
         out_shape = indexer.shape
         if out is None:
-            out = np.empty_like(
-                self._meta_array, shape=out_shape, dtype=out_dtype, order=self._order
-            )
+            out = self._empty(out_shape, out_dtype)
         else:
             check_array_shape("out", out, out_shape)
-            # sequentially get one key at a time from storage
-        await asyncio.gather(
-            *[
-                self._chunk_getitem(
-                    chunk_coords,
-                    chunk_selection,
-                    out,
-                    out_selection,
-                    drop_axes=indexer.drop_axes,
-                    fields=fields,
-                )
-                for chunk_coords, chunk_selection, out_selection in indexer
-            ]
-        )
+
+        chunks = []
+        stats = FetchStats(self._fetch_batch_size or 1)
+        for chunk_coords, chunk_selection, out_selection in indexer:
+            if self._chunk_missing(chunk_coords):
+                self._fill_chunk(out, out_selection, fields)
+                stats.skipped += 1
+            else:
+                chunks.append((chunk_coords, chunk_selection, out_selection))
+        stats.chunks = len(chunks)
+        trace = tracing.current()
+        if trace is not None:
+            trace.chunks_requested += stats.chunks
+            trace.chunks_skipped += stats.skipped
+        if (
+            chunks
+            and self._fetch_batch_size
+            and hasattr(self._chunk_mapping, "getitems")
+        ):
+            # allow storage to get multiple items at once
+            lchunk_coords, lchunk_selection, lout_selection = zip(*chunks)
+            fetch = self._chunk_getitems(
+                lchunk_coords,
+                lchunk_selection,
+                out,
+                lout_selection,
+                drop_axes=indexer.drop_axes,
+                fields=fields,
+                stats=stats,
+            )
+        else:
+            fetch = cancelling_gather(
+                *[
+                    self._chunk_getitem(
+                        chunk_coords,
+                        chunk_selection,
+                        out,
+                        out_selection,
+                        drop_axes=indexer.drop_axes,
+                        fields=fields,
+                        stats=stats,
+                    )
+                    for chunk_coords, chunk_selection, out_selection in chunks
+                ]
+            )
+        with tracing.span(
+            "zarr.get_selection",
+            array=self.path,
+            chunks=stats.chunks,
+            skipped=stats.skipped,
+        ):
+            await self._before_deadline(fetch)
+        self.last_fetch_stats = stats
 
         if out.shape:
             return out
         else:
             return out[()]
 
+    async def _before_deadline(self, fetch):
+        if self._fetch_deadline is None:
+            return await fetch
+        try:
+            return await asyncio.wait_for(fetch, self._fetch_deadline)
+        except asyncio.TimeoutError:
+            raise TimeoutError(
+                f"selection not fetched within {self._fetch_deadline} seconds"
+            ) from None
+
+    def plan_selection(self, selection, mode="basic"):
+        """The ``SelectionPlan`` of reading ``selection``, ``mode`` being
+        ``"basic"``, ``"oindex"`` or ``"vindex"`` as for ``__getitem__``,
+        ``oindex`` and ``vindex``. Nothing is fetched."""
+        if not self._cache_metadata:
+            self._load_metadata()
+        if self._shape == ():
+            shape, chunk_coords = (), [()]
+        else:
+            if mode == "vindex":
+                indexer = PointIndexer(selection, self)
+            elif mode == "oindex":
+                indexer = OrthogonalIndexer(selection, self)
+            else:
+                indexer = BasicIndexer(selection, self)
+            shape = indexer.shape
+            chunk_coords = (coords for coords, _, _ in indexer)
+        plan = SelectionPlan(
+            self.path, shape, int(np.prod(shape)) * self._dtype.itemsize
+        )
+        sizes = self._chunk_sizes
+        if sizes is not None and sizes.shape != self._cdata_shape:
+            sizes = None
+        stored = 0
+        for coords in chunk_coords:
+            if self._chunk_missing(coords):
+                plan.skipped += 1
+                continue
+            plan.chunks += 1
+            if self._is_cached(self._chunk_key(coords)):
+                plan.cached += 1
+            elif sizes is not None:
+                stored += int(sizes[coords])
+        plan.requests = plan.chunks - plan.cached
+        plan.decoded_nbytes = plan.requests * self._chunk_nbytes
+        if sizes is not None:
+            plan.stored_nbytes = stored
+        return plan
+
     async def _chunk_getitem(
         self,
         chunk_coords,
@@ -159,6 +578,7 @@ class Array(ZA):
         out_selection,
         drop_axes=None,
         fields=None,
+        stats=None,
     ):
         out_is_ndarray = True
         try:
@@ -168,19 +588,220 @@ class Array(ZA):
 
         assert len(chunk_coords) == len(self._cdata_shape)
         ckey = self._chunk_key(chunk_coords)
+        chunk = self._cached_chunk(ckey)
+        if chunk is not None:
+            _trace_cache_hit()
+            self._copy_chunk(
+                out, chunk, chunk_selection, drop_axes, fields, out_selection
+            )
+            return
+        runs = self._partial_read_runs(chunk_selection, fields)
+        if runs is not None:
+            try:
+                async with self._fetch_slot(stats or FetchStats()):
+                    chunk = await self._read_partial(ckey, runs)
+            except KeyError:
+                self._fill_chunk(out, out_selection, fields)
+            else:
+                self._copy_chunk(
+                    out, chunk, chunk_selection, drop_axes, fields, out_selection
+                )
+                self._release(chunk)
+            return
         try:
             # obtain compressed data for chunk
-            cdata = await self.chunk_store[ckey]
+            async with self._fetch_slot(stats or FetchStats()):
+                cdata = await self.chunk_store[ckey]
         except KeyError:
             # chunk not initialized
-            if self._fill_value is not None:
-                if fields:
-                    fill_value = self._fill_value[fields]
-                else:
-                    fill_value = self._fill_value
-                out[out_selection] = fill_value
+            self._fill_chunk(out, out_selection, fields)
 
         else:
+            await self._aprocess_chunk(
+                out,
+                cdata,
+                chunk_selection,
+                drop_axes,
+                out_is_ndarray,
+                fields,
+                out_selection,
+                ckey=ckey,
+            )
+
+    def _partial_read_runs(self, chunk_selection, fields):
+        # the (start, nitems, out) runs of items to read from a chunk, or
+        # None when the whole chunk should be read
+        if (
+            not self._partial_decompress
+            or fields
+            or self._filters
+            or self._dtype == object
+            or self._order != "C"
+            or not hasattr(self._chunk_mapping, "cat_range")
+            or (self._compressor is not None and self._compressor.codec_id != "blosc")
+            or is_total_slice(chunk_selection, self._chunks)
+        ):
+            return None
+        for sel in chunk_selection:
+            if not is_integer(sel) and not (
+                isinstance(sel, slice) and sel.step in (None, 1)
+            ):
+                return None
+        runs = list(PartialChunkIterator(chunk_selection, self._chunks))
+        if 2 * sum(nitems for _, nitems, _ in runs) > np.prod(self._chunks):
+            return None
+        return runs
+
+    async def _read_partial(self, ckey, runs):
+        """Read the items of ``runs`` from chunk ``ckey`` into a chunk sized
+        array; the other items are left uninitialised"""
+        buffer = AsyncPartialReadBuffer(
+            self._chunk_mapping, ckey, self._compressor, self._dtype.itemsize
+        )
+        parts = await buffer.read_items([(start, nitems) for start, nitems, _ in runs])
+        chunk = self._empty(self._chunks, self._dtype)
+        flat = chunk.reshape(-1)
+        for (start, nitems, _), part in zip(runs, parts):
+            flat[start : start + nitems] = np.frombuffer(
+                part, dtype=self._dtype, count=nitems
+            )
+        return chunk
+
+    async def _chunk_getitems(
+        self,
+        lchunk_coords,
+        lchunk_selection,
+        out,
+        lout_selection,
+        drop_axes=None,
+        fields=None,
+        stats=None,
+    ):
+        """As _chunk_getitem, but fetching the chunks in batches of
+        ``_fetch_batch_size`` keys through the mapper's ``getitems``"""
+        out_is_ndarray = True
+        try:
+            out = ensure_ndarray_like(out)
+        except TypeError:
+            out_is_ndarray = False
+
+        stats = stats or FetchStats(self._fetch_batch_size)
+        mapping = self._chunk_mapping
+        ckeys = [self._chunk_key(ch) for ch in lchunk_coords]
+        items = []
+        for ckey, chunk_selection, out_selection in zip(
+            ckeys, lchunk_selection, lout_selection
+        ):
+            chunk = self._cached_chunk(ckey)
+            if chunk is None:
+                items.append((ckey, chunk_selection, out_selection))
+            else:
+                _trace_cache_hit()
+                self._copy_chunk(
+                    out, chunk, chunk_selection, drop_axes, fields, out_selection
+                )
+        size = self._fetch_batch_size
+
+        async def fetch_batch(batch):
+            async with self._fetch_slot(stats, len(batch)):
+                cdatas = await mapping.getitems(
+                    [ckey for ckey, _, _ in batch], on_error="return"
+                )
+            await self._scatter_chunks(
+                cdatas, batch, out, drop_axes, fields, out_is_ndarray
+            )
+
+        await cancelling_gather(
+            *[fetch_batch(items[i : i + size]) for i in range(0, len(items), size)]
+        )
+
+    async def _scatter_chunks(
+        self, cdatas, items, out, drop_axes=None, fields=None, out_is_ndarray=True
+    ):
+        # decode the chunks returned by ``getitems(..., on_error="return")``
+        # into their place in the output, filling the missing ones
+        decodes = []
+        for ckey, chunk_selection, out_selection in items:
+            cdata = cdatas.get(ckey, KeyError(ckey))
+            if isinstance(cdata, KeyError):
+                self._fill_chunk(out, out_selection, fields)
+            elif isinstance(cdata, BaseException):
+                raise cdata
+            else:
+                decodes.append(
+                    self._aprocess_chunk(
+                        out,
+                        cdata,
+                        chunk_selection,
+                        drop_axes,
+                        out_is_ndarray,
+                        fields,
+                        out_selection,
+                        ckey=ckey,
+                    )
+                )
+        await cancelling_gather(*decodes)
+
+    async def _aprocess_chunk(
+        self,
+        out,
+        cdata,
+        chunk_selection,
+        drop_axes,
+        out_is_ndarray,
+        fields,
+        out_selection,
+        ckey=None,
+    ):
+        """As _process_chunk, decoding through the array's decode executor and
+        keeping the decoded chunk in the chunk cache"""
+        trace = tracing.current()
+        if trace is None:
+            return await self._adecode_into(
+                out,
+                cdata,
+                chunk_selection,
+                drop_axes,
+                out_is_ndarray,
+                fields,
+                out_selection,
+                ckey,
+            )
+        # wall time, including any wait for the decode executor
+        start = tracing.clock()
+        try:
+            return await self._adecode_into(
+                out,
+                cdata,
+                chunk_selection,
+                drop_axes,
+                out_is_ndarray,
+                fields,
+                out_selection,
+                ckey,
+            )
+        finally:
+            trace.record_decode(tracing.clock() - start)
+
+    async def _adecode_into(
+        self,
+        out,
+        cdata,
+        chunk_selection,
+        drop_axes,
+        out_is_ndarray,
+        fields,
+        out_selection,
+        ckey,
+    ):
+        if self._chunk_cache is not None and ckey is not None:
+            chunk = self._chunk_cache.put(
+                self._cache_key(ckey), await self._adecode_chunk(cdata)
+            )
+            self._copy_chunk(
+                out, chunk, chunk_selection, drop_axes, fields, out_selection
+            )
+        elif self._decode_executor is None:
             self._process_chunk(
                 out,
                 cdata,
@@ -190,6 +811,87 @@ class Array(ZA):
                 fields,
                 out_selection,
             )
+        else:
+            await self._decode_executor.process(
+                self,
+                out,
+                cdata,
+                chunk_selection,
+                drop_axes,
+                out_is_ndarray,
+                fields,
+                out_selection,
+            )
+
+    def _process_chunk(
+        self,
+        out,
+        cdata,
+        chunk_selection,
+        drop_axes,
+        out_is_ndarray,
+        fields,
+        out_selection,
+        partial_read_decode=False,
+    ):
+        """Take binary data from storage and fill output array, decoding
+        chunks that are not wanted whole into pooled scratch space"""
+        if (
+            self._buffer_pool is None
+            or self._compressor is None
+            or self._filters
+            or self._dtype == object
+            or partial_read_decode
+            or (
+                out_is_ndarray
+                and not fields
+                and is_contiguous_selection(out_selection)
+                and is_total_slice(chunk_selection, self._chunks)
+            )
+        ):
+            # whole chunks are decoded straight into ``out`` where possible
+            return super()._process_chunk(
+                out,
+                cdata,
+                chunk_selection,
+                drop_axes,
+                out_is_ndarray,
+                fields,
+                out_selection,
+                partial_read_decode,
+            )
+        chunk = self._empty(self._chunks, self._dtype)
+        try:
+            self._compressor.decode(cdata, chunk)
+            self._copy_chunk(
+                out, chunk, chunk_selection, drop_axes, fields, out_selection
+            )
+        finally:
+            self._release(chunk)
+
+    async def _adecode_chunk(self, cdata):
+        if self._decode_executor is None:
+            return self._decode_chunk(cdata)
+        return await self._decode_executor.decode(self, cdata)
+
+    def _copy_chunk(
+        self, out, chunk, chunk_selection, drop_axes, fields, out_selection
+    ):
+        # select data from a decoded chunk and store it in the output
+        if fields:
+            chunk = chunk[fields]
+        tmp = chunk[chunk_selection]
+        if drop_axes:
+            tmp = np.squeeze(tmp, axis=drop_axes)
+        out[out_selection] = tmp
+
+    def _fill_chunk(self, out, out_selection, fields=None):
+        if self._fill_value is not None:
+            if fields:
+                fill_value = self._fill_value[fields]
+            else:
+                fill_value = self._fill_value
+            out[out_selection] = fill_value
 
     async def get_orthogonal_selection(self, selection, out=None, fields=None):
         if not self._cache_metadata:
@@ -198,8 +900,21 @@ class Array(ZA):
         indexer = OrthogonalIndexer(selection, self)
         return await self._get_selection(indexer=indexer, out=out, fields=fields)
 
+    async def set_basic_selection(self, selection, value, fields=None):
+        if not self._cache_metadata:
+            self._load_metadata()
+        if self._shape == ():
+            # the single chunk of a 0-d array
+            items = [((), self._chunk_key((0,)), (), value)]
+            return await self._store_chunks(items, check_no_multi_fields(fields))
+        indexer = BasicIndexer(selection, self)
+        await self._set_selection(indexer, value, fields=fields)
+
     async def set_orthogonal_selection(self, selection, value, fields=None):
-        raise NotImplementedError()
+        if not self._cache_metadata:
+            self._load_metadata()
+        indexer = OrthogonalIndexer(selection, self)
+        await self._set_selection(indexer, value, fields=fields)
 
     async def get_coordinate_selection(self, selection, out=None, fields=None):
         if not self._cache_metadata:
@@ -208,8 +923,8 @@ class Array(ZA):
         # check args
         check_fields(fields, self._dtype)
 
-        # setup indexer
-        indexer = CoordinateIndexer(selection, self)
+        # setup indexer, grouping the points by chunk
+        indexer = PointIndexer(selection, self)
 
         # handle output - need to flatten
         if out is not None:
@@ -233,3 +948,353 @@ class Array(ZA):
         indexer = MaskIndexer(selection, self)
 
         return await self._get_selection(indexer=indexer, out=out, fields=fields)
+
+    async def set_coordinate_selection(self, selection, value, fields=None):
+        if not self._cache_metadata:
+            self._load_metadata()
+        indexer = PointIndexer(selection, self)
+        # the points are written in the flattened order of the selection
+        if not is_scalar(value, self._dtype):
+            value = np.asanyarray(value)
+            if value.ndim > 1:
+                value = value.reshape(-1)
+        await self._set_selection(indexer, value, fields=fields)
+
+    async def set_mask_selection(self, selection, value, fields=None):
+        if not self._cache_metadata:
+            self._load_metadata()
+        indexer = MaskIndexer(selection, self)
+        await self._set_selection(indexer, value, fields=fields)
+
+    async def _set_selection(self, indexer, value, fields=None):
+        check_fields(fields, self._dtype)
+        fields = check_no_multi_fields(fields)
+        sel_shape = indexer.shape
+        scalar = sel_shape == () or is_scalar(value, self._dtype)
+        if not scalar:
+            if not hasattr(value, "shape"):
+                value = np.asanyarray(value)
+            check_array_shape("value", value, sel_shape)
+
+        items = []
+        for chunk_coords, chunk_selection, out_selection in indexer:
+            if scalar:
+                chunk_value = value
+            else:
+                chunk_value = value[out_selection]
+                if indexer.drop_axes:
+                    # restore the dimensions dropped by integer selections
+                    item = [slice(None)] * self.ndim
+                    for axis in indexer.drop_axes:
+                        item[axis] = np.newaxis
+                    chunk_value = chunk_value[tuple(item)]
+            items.append(
+                (
+                    chunk_coords,
+                    self._chunk_key(chunk_coords),
+                    chunk_selection,
+                    chunk_value,
+                )
+            )
+        await self._store_chunks(items, fields)
+
+    async def _store_chunks(self, items, fields=None):
+        """Write the ``(chunk_coords, ckey, chunk_selection, value)`` items,
+        in batches of ``_fetch_batch_size`` chunks per ``setitems`` call and
+        at most ``_fetch_concurrency`` batches at a time"""
+        if self._read_only:
+            raise ReadOnlyError()
+        size = self._fetch_batch_size or 1
+        stats = FetchStats(size)
+        stats.chunks = len(items)
+
+        async def store_batch(batch):
+            async with self._fetch_slot(stats, len(batch)):
+                await self._chunk_setitems(batch, fields)
+
+        await self._before_deadline(
+            cancelling_gather(
+                *[store_batch(items[i : i + size]) for i in range(0, len(items), size)]
+            )
+        )
+
+    async def _chunk_setitems(self, items, fields=None):
+        # encode and store a batch of chunks, reading first those only
+        # partly overwritten
+        mapping = self._chunk_mapping
+        partial = [
+            ckey
+            for chunk_coords, ckey, chunk_selection, _ in items
+            if (fields or not is_total_slice(chunk_selection, self._chunks))
+            and not self._chunk_missing(chunk_coords)
+        ]
+        cdatas = await self._chunk_getitems_raw(partial) if partial else {}
+        encoded = await cancelling_gather(
+            *[
+                self._aprocess_for_setitem(
+                    cdatas.get(ckey), chunk_selection, value, fields
+                )
+                for _, ckey, chunk_selection, value in items
+            ]
+        )
+        to_store = {}
+        empty = []
+        for (_, ckey, _, _), cdata in zip(items, encoded):
+            if cdata is None:
+                empty.append(ckey)
+            else:
+                to_store[ckey] = cdata
+        if to_store:
+            if hasattr(mapping, "setitems"):
+                await mapping.setitems(to_store)
+            else:
+                await cancelling_gather(
+                    *[mapping.__setitem__(k, v) for k, v in to_store.items()]
+                )
+        if empty:
+            await self._chunk_delitems(empty)
+        # keep the chunk cache and chunk index in step with the store
+        for chunk_coords, ckey, _, _ in items:
+            if self._chunk_cache is not None:
+                self._chunk_cache.invalidate(self._cache_key(ckey))
+            self._mark_chunk(chunk_coords, to_store.get(ckey))
+
+    async def _chunk_getitems_raw(self, ckeys):
+        # the stored chunks of ``ckeys``, KeyError for the missing ones
+        mapping = self._chunk_mapping
+        if hasattr(mapping, "getitems"):
+            return await mapping.getitems(ckeys, on_error="return")
+
+        async def get(ckey):
+            try:
+                return await self.chunk_store[ckey]
+            except KeyError as e:
+                return e
+
+        return dict(zip(ckeys, await cancelling_gather(*map(get, ckeys))))
+
+    async def _aprocess_for_setitem(self, cdata, chunk_selection, value, fields=None):
+        """As _process_for_setitem, with the stored chunk ``cdata`` (``None``
+        or KeyError when there is none) already read, and returning the
+        encoded chunk, or ``None`` for a chunk that should not be stored"""
+        if is_total_slice(chunk_selection, self._chunks) and not fields:
+            # totally replace chunk
+            if is_scalar(value, self._dtype):
+                chunk = np.empty_like(
+                    self._meta_array,
+                    shape=self._chunks,
+                    dtype=self._dtype,
+                    order=self._order,
+                )
+                chunk.fill(value)
+            else:
+                chunk = value.astype(self._dtype, order=self._order, copy=False)
+        else:
+            # partially replace the contents of this chunk
+            if cdata is None or isinstance(cdata, KeyError):
+                chunk = self._new_chunk()
+            elif isinstance(cdata, BaseException):
+                raise cdata
+            else:
+                chunk = await self._adecode_chunk(cdata)
+                if not chunk.flags.writeable:
+                    chunk = chunk.copy(order="K")
+            if fields:
+                chunk[fields][chunk_selection] = value
+            else:
+                chunk[chunk_selection] = value
+        if not self._write_empty_chunks and all_equal(self._fill_value, chunk):
+            return None
+        return await self._aencode_chunk(chunk)
+
+    def _new_chunk(self):
+        # a chunk that was never written
+        if self._fill_value is not None:
+            chunk = np.empty_like(
+                self._meta_array,
+                shape=self._chunks,
+                dtype=self._dtype,
+                order=self._order,
+            )
+            chunk.fill(self._fill_value)
+        elif self._dtype == object:
+            chunk = np.empty(self._chunks, dtype=self._dtype, order=self._order)
+        else:
+            # N.B., use zeros here so any region beyond the array has consistent
+            # and compressible data
+            chunk = np.zeros_like(
+                self._meta_array,
+                shape=self._chunks,
+                dtype=self._dtype,
+                order=self._order,
+            )
+        return chunk
+
+    async def _aencode_chunk(self, chunk):
+        if self._decode_executor is None:
+            return self._encode_chunk(chunk)
+        return await self._decode_executor.encode(self, chunk)
+
+    async def _chunk_delitems(self, ckeys):
+        mapping = self._chunk_mapping
+
+        async def delete(ckey):
+            try:
+                await mapping.__delitem__(ckey)
+            except KeyError:
+                # never written
+                pass
+
+        await cancelling_gather(*map(delete, ckeys))
+
+    def _mark_chunk(self, chunk_coords, cdata):
+        # record in the chunk index that ``chunk_coords`` now holds ``cdata``,
+        # or nothing when ``None``
+        bitmap = self._chunk_bitmap
+        if bitmap is None or bitmap.shape != self._cdata_shape:
+            return
+        bitmap[chunk_coords] = cdata is not None
+        sizes = self._chunk_sizes
+        if sizes is not None and sizes.shape == bitmap.shape:
+            sizes[chunk_coords] = 0 if cdata is None else len(cdata)
+
+    async def resize(self, *args):
+        """Change the shape of the array, as zarr's ``resize`` does: the
+        array metadata is written again and the chunks now out of bounds are
+        deleted. Consolidated metadata is only updated in memory, see
+        ``consolidate_metadata``."""
+        if self._read_only:
+            raise ReadOnlyError()
+        if not self._cache_metadata:
+            self._load_metadata()
+        old_cdata_shape = self._cdata_shape
+        self._shape = normalize_resize_args(self._shape, *args)
+        await self._flush_metadata()
+        new_cdata_shape = self._cdata_shape
+        dropped = [
+            self._chunk_key(coords)
+            for coords in itertools.product(*map(range, old_cdata_shape))
+            if any(c >= n for c, n in zip(coords, new_cdata_shape))
+        ]
+        if dropped:
+            await self._chunk_delitems(dropped)
+        self._resize_chunk_index(old_cdata_shape)
+
+    def _resize_chunk_index(self, old_cdata_shape):
+        # chunks added by growing the array are known to be missing
+        if self._chunk_bitmap is None or self._chunk_bitmap.shape != old_cdata_shape:
+            return
+        overlap = tuple(
+            slice(0, min(o, n)) for o, n in zip(old_cdata_shape, self._cdata_shape)
+        )
+        for name in ("_chunk_bitmap", "_chunk_sizes"):
+            old = getattr(self, name)
+            if old is None or old.shape != old_cdata_shape:
+                continue
+            new = np.zeros(self._cdata_shape, dtype=old.dtype)
+            new[overlap] = old[overlap]
+            setattr(self, name, new)
+
+    async def _flush_metadata(self):
+        # as zarr's _flush_metadata_nosync, through the async store
+        if self._is_view:
+            raise PermissionError("operation not permitted for views")
+        meta = dict(
+            shape=self._shape,
+            chunks=self._chunks,
+            dtype=self._dtype,
+            compressor=self._compressor.get_config() if self._compressor else None,
+            fill_value=self._fill_value,
+            order=self._order,
+            filters=[f.get_config() for f in self._filters] if self._filters else None,
+            dimension_separator=self._dimension_separator,
+        )
+        await put_metadata(
+            self._store,
+            self._key_prefix + array_meta_key,
+            self._store._metadata_class.encode_array_metadata(meta),
+        )
+
+
+async def put_metadata(store, key, value):
+    """Write the metadata document ``value`` under ``key`` of ``store``. On a
+    ``ConsolidatedMetadataStore`` the consolidated metadata is updated in
+    memory and the document written to the store underneath."""
+    if isinstance(store, ConsolidatedMetadataStore):
+        store.metadata[key] = json_loads(value)
+        store = store.store
+    mapping = getattr(store, "_mutable_mapping", store)
+    result = mapping.__setitem__(key, value)
+    if inspect.isawaitable(result):
+        await result
+
+
+def _trace_cache_hit():
+    trace = tracing.current()
+    if trace is not None:
+        trace.cache_hits += 1
+
+
+async def get_many(arrays):
+    """Read each of ``arrays`` whole.
+
+    The chunks of all arrays sharing a chunk store with a ``getitems`` method
+    are fetched with a single call, so that reading many small arrays, such
+    as coordinates, takes one request instead of one per array.
+    """
+    results = [None] * len(arrays)
+    groups = {}
+    singles = []
+    for i, array in enumerate(arrays):
+        mapping = array._chunk_mapping
+        if array.ndim and hasattr(mapping, "getitems"):
+            groups.setdefault(id(mapping), (mapping, []))[1].append(i)
+        else:
+            singles.append(i)
+
+    async def read(i):
+        results[i] = await arrays[i][...]
+
+    async def read_group(mapping, indices):
+        trace = tracing.current()
+        plans = []
+        ckeys = []
+        for i in indices:
+            array = arrays[i]
+            indexer = BasicIndexer(Ellipsis, array)
+            out = results[i] = np.empty_like(
+                array._meta_array,
+                shape=indexer.shape,
+                dtype=array._dtype,
+                order=array._order,
+            )
+            items = []
+            for chunk_coords, chunk_selection, out_selection in indexer:
+                if array._chunk_missing(chunk_coords):
+                    array._fill_chunk(out, out_selection)
+                    if trace is not None:
+                        trace.chunks_skipped += 1
+                    continue
+                if trace is not None:
+                    trace.chunks_requested += 1
+                ckey = array._chunk_key(chunk_coords)
+                chunk = array._cached_chunk(ckey)
+                if chunk is None:
+                    items.append((ckey, chunk_selection, out_selection))
+                    ckeys.append(ckey)
+                else:
+                    _trace_cache_hit()
+                    array._copy_chunk(
+                        out, chunk, chunk_selection, (), None, out_selection
+                    )
+            plans.append((array, out, items))
+        cdatas = await mapping.getitems(ckeys, on_error="return") if ckeys else {}
+        await cancelling_gather(
+            *[array._scatter_chunks(cdatas, items, out) for array, out, items in plans]
+        )
+
+    await cancelling_gather(
+        *[read(i) for i in singles],
+        *[read_group(mapping, indices) for mapping, indices in groups.values()],
+    )
+    return results
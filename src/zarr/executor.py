@@ -0,0 +1,241 @@
+import asyncio
+import functools
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+from numcodecs import get_codec
+from numcodecs.compat import ensure_bytes, ensure_ndarray_like
+
+
+def _decode_into_shared_memory(name, cdata, compressor, filters, dtype, shape, order):
+    """Decode one chunk in a worker process into the shared memory block
+    ``name`` and return the time spent decoding"""
+    start = time.perf_counter()
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        dest = np.ndarray(shape, dtype=dtype, buffer=shm.buf, order=order)
+        if compressor and not filters:
+            get_codec(compressor).decode(cdata, out=dest)
+        else:
+            chunk = cdata
+            if compressor:
+                chunk = get_codec(compressor).decode(chunk)
+            for f in reversed(filters or []):
+                chunk = get_codec(f).decode(chunk)
+            chunk = ensure_ndarray_like(chunk).view(dtype)
+            dest[...] = chunk.reshape(-1, order="A").reshape(shape, order=order)
+        del dest
+    finally:
+        shm.close()
+    return time.perf_counter() - start
+
+
+def _encode_timed(chunk, compressor, filters):
+    """Encode one chunk in a worker process, returning the encoded bytes and
+    the time spent encoding"""
+    start = time.perf_counter()
+    for f in filters or []:
+        chunk = get_codec(f).encode(chunk)
+    if compressor:
+        chunk = get_codec(compressor).encode(chunk)
+    return ensure_bytes(chunk), time.perf_counter() - start
+
+
+class DecodeExecutor:
+    """Decide where chunks are decoded: inline on the event loop or in an
+    executor.
+
+    Chunks whose decoded size is under ``threshold`` bytes are decoded inline,
+    larger ones are sent to ``executor``. With ``adaptive=True`` the threshold
+    follows the measured decode throughput so that an inline decode blocks the
+    loop for at most ``target_latency`` seconds.
+
+    Chunks encoded for writing follow the same rule: a process pool gets
+    the decoded chunk and returns the encoded bytes.
+
+    Parameters
+    ----------
+    executor : concurrent.futures.Executor, optional
+        ``None`` decodes everything inline. A ``ThreadPoolExecutor`` runs the
+        whole decode-and-copy in a worker thread. A ``ProcessPoolExecutor``
+        decodes into a shared memory block which is then copied into the
+        output on the loop.
+    threshold : int
+        Initial decoded chunk size, in bytes, from which chunks are offloaded.
+    target_latency : float
+        Longest time, in seconds, an inline decode should take.
+    adaptive : bool
+        Whether to adjust ``threshold`` from observed decode times.
+    """
+
+    def __init__(
+        self,
+        executor=None,
+        threshold=2**18,
+        target_latency=1e-3,
+        adaptive=True,
+        min_threshold=2**12,
+        max_threshold=2**26,
+    ):
+        self.executor = executor
+        self.threshold = threshold
+        self.target_latency = target_latency
+        self.adaptive = adaptive
+        self.min_threshold = min_threshold
+        self.max_threshold = max_threshold
+        self.inline = 0
+        self.offloaded = 0
+        self._throughput = None
+
+    def __repr__(self):
+        return (
+            f"DecodeExecutor(executor={self.executor!r}, threshold={self.threshold}, "
+            f"inline={self.inline}, offloaded={self.offloaded})"
+        )
+
+    def _observe(self, nbytes, elapsed):
+        if not self.adaptive or elapsed <= 0:
+            return
+        rate = nbytes / elapsed
+        if self._throughput is None:
+            self._throughput = rate
+        else:
+            self._throughput = 0.8 * self._throughput + 0.2 * rate
+        self.threshold = int(
+            min(
+                max(self._throughput * self.target_latency, self.min_threshold),
+                self.max_threshold,
+            )
+        )
+
+    def should_offload(self, array):
+        return (
+            self.executor is not None
+            and array._dtype != object
+            and array._chunk_nbytes >= self.threshold
+        )
+
+    async def process(
+        self,
+        array,
+        out,
+        cdata,
+        chunk_selection,
+        drop_axes,
+        out_is_ndarray,
+        fields,
+        out_selection,
+    ):
+        """Decode ``cdata`` and store the selected part of it in ``out``, as
+        ``Array._process_chunk`` does"""
+        args = (
+            out,
+            cdata,
+            chunk_selection,
+            drop_axes,
+            out_is_ndarray,
+            fields,
+            out_selection,
+        )
+        if isinstance(self.executor, ProcessPoolExecutor) and self.should_offload(
+            array
+        ):
+            await self._decode_in_subprocess(
+                array,
+                cdata,
+                lambda chunk: array._copy_chunk(
+                    out, chunk, chunk_selection, drop_axes, fields, out_selection
+                ),
+            )
+        else:
+            await self._run(array, array._process_chunk, *args)
+
+    async def decode(self, array, cdata):
+        """Decode ``cdata`` into a new chunk array"""
+        if isinstance(self.executor, ProcessPoolExecutor) and self.should_offload(
+            array
+        ):
+            decoded = []
+            await self._decode_in_subprocess(
+                array, cdata, lambda chunk: decoded.append(chunk.copy())
+            )
+            return decoded[0]
+        return await self._run(array, array._decode_chunk, cdata)
+
+    async def encode(self, array, chunk):
+        """Encode ``chunk`` for storage, as ``Array._encode_chunk`` does. Chunks
+        are offloaded under the same rule as decodes."""
+        if isinstance(self.executor, ProcessPoolExecutor) and self.should_offload(
+            array
+        ):
+            self.offloaded += 1
+            loop = asyncio.get_running_loop()
+            cdata, elapsed = await loop.run_in_executor(
+                self.executor,
+                _encode_timed,
+                chunk,
+                array._compressor.get_config() if array._compressor else None,
+                [f.get_config() for f in array._filters or []],
+            )
+            self._observe(array._chunk_nbytes, elapsed)
+            return cdata
+        return await self._run(array, array._encode_chunk, chunk)
+
+    async def _run(self, array, func, *args):
+        if self.should_offload(array):
+            self.offloaded += 1
+            loop = asyncio.get_running_loop()
+            result, elapsed = await loop.run_in_executor(
+                self.executor, functools.partial(_timed, func, *args)
+            )
+        else:
+            self.inline += 1
+            result, elapsed = _timed(func, *args)
+        self._observe(array._chunk_nbytes, elapsed)
+        return result
+
+    async def _decode_in_subprocess(self, array, cdata, consume):
+        # the worker decodes into a shared memory block and ``consume`` is
+        # handed a view of it, which must not outlive the call
+        self.offloaded += 1
+        loop = asyncio.get_running_loop()
+        shm = shared_memory.SharedMemory(create=True, size=array._chunk_nbytes)
+        try:
+            elapsed = await loop.run_in_executor(
+                self.executor,
+                _decode_into_shared_memory,
+                shm.name,
+                ensure_bytes(cdata),
+                array._compressor.get_config() if array._compressor else None,
+                [f.get_config() for f in array._filters or []],
+                array._dtype,
+                array._chunks,
+                array._order,
+            )
+            chunk = np.ndarray(
+                array._chunks, dtype=array._dtype, buffer=shm.buf, order=array._order
+            )
+            try:
+                consume(chunk)
+            except BaseException as e:
+                # the frames of the traceback hold the view as well
+                traceback.clear_frames(e.__traceback__)
+                raise
+            finally:
+                # no views may be left when the block is closed
+                del chunk
+        finally:
+            try:
+                shm.close()
+            finally:
+                shm.unlink()
+        self._observe(array._chunk_nbytes, elapsed)
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
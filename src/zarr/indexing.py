@@ -1,12 +1,17 @@
+import numpy as np
 from zarr.errors import VindexInvalidSelectionError
 from zarr.indexing import OIndex as ZO
 from zarr.indexing import VIndex as ZV
 from zarr.indexing import (
+    ChunkProjection,
+    boundscheck_indices,
     ensure_tuple,
     is_coordinate_selection,
+    is_integer,
     is_mask_selection,
     pop_fields,
     replace_lists,
+    wraparound_indices,
 )
 
 
@@ -37,3 +42,74 @@ class VIndex(ZV):
             return await self.array.get_mask_selection(selection, fields=fields)
         else:
             raise VindexInvalidSelectionError(selection)
+
+    async def __setitem__(self, selection, value):
+        fields, selection = pop_fields(selection)
+        selection = ensure_tuple(selection)
+        selection = replace_lists(selection)
+        if is_coordinate_selection(selection, self.array):
+            await self.array.set_coordinate_selection(selection, value, fields=fields)
+        elif is_mask_selection(selection, self.array):
+            await self.array.set_mask_selection(selection, value, fields=fields)
+        else:
+            raise VindexInvalidSelectionError(selection)
+
+
+class PointIndexer:
+    """Coordinate selection grouped by chunk.
+
+    Does what zarr's ``CoordinateIndexer`` does, with the grouping done by
+    sorting the points' chunk ids, so that the work is bounded by the number
+    of points and the chunks they touch rather than by the number of chunks
+    in the array. Each touched chunk is yielded once, with the positions of
+    all its points in the chunk and in the output.
+    """
+
+    def __init__(self, selection, array):
+        selection = ensure_tuple(selection)
+        selection = tuple([i] if is_integer(i) else i for i in selection)
+        selection = replace_lists(selection)
+        if not is_coordinate_selection(selection, array):
+            raise IndexError(
+                "invalid coordinate selection; expected one integer "
+                "(coordinate) array per dimension of the target array, "
+                "got {!r}".format(selection)
+            )
+        selection = [np.asarray(dim_sel) for dim_sel in selection]
+        for dim_sel, dim_len in zip(selection, array.shape):
+            wraparound_indices(dim_sel, dim_len)
+            boundscheck_indices(dim_sel, dim_len)
+
+        selection = np.broadcast_arrays(*selection)
+        self.sel_shape = selection[0].shape if selection[0].shape else (1,)
+        selection = [dim_sel.reshape(-1) for dim_sel in selection]
+
+        chunk_ids = np.ravel_multi_index(
+            [dim_sel // n for dim_sel, n in zip(selection, array._chunks)],
+            dims=array._cdata_shape,
+        )
+        order = np.argsort(chunk_ids, kind="stable")
+        ids, starts = np.unique(chunk_ids[order], return_index=True)
+
+        self.selection = tuple(dim_sel[order] for dim_sel in selection)
+        self.order = order
+        self.bounds = np.append(starts, len(order))
+        self.chunk_coords = np.unravel_index(ids, array._cdata_shape)
+        self.shape = (len(order),)
+        self.drop_axes = None
+        self.array = array
+
+    @property
+    def nchunks(self):
+        return len(self.bounds) - 1
+
+    def __iter__(self):
+        chunks = self.array._chunks
+        for i in range(self.nchunks):
+            start, stop = self.bounds[i], self.bounds[i + 1]
+            chunk_coords = tuple(int(c[i]) for c in self.chunk_coords)
+            chunk_selection = tuple(
+                dim_sel[start:stop] - c * n
+                for dim_sel, c, n in zip(self.selection, chunk_coords, chunks)
+            )
+            yield ChunkProjection(chunk_coords, chunk_selection, self.order[start:stop])
@@ -1,18 +1,59 @@
+import base64
+import math
+import weakref
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+from numcodecs import get_codec
 from zarr.errors import MetadataError
 from zarr.storage import ConsolidatedMetadataStore as zCMS
-from zarr.storage import KVStore, Store, StoreLike
-from zarr.util import json_loads
+from zarr.storage import (
+    KVStore,
+    Store,
+    StoreLike,
+    array_meta_key,
+    attrs_key,
+    group_meta_key,
+)
+from zarr.util import json_dumps, json_loads
+
+from .util import cancelling_gather
 
 
 class ConsolidatedMetadataStore(zCMS):
-    def __init__(self, store: StoreLike, metadata_key=".zmetadata"):
-        self.init_coro = self.ainit(store, metadata_key)
+    """Read-only store of the consolidated metadata of ``store``.
+
+    With ``crawl=True`` the metadata is not read from ``metadata_key`` but
+    gathered from the metadata documents of the hierarchy under
+    ``crawl_path``, see ``crawl_metadata``, for stores that were never
+    consolidated.
+    """
+
+    def __init__(
+        self, store: StoreLike, metadata_key=".zmetadata", crawl=False, crawl_path=""
+    ):
+        self.init_coro = self.ainit(store, metadata_key, crawl, crawl_path)
 
-    async def ainit(self, store: StoreLike, metadata_key=".zmetadata"):
+    async def ainit(
+        self, store: StoreLike, metadata_key=".zmetadata", crawl=False, crawl_path=""
+    ):
         self.store = Store._ensure_store(store)
+        self.metadata_key = metadata_key
+        self.crawl = crawl
+        self.crawl_path = crawl_path
+        await self.reload()
+
+    async def reload(self):
+        """(Re)load the consolidated metadata from the store"""
+        if self.crawl:
+            mapping = getattr(self.store, "_mutable_mapping", self.store)
+            self.metadata = await crawl_metadata(mapping, self.crawl_path)
+            self.meta_store = KVStore(self.metadata)
+            return
 
         # retrieve consolidated metadata
-        meta = json_loads(await self.store[metadata_key])
+        meta = json_loads(await self.store[self.metadata_key])
 
         # check format of consolidated metadata
         consolidated_format = meta.get("zarr_consolidated_format", None)
@@ -23,4 +64,430 @@ class ConsolidatedMetadataStore(zCMS):
             )
 
         # decode metadata
-        self.meta_store: Store = KVStore(meta["metadata"])
+        self.metadata = meta["metadata"]
+        self.meta_store: Store = KVStore(self.metadata)
+
+    def array_metadata(self, path):
+        """Return the ``ArrayMetadata`` of the array at ``path``, or ``None``
+        if there is no such array"""
+        prefix = path + "/" if path else ""
+        meta = self.metadata.get(prefix + array_meta_key)
+        if meta is None:
+            return None
+        return ArrayMetadata(
+            self._metadata_class.decode_array_metadata(meta),
+            dict(self.metadata.get(prefix + attrs_key, {})),
+        )
+
+
+class ArrayMetadata:
+    """What describing an array takes, read from consolidated metadata
+    without building an ``Array``: shape, dtype, chunks, fill value, codecs
+    and attributes"""
+
+    __slots__ = (
+        "shape",
+        "dtype",
+        "chunks",
+        "fill_value",
+        "compressor",
+        "filters",
+        "attrs",
+    )
+
+    def __init__(self, meta, attrs):
+        self.shape = meta["shape"]
+        self.dtype = meta["dtype"]
+        self.chunks = meta["chunks"]
+        self.fill_value = meta["fill_value"]
+        compressor = meta.get("compressor")
+        self.compressor = get_codec(compressor) if compressor else None
+        filters = meta.get("filters")
+        self.filters = [get_codec(f) for f in filters] if filters else filters
+        self.attrs = attrs
+
+
+class LRUChunkCache:
+    """Least-recently-used cache of decoded chunks shared between arrays.
+
+    Entries are keyed by ``(store, chunk key)``, the store being its
+    filesystem and root for fsspec mappings, and stored read-only, so
+    arrays handed out by the cache cannot be modified in place. Share one
+    instance between arrays to put a global cap on the memory they use.
+
+    Parameters
+    ----------
+    max_size : int
+        The maximum size that the cache may grow to, in number of bytes. Provide
+        `None` if you would like the cache to have unlimited size.
+    """
+
+    def __init__(self, max_size):
+        self._max_size = max_size
+        self._current_size = 0
+        self._values_cache = OrderedDict()
+        self._mutex = Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._values_cache)
+
+    def __contains__(self, key):
+        # neither a use of the entry nor a hit or miss
+        return key in self._values_cache
+
+    def __repr__(self):
+        return (
+            f"LRUChunkCache(max_size={self._max_size}, size={self._current_size}, "
+            f"hits={self.hits}, misses={self.misses}, evictions={self.evictions})"
+        )
+
+    @property
+    def nbytes(self):
+        return self._current_size
+
+    def get(self, key):
+        """Return the cached chunk for ``key`` or ``None``"""
+        with self._mutex:
+            try:
+                chunk = self._values_cache[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._values_cache.move_to_end(key)
+            self.hits += 1
+            return chunk
+
+    def put(self, key, chunk):
+        """Cache ``chunk`` under ``key`` and return the read-only cached array"""
+        chunk.setflags(write=False)
+        with self._mutex:
+            if key in self._values_cache:
+                self._current_size -= self._values_cache.pop(key).nbytes
+            # chunks larger than the whole cache are never going to be cached
+            if self._max_size is None or chunk.nbytes <= self._max_size:
+                self._accommodate_value(chunk.nbytes)
+                self._values_cache[key] = chunk
+                self._current_size += chunk.nbytes
+        return chunk
+
+    def _accommodate_value(self, value_size):
+        if self._max_size is None:
+            return
+        # ensure there is enough space in the cache for a new value
+        while self._current_size + value_size > self._max_size:
+            _, v = self._values_cache.popitem(last=False)
+            self._current_size -= v.nbytes
+            self.evictions += 1
+
+    def invalidate(self, key=None):
+        """Drop ``key`` from the cache, or everything when ``key`` is None"""
+        with self._mutex:
+            if key is None:
+                self._values_cache.clear()
+                self._current_size = 0
+            elif key in self._values_cache:
+                self._current_size -= self._values_cache.pop(key).nbytes
+
+    def invalidate_prefix(self, root, prefix):
+        """Drop every chunk of store ``root`` whose key starts with ``prefix``"""
+        with self._mutex:
+            for key in [
+                k
+                for k in self._values_cache
+                if k[0] == root and k[1].startswith(prefix)
+            ]:
+                self._current_size -= self._values_cache.pop(key).nbytes
+
+
+class BufferPool:
+    """Pool of reusable buffers for decoded chunks and selection outputs.
+
+    Buffers are allocated in power of two size classes and handed out as
+    arrays viewing them. An array given back with ``release`` returns its
+    buffer to the pool for the next request of the same size class; arrays
+    never released are simply garbage collected. Share one instance between
+    arrays to bound the memory kept idle.
+
+    Parameters
+    ----------
+    max_size : int
+        The maximum number of bytes kept idle in the pool.
+    min_size : int
+        Requests smaller than this, in bytes, are not pooled.
+    """
+
+    def __init__(self, max_size=2**28, min_size=2**12):
+        self._max_size = max_size
+        self._min_size = min_size
+        self._current_size = 0
+        self._free = {}
+        # buffers handed out, by id
+        self._issued = weakref.WeakValueDictionary()
+        self._mutex = Lock()
+        self.hits = self.misses = 0
+
+    def __repr__(self):
+        return (
+            f"BufferPool(max_size={self._max_size}, size={self._current_size}, "
+            f"hits={self.hits}, misses={self.misses})"
+        )
+
+    @property
+    def nbytes(self):
+        return self._current_size
+
+    def empty(self, shape, dtype, order="C"):
+        """An uninitialised array of ``shape`` and ``dtype`` on a pooled
+        buffer, as ``np.empty``"""
+        dtype = np.dtype(dtype)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        if nbytes < self._min_size or dtype.hasobject:
+            return np.empty(shape, dtype=dtype, order=order)
+        size_class = 1 << (nbytes - 1).bit_length()
+        with self._mutex:
+            free = self._free.get(size_class)
+            if free:
+                buffer = free.pop()
+                self._current_size -= size_class
+                self.hits += 1
+            else:
+                buffer = None
+                self.misses += 1
+        if buffer is None:
+            buffer = np.empty(size_class, dtype="u1")
+        self._issued[id(buffer)] = buffer
+        return np.ndarray(shape, dtype=dtype, buffer=buffer, order=order)
+
+    def release(self, array):
+        """Give the buffer of ``array``, an array from ``empty`` or a view of
+        one, back to the pool; other arrays are ignored. Neither ``array``
+        nor any other view of its buffer may be used afterwards."""
+        buffer = getattr(array, "base", None)
+        with self._mutex:
+            if buffer is None or self._issued.get(id(buffer)) is not buffer:
+                return
+            del self._issued[id(buffer)]
+            if self._current_size + buffer.nbytes <= self._max_size:
+                self._free.setdefault(buffer.nbytes, []).append(buffer)
+                self._current_size += buffer.nbytes
+
+    def clear(self):
+        with self._mutex:
+            self._free.clear()
+            self._current_size = 0
+
+
+# consolidated metadata entry holding the chunk bitmap of an array
+CHUNK_INDEX_KEY = ".zchunks"
+
+
+class ChunkIndex:
+    """Which chunks of the arrays of a store exist.
+
+    Holds a boolean array over the chunk grid of each array, by array path,
+    read from ``<array>/.zchunks`` entries of the consolidated metadata or
+    built by listing the store once. Chunks marked missing are filled with
+    the fill value without a request. Arrays without a bitmap, or whose
+    chunk grid no longer matches theirs, are read as usual.
+
+    An index built by listing also holds the stored size of every chunk, in
+    ``sizes``, which the query planner uses to estimate the bytes a
+    selection fetches. Sizes are not written to the metadata.
+    """
+
+    def __init__(self, bitmaps=None, sizes=None):
+        self.bitmaps = dict(bitmaps or {})
+        self.sizes = dict(sizes or {})
+
+    def __len__(self):
+        return len(self.bitmaps)
+
+    def __repr__(self):
+        chunks = sum(b.size for b in self.bitmaps.values())
+        present = sum(int(b.sum()) for b in self.bitmaps.values())
+        return f"ChunkIndex(arrays={len(self)}, chunks={present}/{chunks})"
+
+    def get(self, path):
+        """The bitmap of the array at ``path``, or ``None``"""
+        return self.bitmaps.get(path)
+
+    def chunk_sizes(self, path):
+        """The stored chunk sizes of the array at ``path``, 0 for missing
+        chunks, or ``None`` if they are not known"""
+        return self.sizes.get(path)
+
+    def update(self, other):
+        self.bitmaps.update(other.bitmaps)
+        self.sizes.update(other.sizes)
+        for path in other.bitmaps.keys() - other.sizes.keys():
+            # sizes of an older listing
+            self.sizes.pop(path, None)
+
+    @classmethod
+    def from_metadata(cls, metadata):
+        """The bitmaps found in consolidated ``metadata``"""
+        bitmaps = {}
+        for key, entry in metadata.items():
+            if key == CHUNK_INDEX_KEY or key.endswith("/" + CHUNK_INDEX_KEY):
+                shape = tuple(entry["shape"])
+                bits = np.frombuffer(base64.b64decode(entry["bitmap"]), dtype="u1")
+                bitmaps[key[: -len(CHUNK_INDEX_KEY)].rstrip("/")] = (
+                    np.unpackbits(bits, count=math.prod(shape))
+                    .astype(bool)
+                    .reshape(shape)
+                )
+        return cls(bitmaps)
+
+    def to_metadata(self):
+        """The bitmaps as consolidated metadata entries"""
+        return {
+            (f"{path}/" if path else "")
+            + CHUNK_INDEX_KEY: {
+                "shape": list(bitmap.shape),
+                "bitmap": base64.b64encode(np.packbits(bitmap)).decode(),
+            }
+            for path, bitmap in self.bitmaps.items()
+        }
+
+    @classmethod
+    async def from_listing(cls, mapping, metadata, paths):
+        """Build the bitmaps of the arrays at ``paths``, described in
+        consolidated ``metadata``, by listing ``mapping``, an ``AsyncFSMap``.
+        One listing of the longest common prefix covers all of them."""
+        grids = {}
+        for path in paths:
+            prefix = f"{path}/" if path else ""
+            meta = metadata[prefix + array_meta_key]
+            grids[path] = (
+                tuple(math.ceil(s / c) for s, c in zip(meta["shape"], meta["chunks"])),
+                meta.get("dimension_separator") or ".",
+            )
+        bitmaps = {
+            path: np.zeros(shape, dtype=bool) for path, (shape, _) in grids.items()
+        }
+        sizes = {
+            path: np.zeros(shape, dtype="i8") for path, (shape, _) in grids.items()
+        }
+        if not grids:
+            return cls(bitmaps, sizes)
+        root = "/".join(_common_parts(list(grids)))
+        listing = await mapping.fs._find(mapping._key_to_str(root), detail=True)
+        for name, info in listing.items():
+            key = mapping._str_to_key(name)
+            parts = key.split("/")
+            # the array holding ``key``, which may be nested under a group or
+            # split in directories by a "/" dimension separator
+            for i in range(len(parts) - 1, -1, -1):
+                path = "/".join(parts[:i])
+                if path in grids:
+                    break
+            else:
+                continue
+            shape, separator = grids[path]
+            chunk_key = "/".join(parts[i:])
+            if chunk_key.startswith("."):
+                continue
+            try:
+                coords = tuple(int(c) for c in chunk_key.split(separator))
+            except ValueError:
+                continue
+            if not shape and coords == (0,):
+                # the single chunk of a 0-d array
+                coords = ()
+            if len(coords) == len(shape) and all(
+                0 <= c < s for c, s in zip(coords, shape)
+            ):
+                bitmaps[path][coords] = True
+                sizes[path][coords] = info.get("size") or 0
+        return cls(bitmaps, sizes)
+
+
+def _common_parts(paths):
+    # the path components shared by all of ``paths``
+    split = [p.split("/") if p else [] for p in paths]
+    common = []
+    for parts in zip(*split):
+        if any(p != parts[0] for p in parts):
+            break
+        common.append(parts[0])
+    return common
+
+
+def array_paths(metadata, group=None):
+    """Paths of the arrays under ``group`` in consolidated ``metadata``"""
+    prefix = f"{group.strip('/')}/" if group else ""
+    suffix = "/" + array_meta_key
+    return [
+        key[: -len(suffix)] if key != array_meta_key else ""
+        for key in metadata
+        if (key == array_meta_key and not prefix)
+        or (key.endswith(suffix) and key.startswith(prefix))
+    ]
+
+
+async def crawl_metadata(mapping, group=None):
+    """The metadata documents of the hierarchy under ``group`` of ``mapping``,
+    an ``AsyncFSMap``, by key, as consolidated metadata holds them.
+
+    The hierarchy is walked one level of groups at a time: the directories
+    of every group found are listed together, then the metadata documents
+    of all of their subdirectories are fetched in one ``getitems`` call.
+    Arrays are never listed, so that a crawl costs two round trips per
+    level of nesting however many chunks the store holds.
+    """
+    prefix = f"{group.strip('/')}/" if group else ""
+    names = (group_meta_key, array_meta_key, attrs_key)
+    metadata = {}
+    level = [prefix]
+    while level:
+        found = await mapping.getitems(
+            [node + name for node in level for name in names], on_error="omit"
+        )
+        metadata.update((key, json_loads(value)) for key, value in found.items())
+        groups = [node for node in level if node + group_meta_key in found]
+        listings = await cancelling_gather(
+            *[
+                mapping.fs._ls(mapping._key_to_str(node).rstrip("/"), detail=True)
+                for node in groups
+            ]
+        )
+        level = [
+            node + info["name"].rstrip("/").rsplit("/", 1)[-1] + "/"
+            for node, listing in zip(groups, listings)
+            for info in listing
+            if info["type"] == "directory"
+        ]
+    return metadata
+
+
+async def load_chunk_index(zarr_group):
+    """The ``ChunkIndex`` of the arrays of a consolidated ``zarr_group``:
+    bitmaps found in its metadata, and by listing its chunk store for the
+    arrays without one when that is an ``AsyncFSMap``"""
+    metadata = zarr_group.store.metadata
+    index = ChunkIndex.from_metadata(metadata)
+    unindexed = [
+        path
+        for path in array_paths(metadata, zarr_group.path)
+        if index.get(path) is None
+    ]
+    chunk_store = zarr_group.chunk_store
+    mapping = getattr(chunk_store, "_mutable_mapping", chunk_store)
+    if unindexed and hasattr(mapping, "fs"):
+        index.update(await ChunkIndex.from_listing(mapping, metadata, unindexed))
+    return index
+
+
+async def write_chunk_index(mapping, group=None, metadata_key=".zmetadata"):
+    """List the chunks of the arrays under ``group`` of the consolidated store
+    in ``mapping``, an ``AsyncFSMap``, and add their bitmaps to its
+    consolidated metadata. Returns the ``ChunkIndex`` written."""
+    meta = json_loads(await mapping[metadata_key])
+    metadata = meta["metadata"]
+    index = await ChunkIndex.from_listing(
+        mapping, metadata, array_paths(metadata, group)
+    )
+    metadata.update(index.to_metadata())
+    await mapping.__setitem__(metadata_key, json_dumps(meta))
+    return index
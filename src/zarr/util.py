@@ -0,0 +1,198 @@
+import asyncio
+import collections
+
+import numpy as np
+from numcodecs.blosc import cbuffer_metainfo, cbuffer_sizes
+
+# header of a blosc buffer
+_BLOSC_HEADER = 16
+
+
+async def cancelling_gather(*aws):
+    """As ``asyncio.gather``, with task group semantics.
+
+    When one of ``aws`` raises, the others are cancelled, and when the
+    caller is cancelled, all of them are. Either way they are waited for
+    before the error propagates, so that no fetch or decode outlives the
+    call. The first error, in argument order, is raised.
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    if not tasks:
+        return []
+    try:
+        _, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    except asyncio.CancelledError:
+        try:
+            await _cancel_and_wait(tasks)
+        finally:
+            _exceptions(tasks)
+        raise
+    if pending:
+        await _cancel_and_wait(pending)
+    for error in _exceptions(tasks):
+        if error is not None:
+            raise error
+    return [task.result() for task in tasks]
+
+
+def _exceptions(tasks):
+    # the error of each task that finished, ``None`` for those that did not
+    # raise; retrieving them all keeps asyncio from logging the ones not
+    # passed on as never retrieved
+    return [
+        task.exception() if task.done() and not task.cancelled() else None
+        for task in tasks
+    ]
+
+
+async def read_ahead(items, fetch, ahead=1, ordered=True):
+    """Yield ``(item, await fetch(item))`` for each of ``items``.
+
+    Up to ``ahead`` fetches run beyond the one being waited for, so at most
+    ``ahead + 1`` results are held at a time. With ``ordered=False`` results
+    are yielded as they arrive rather than in the order of ``items``.
+    Closing the generator cancels the fetches still running.
+    """
+    items = iter(items)
+    pending = collections.deque()
+
+    def fill():
+        while len(pending) <= ahead:
+            item = next(items, _END)
+            if item is _END:
+                return
+            pending.append((item, asyncio.ensure_future(fetch(item))))
+
+    try:
+        fill()
+        while pending:
+            if ordered:
+                item, task = pending[0]
+                await asyncio.wait([task])
+            else:
+                await asyncio.wait(
+                    [task for _, task in pending], return_when=asyncio.FIRST_COMPLETED
+                )
+                item, task = next(p for p in pending if p[1].done())
+            pending.remove((item, task))
+            result = task.result()
+            # start the next fetch before handing this result over
+            fill()
+            yield item, result
+    finally:
+        if pending:
+            await _cancel_and_wait([task for _, task in pending])
+
+
+_END = object()
+
+
+async def _cancel_and_wait(tasks):
+    for task in tasks:
+        task.cancel()
+    cancelled = False
+    while True:
+        try:
+            await asyncio.wait(tasks)
+            break
+        except asyncio.CancelledError:
+            # keep waiting for the tasks to wind down, then pass it on
+            cancelled = True
+    if cancelled:
+        raise asyncio.CancelledError
+
+
+class AsyncPartialReadBuffer:
+    """Read runs of items from a stored chunk with ranged requests.
+
+    The async counterpart of zarr's ``PartialReadBuffer``. Uncompressed
+    chunks are read by byte range. For blosc chunks the header and block
+    offsets are read first, then only the compressed blocks holding the
+    wanted items, which are decompressed with ``decode_partial``.
+
+    Parameters
+    ----------
+    mapping : AsyncFSMap
+        Chunk store providing ``cat_range``.
+    key : str
+        Chunk key.
+    compressor : numcodecs.abc.Codec or None
+        ``None`` or a ``Blosc`` codec.
+    itemsize : int
+        Size of an item, in bytes.
+    """
+
+    def __init__(self, mapping, key, compressor, itemsize):
+        self.mapping = mapping
+        self.key = key
+        self.compressor = compressor
+        self.itemsize = itemsize
+        self.nbytes_read = 0
+
+    async def _read(self, start, end):
+        data = await self.mapping.cat_range(self.key, start, end)
+        self.nbytes_read += len(data)
+        return data
+
+    async def read_items(self, runs):
+        """Return the bytes of each ``(start, nitems)`` run of items"""
+        if self.compressor is None:
+            return await self._read_ranges(runs, offset=0)
+
+        header = await self._read(0, _BLOSC_HEADER)
+        nbytes, cbytes, blocksize = cbuffer_sizes(header)
+        typesize, _, memcpyed = cbuffer_metainfo(header)
+        if memcpyed and typesize == self.itemsize:
+            # stored without compression after the header
+            return await self._read_ranges(runs, offset=_BLOSC_HEADER)
+        nblocks = -(-nbytes // blocksize)
+        if nblocks == 1 or memcpyed or typesize != self.itemsize:
+            buff = await self._read(None, None)
+            return [self.compressor.decode_partial(buff, s, n) for s, n in runs]
+
+        bstarts = await self._read(_BLOSC_HEADER, _BLOSC_HEADER + 4 * nblocks)
+        offsets = np.frombuffer(bstarts, dtype="<i4", count=nblocks)
+        ends = np.empty_like(offsets)
+        order = np.argsort(offsets)
+        ends[order[:-1]] = offsets[order[1:]]
+        ends[order[-1]] = cbytes
+
+        per_block = blocksize // typesize
+        blocks = set()
+        for start, nitems in runs:
+            blocks.update(
+                range(start // per_block, (start + nitems - 1) // per_block + 1)
+            )
+        # unread blocks stay zeroed, blosc only looks at the ones it needs
+        buff = bytearray(cbytes)
+        buff[:_BLOSC_HEADER] = header
+        buff[_BLOSC_HEADER : _BLOSC_HEADER + len(bstarts)] = bstarts
+        spans = _merge([(int(offsets[b]), int(ends[b])) for b in sorted(blocks)])
+        datas = await cancelling_gather(*[self._read(s, e) for s, e in spans])
+        for (s, e), data in zip(spans, datas):
+            buff[s:e] = data
+        return [self.compressor.decode_partial(buff, s, n) for s, n in runs]
+
+    async def _read_ranges(self, runs, offset):
+        size = self.itemsize
+        ranges = [(offset + s * size, offset + (s + n) * size) for s, n in runs]
+        spans = _merge(sorted(ranges))
+        datas = await cancelling_gather(*[self._read(s, e) for s, e in spans])
+        # the span holding each run
+        starts = [span[0] for span in spans]
+        out = []
+        for s, e in ranges:
+            i = np.searchsorted(starts, s, side="right") - 1
+            out.append(datas[i][s - starts[i] : e - starts[i]])
+        return out
+
+
+def _merge(ranges):
+    # coalesce sorted byte ranges that touch or overlap
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(r) for r in merged]
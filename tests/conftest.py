@@ -0,0 +1,63 @@
+import pytest
+from fsspec.asyn import AsyncFileSystem
+
+from src.fsspec.mapping.mapper import AsyncFSMap
+
+
+class DictFileSystem(AsyncFileSystem):
+    """An async filesystem over a dict of path to bytes"""
+
+    cachable = False
+    root_marker = ""
+
+    def __init__(self, data=None):
+        super().__init__(asynchronous=True)
+        self.data = {} if data is None else data
+
+    async def _cat_file(self, path, start=None, end=None, **kwargs):
+        path = self._strip_protocol(path)
+        if path not in self.data:
+            raise FileNotFoundError(path)
+        return self.data[path][start:end]
+
+    async def _pipe_file(self, path, value, **kwargs):
+        self.data[self._strip_protocol(path)] = bytes(value)
+
+    async def _info(self, path, **kwargs):
+        path = self._strip_protocol(path)
+        if path in self.data:
+            return {"name": path, "size": len(self.data[path]), "type": "file"}
+        if any(k.startswith(path + "/") for k in self.data):
+            return {"name": path, "size": 0, "type": "directory"}
+        raise FileNotFoundError(path)
+
+    async def _ls(self, path, detail=True, **kwargs):
+        path = self._strip_protocol(path).rstrip("/")
+        out = {}
+        for key in self.data:
+            if key.startswith(path + "/"):
+                rest = key[len(path) + 1 :]
+                name = path + "/" + rest.split("/")[0]
+                kind = "directory" if "/" in rest else "file"
+                out[name] = {"name": name, "size": 0, "type": kind}
+        return list(out.values()) if detail else list(out)
+
+    async def _rm_file(self, path, **kwargs):
+        self.data.pop(self._strip_protocol(path), None)
+
+    async def _makedirs(self, path, exist_ok=False):
+        pass
+
+    async def _mkdir(self, path, create_parents=True, **kwargs):
+        pass
+
+
+@pytest.fixture
+def make_store():
+    """Return a function making an ``AsyncFSMap`` at ``root`` over a new
+    ``DictFileSystem``, holding ``data`` if given"""
+
+    def make(data=None):
+        return AsyncFSMap("root", DictFileSystem(data))
+
+    return make
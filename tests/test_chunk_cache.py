@@ -0,0 +1,31 @@
+import asyncio
+
+import numpy as np
+import xarray as xr
+
+from src.xarray.backends.api import to_zarr
+from src.xarray.backends.zarr import AsyncZarrBackendEntrypint
+from src.zarr.storage import LRUChunkCache
+
+
+def test_stores_sharing_a_cache(make_store):
+    # two filesystems, each with a store at the same root
+    first = xr.Dataset({"t2m": (("time", "lat"), np.zeros((4, 10), "f4"))})
+    second = xr.Dataset({"t2m": (("time", "lat"), np.ones((4, 10), "f4"))})
+    cache = LRUChunkCache(max_size=2**20)
+    stores = [make_store(), make_store()]
+
+    async def run():
+        results = []
+        for ds, store in zip((first, second), stores):
+            await to_zarr(ds, store, encoding={"t2m": {"chunks": (2, 10)}})
+            opened = await AsyncZarrBackendEntrypint().open_dataset(
+                store, chunk_cache=cache
+            )
+            results.append(await opened._isel(time=slice(None)))
+        return results
+
+    got_first, got_second = asyncio.run(run())
+    np.testing.assert_array_equal(got_first.t2m.values, first.t2m.values)
+    np.testing.assert_array_equal(got_second.t2m.values, second.t2m.values)
+    assert cache.hits == 0 and len(cache) == 4
@@ -0,0 +1,31 @@
+import asyncio
+
+import numpy as np
+import xarray as xr
+
+from src.xarray.backends.api import to_zarr
+from src.xarray.backends.zarr import AsyncZarrBackendEntrypint
+
+
+def test_append_along_datetime(make_store):
+    times = np.datetime64("2000-01-01T00") + np.arange(28).astype("m8[h]")
+    values = np.random.default_rng(0).random((28, 10)).astype("f4")
+    full = xr.Dataset(
+        {"t2m": (("time", "lat"), values)},
+        coords={"time": times, "lat": np.arange(10.0)},
+    )
+    encoding = {
+        "time": {"units": "hours since 2000-01-01 00:00:00"},
+        "t2m": {"chunks": (5, 10)},
+    }
+
+    async def run():
+        store = make_store()
+        await to_zarr(full.isel(time=slice(0, 24)), store, encoding=encoding)
+        await to_zarr(full.isel(time=slice(24, None)), store, append_dim="time")
+        ds = await AsyncZarrBackendEntrypint().open_dataset(store)
+        return await ds._isel(time=slice(None))
+
+    result = asyncio.run(run())
+    np.testing.assert_array_equal(result.time.values, times)
+    np.testing.assert_array_equal(result.t2m.values, values)
@@ -0,0 +1,24 @@
+import asyncio
+import gc
+
+import pytest
+
+from src.zarr.util import cancelling_gather
+
+
+def test_gather_retrieves_every_error():
+    async def fail(message):
+        await asyncio.sleep(0)
+        raise ValueError(message)
+
+    async def run():
+        unhandled = []
+        loop = asyncio.get_running_loop()
+        loop.set_exception_handler(lambda loop, context: unhandled.append(context))
+        with pytest.raises(ValueError, match="first"):
+            await cancelling_gather(fail("first"), fail("second"), fail("third"))
+        # tasks log errors never retrieved when they are collected
+        gc.collect()
+        return unhandled
+
+    assert asyncio.run(run()) == []
@@ -0,0 +1,33 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from src.xarray.backends.api import to_zarr
+from src.xarray.backends.zarr import AsyncZarrBackendEntrypint
+from src.xarray.backends.zindex import write_coordinate_index
+
+
+def test_nearest_on_integer_coordinate(make_store):
+    lon = np.arange(60)
+    ds = xr.Dataset({"t2m": (("lon",), np.arange(60.0))}, coords={"lon": lon})
+    labels = np.array([-3.2, 0.4, 0.5, 0.7, 10.6, 31.5, 58.9, 75.0])
+    expected = pd.Index(lon).get_indexer(labels, method="nearest")
+
+    async def run():
+        store = make_store()
+        await to_zarr(ds, store)
+        await write_coordinate_index(store)
+        opened = await AsyncZarrBackendEntrypint().open_dataset(
+            store, coordinate_index=True
+        )
+        # resolved by the sidecar, not by the pandas index
+        assert opened._coordinate_index.isel_indexers(opened, {"lon": labels})
+        points = [await opened._sel(lon=label, method="nearest") for label in labels]
+        vector = await opened._sel(lon=labels, method="nearest")
+        return points, vector
+
+    points, vector = asyncio.run(run())
+    np.testing.assert_array_equal([int(p.lon) for p in points], lon[expected])
+    np.testing.assert_array_equal(vector.lon.values, lon[expected])